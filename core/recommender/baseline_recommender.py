@@ -1,8 +1,21 @@
-import sqlite3
+import os
+import time
 import json
-
+import base64
+import hashlib
 import sqlite3
-import json
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from db.user_profile import file_version, get_user_profile
+from utils.catalog import get_catalog
+from utils.db import media_type_filter
+from utils.quality import top_k_indices
+
+# How long (seconds) a computed ranking is kept to serve the next pages of /recommendations.
+RANKING_CACHE_TTL = float(os.environ.get("RANKING_CACHE_TTL") or 300)
 
 def transform_rating(score):
     if score < 7:
@@ -13,6 +26,7 @@ def get_user_preferences(personal_db_path="anilist_data.db"):
     """
     Extracts user preferences by reading completed shows (with ratings) from the personal database.
     Builds a weighted dictionary based on genres and tags, with ratings transformed to emphasize good shows.
+    The API reads the same weights from the trigger-maintained profile (db/user_profile.py) instead.
     """
     conn = sqlite3.connect(personal_db_path)
     cursor = conn.cursor()
@@ -51,12 +65,14 @@ def get_user_preferences(personal_db_path="anilist_data.db"):
 def get_global_media(global_db_path="anilist_global.db"):
     """
     Reads the global media data from the global database and returns a list of media items.
+    Only anime are read, as personal lists hold anime only.
     """
     conn = sqlite3.connect(global_db_path)
     cursor = conn.cursor()
-    query = """
+    query = f"""
         SELECT id, title_romaji, title_english, title_native, genres, tags
         FROM global_media
+        {media_type_filter(conn, ("ANIME",))}
     """
     cursor.execute(query)
     results = cursor.fetchall()
@@ -102,6 +118,14 @@ def get_user_watched_media_ids(personal_db_path="anilist_data.db"):
     watched_ids = {row[0] for row in results}
     return watched_ids
 
+def tag_name_and_rank(tag):
+    """
+    Returns (name, rank) for a tag stored either as a dict or as a plain name.
+    """
+    if isinstance(tag, dict):
+        return tag.get("name", ""), tag.get("rank", 1)  # Default to 1 if no rank is provided.
+    return tag, 1
+
 def compute_similarity(media, preference):
     """
     Computes a similarity score between a media item and the user's preferences.
@@ -120,12 +144,7 @@ def compute_similarity(media, preference):
     
     # Process each tag, handling both dictionary and string representations.
     for tag in media.get("tags", []):
-        if isinstance(tag, dict):
-            tag_name = tag.get("name", "")
-            tag_rank = tag.get("rank", 1)  # Default to 1 if no rank is provided.
-        else:
-            tag_name = tag
-            tag_rank = 1
+        tag_name, tag_rank = tag_name_and_rank(tag)
         if tag_name in preference:
             # Now, give a boost based on tag rank:
             # For example, a tag with rank 100 contributes 2x its base weight.
@@ -141,59 +160,322 @@ def compute_similarity(media, preference):
 
     return score
 
-def recommend_top_media(top_n=10, desired_genre=None):
+EMPTY_ROWS = np.zeros(0, dtype=np.int64)
+
+def inverted_index(columns: list, indptr: list, names: list, n_rows: int) -> dict:
+    """
+    Maps each lowercase feature name to the sorted rows whose (columns, indptr) CSR row lists it.
+    """
+    flags = csr_matrix((np.ones(len(columns), dtype=np.int8), np.array(columns, dtype=np.int32), indptr), shape=(n_rows, len(names)))
+    by_column = flags.tocsc()
+    index = {}
+    for column, name in enumerate(names):
+        rows = by_column.indices[by_column.indptr[column]:by_column.indptr[column + 1]]
+        if len(rows):
+            key = name.lower()
+            index[key] = np.union1d(index[key], rows) if key in index else np.unique(rows).astype(np.int64)
+    return index
+
+class MediaMatrix:
+    """
+    The catalog compiled for scoring. Each media item is one row of a CSR item x feature
+    matrix over the genre/tag vocabulary: 1.0 for a genre and 1 + rank / 100 for a tag, so a
+    preference vector scores every item in one sparse mat-vec. Entries keep the order in which
+    compute_similarity adds them, which keeps the scores bit-for-bit identical to it.
+    """
+
+    def __init__(self, media_list: list, version: str = ""):
+        self.media = media_list
+        self.version = version  # identifies the catalog data the matrix was compiled from
+        self.vocabulary = {}
+        self.ids = np.array([media["id"] for media in media_list], dtype=np.int64)
+
+        data, columns, indptr = [], [], [0]
+        genre_columns, genre_indptr = [], [0]
+        tag_columns, tag_indptr = [], [0]
+        for media in media_list:
+            for genre in media.get("genres", []):
+                column = self.vocabulary.setdefault(genre, len(self.vocabulary))
+                columns.append(column)
+                data.append(1.0)
+                genre_columns.append(column)
+            for tag in media.get("tags", []):
+                tag_name, tag_rank = tag_name_and_rank(tag)
+                column = self.vocabulary.setdefault(tag_name, len(self.vocabulary))
+                columns.append(column)
+                data.append(1 + tag_rank / 100.0)
+                tag_columns.append(column)
+            indptr.append(len(columns))
+            genre_indptr.append(len(genre_columns))
+            tag_indptr.append(len(tag_columns))
+
+        shape = (len(media_list), len(self.vocabulary))
+        self.features = csr_matrix((np.array(data, dtype=np.float64), np.array(columns, dtype=np.int32), indptr), shape=shape)
+        # Inverted indexes from lowercase genre / tag name to the rows carrying it, for desired_genre filters.
+        names = list(self.vocabulary)
+        self.genre_rows = inverted_index(genre_columns, genre_indptr, names, len(media_list))
+        self.tag_rows = inverted_index(tag_columns, tag_indptr, names, len(media_list))
+        self.base_scores = (
+            np.array([media.get("average_score") or 0 for media in media_list], dtype=np.float64) * 0.1,
+            np.array([media.get("popularity") or 0 for media in media_list], dtype=np.float64) / 1000000.0,
+        )
+
+    def preference_vector(self, preference: dict) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for name, weight in preference.items():
+            column = self.vocabulary.get(name)
+            if column is not None:
+                vector[column] = weight
+        return vector
+
+    def scores(self, preference: dict) -> np.ndarray:
+        """
+        compute_similarity for every item at once.
+        """
+        average_term, popularity_term = self.base_scores
+        scores = self.features @ self.preference_vector(preference)
+        scores += average_term
+        scores += popularity_term
+        return scores
+
+    def batch_scores(self, preferences: list) -> np.ndarray:
+        """
+        scores() for several users in one sparse x dense product: an (items x users) array whose
+        column j equals scores(preferences[j]) exactly.
+        """
+        average_term, popularity_term = self.base_scores
+        vectors = np.stack([self.preference_vector(p) for p in preferences], axis=1) if preferences else np.zeros((len(self.vocabulary), 0))
+        scores = self.features @ vectors
+        scores += average_term[:, None]
+        scores += popularity_term[:, None]
+        return scores
+
+    def feature_masks(self, name: str):
+        """
+        Returns (in_genres, in_tags): bitmaps of the items having name, in any case, as a genre and as a tag.
+        """
+        name = name.lower()
+        masks = []
+        for index in (self.genre_rows, self.tag_rows):
+            mask = np.zeros(len(self.media), dtype=bool)
+            mask[index.get(name, EMPTY_ROWS)] = True
+            masks.append(mask)
+        return tuple(masks)
+
+class Ranking:
+    """
+    The scored, eligible items of one recommendation request. Items are ordered by score,
+    highest first, with ties in catalog order. Pages are cut from it with top-k selection, so
+    the full list is never sorted.
+    """
+
+    def __init__(self, matrix: MediaMatrix, rows: np.ndarray, scores: np.ndarray, version: str = ""):
+        self.matrix = matrix
+        self.rows = rows        # eligible catalog rows, ascending
+        self.scores = scores    # their scores
+        self.version = version
+
+    @property
+    def top_score(self):
+        return float(self.scores.max()) if len(self.scores) else None
+
+    def select(self, top_n: int, after: tuple = None):
+        """
+        Returns (rows, scores, more): the catalog rows and scores of the top_n items ranked after
+        the (score, row) of the previous page's last item (or from the start without one), and
+        whether more items follow them.
+        """
+        positions = np.arange(len(self.rows))
+        if after is not None:
+            last_score, last_row = after
+            positions = np.flatnonzero((self.scores < last_score) | ((self.scores == last_score) & (self.rows > last_row)))
+        # Same top-k selection as /query's quality ranking: argpartition, then sort only the top_n.
+        top = positions[top_k_indices(self.scores[positions], top_n)]
+        return self.rows[top], self.scores[top], len(positions) > len(top)
+
+    def page(self, top_n: int, after: tuple = None):
+        """
+        Returns ([(media, score)], next_after) for select(top_n, after). next_after is the
+        (score, row) to continue from, or None on the last page.
+        """
+        rows, scores, more = self.select(top_n, after)
+        items = [(self.matrix.media[row], float(score)) for row, score in zip(rows, scores)]
+        next_after = (float(scores[-1]), int(rows[-1])) if more and len(rows) else None
+        return items, next_after
+
+GENRE_MATCHES = ("any", "all")
+
+def genre_filter(desired_genre=None, genre_match="any"):
+    """
+    Normalizes a desired_genre (one name or a list of names) and match mode into a hashable
+    (names, match) key, or None without names. Names are compared ignoring case.
+    """
+    if genre_match not in GENRE_MATCHES:
+        raise ValueError(f"Unknown genre match '{genre_match}'; choose one of {', '.join(GENRE_MATCHES)}")
+    if isinstance(desired_genre, str):
+        desired_genre = [desired_genre]
+    names = tuple(sorted({name.lower() for name in desired_genre or [] if name}))
+    if not names:
+        return None
+    return names, genre_match if len(names) > 1 else "any"
+
+def score_media(matrix: MediaMatrix, preference: dict, desired_genre=None, planned_ids=(), watched_ids=(), version: str = "", genre_match="any") -> Ranking:
+    """
+    Scores every media item in matrix and returns the eligible ones as a Ranking.
+    Media the user has already engaged with (other than planned) is skipped. If a desired_genre
+    is provided, only items that include it as a genre or tag are kept and their score is boosted.
+    desired_genre may also be a list, matched with genre_match "any" (OR) or "all" (AND); the
+    boost then applies if any of the names is a genre (or else a tag) of the item.
+    Planned items are boosted further.
+    """
+    return rank_scores(matrix, matrix.scores(preference), desired_genre, planned_ids, watched_ids, version, genre_match)
+
+def rank_scores(matrix: MediaMatrix, scores: np.ndarray, desired_genre=None, planned_ids=(), watched_ids=(), version: str = "", genre_match="any") -> Ranking:
+    """
+    score_media for scores already computed by MediaMatrix.scores or batch_scores.
+    """
+    keep = ~np.isin(matrix.ids, list(watched_ids))
+
+    key = genre_filter(desired_genre, genre_match)
+    if key:
+        names, match = key
+        n = len(matrix.media)
+        in_genres, in_tags = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+        matched = np.ones(n, dtype=bool) if match == "all" else np.zeros(n, dtype=bool)
+        for name in names:
+            has_genre, has_tag = matrix.feature_masks(name)
+            in_genres |= has_genre
+            in_tags |= has_tag
+            if match == "all":
+                matched &= has_genre | has_tag
+            else:
+                matched |= has_genre | has_tag
+        keep &= matched
+        scores = np.where(in_genres, scores * 1.2, np.where(in_tags, scores * 1.1, scores))
+
+    # Additional boost for planned shows.
+    scores = np.where(np.isin(matrix.ids, list(planned_ids)), scores * 1.5, scores)
+
+    rows = np.flatnonzero(keep)
+    return Ranking(matrix, rows, scores[rows], version)
+
+def rank_media(matrix: MediaMatrix, preference: dict, top_n=10, desired_genre=None, planned_ids=(), watched_ids=(), genre_match="any"):
+    """
+    Returns the top N (media, score) pairs of score_media.
+    """
+    return score_media(matrix, preference, desired_genre, planned_ids, watched_ids, genre_match=genre_match).page(top_n)[0]
+
+def get_media_matrix() -> MediaMatrix:
+    """
+    Returns the MediaMatrix of the current catalog snapshot (see utils.catalog), compiled once per snapshot.
+    """
+    return get_catalog().derived("media_matrix", lambda catalog: MediaMatrix(catalog.media, catalog.version))
+
+def data_version(matrix: MediaMatrix, personal_db_path="anilist_data.db") -> str:
+    """
+    Identifies the data a ranking is computed from: the compiled catalog and the personal list.
+    """
+    key = f"{matrix.version}|{personal_db_path}|{file_version(personal_db_path)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+class RankingCache:
+    """
+    Short-lived rankings keyed by (data version, genre_filter key), so the later pages of
+    /recommendations are cut from the ranking computed for the first page instead of rescoring.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 32):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (ranking, stored_at)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, version: str, filter_key, compute) -> Ranking:
+        key = (version, filter_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        ranking = compute()
+        with self._lock:
+            self._entries[key] = (ranking, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ranking
+
+ranking_cache = RankingCache(RANKING_CACHE_TTL)
+
+def get_ranking(desired_genre=None, genre_match="any", personal_db_path="anilist_data.db") -> Ranking:
+    """
+    Returns the current Ranking for desired_genre, from ranking_cache while the data is unchanged.
+    The user profile is kept up to date by triggers in the personal database (see db/user_profile.py),
+    so a rescore reads a few small tables instead of the whole list.
+    """
+    matrix = get_media_matrix()
+    profile = get_user_profile(personal_db_path)
+    version = data_version(matrix, personal_db_path)
+    return ranking_cache.get_or_compute(version, genre_filter(desired_genre, genre_match), lambda: score_media(
+        matrix,
+        profile.preference,
+        desired_genre=desired_genre,
+        planned_ids=profile.planned_ids,
+        watched_ids=profile.watched_ids,
+        version=version,
+        genre_match=genre_match,
+    ))
+
+def encode_cursor(version: str, filter_key, after: tuple, user: str = None) -> str:
+    """
+    Opaque cursor for the page after (score, row) of the ranking with the given data version,
+    genre_filter key and user.
+    """
+    score, row = after
+    payload = json.dumps({"v": version, "g": filter_key, "u": user, "s": score, "r": row}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Returns {"version", "genre_filter", "user", "after"} for a cursor; raises ValueError if it is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        names_and_match = payload["g"]
+        key = (tuple(names_and_match[0]), str(names_and_match[1])) if names_and_match else None
+        return {
+            "version": str(payload["v"]),
+            "genre_filter": key,
+            "user": payload.get("u"),
+            "after": (float(payload["s"]), int(payload["r"])),
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Malformed cursor") from e
+
+def recommend_top_media(top_n=10, desired_genre=None, genre_match="any"):
     """
     Computes and returns the top N recommendations based on similarity scores.
     If a desired_genre is provided, only media items that actually include that genre (or tag)
-    are considered, and their similarity score is boosted.
+    are considered, and their similarity score is boosted. A list of genres is combined with
+    genre_match "any" or "all".
     Additionally, if a media item is in the user's planned list, its score is boosted.
     """
-    preference = get_user_preferences()
-    global_media = get_global_media()
-    planned_ids = get_user_planned_media_ids()
-    watched_ids = get_user_watched_media_ids()
-    
-    recommendations = []
-    for media in global_media:
-        # Skip media that the user has already engaged with (excluding planned)
-        if media["id"] in watched_ids:
-            continue
-
-        # If a desired genre is provided, filter out media that don't include it
-        if desired_genre:
-            genres_lower = [g.lower() for g in media["genres"]]
-            tags_lower = [tag.get("name", "").lower() if isinstance(tag, dict) else tag.lower() for tag in media["tags"]]
-            if desired_genre.lower() not in genres_lower and desired_genre.lower() not in tags_lower:
-                continue
-
-        sim = compute_similarity(media, preference)
-        
-        # If a desired genre is provided and found, apply a boost
-        if desired_genre:
-            genres_lower = [g.lower() for g in media["genres"]]
-            tags_lower = [tag.get("name", "").lower() if isinstance(tag, dict) else tag.lower() for tag in media["tags"]]
-            if desired_genre.lower() in genres_lower:
-                sim *= 1.2  # boost factor for genres
-            elif desired_genre.lower() in tags_lower:
-                sim *= 1.1  # slightly smaller boost for tags
-        
-        # If the media is in the planned list, boost it further
-        if media["id"] in planned_ids:
-            sim *= 1.5  # additional boost for planned shows
-        
-        recommendations.append((media, sim))
-    
-    recommendations.sort(key=lambda x: x[1], reverse=True)
-    return recommendations[:top_n]
+    return get_ranking(desired_genre, genre_match).page(top_n)[0]
 
-def normalize_recommendations(recommendations):
+def normalize_recommendations(recommendations, max_score=None):
     """
-    Normalizes the raw similarity scores so that the highest score is mapped to 100%.
+    Normalizes the raw similarity scores so that the highest score (or max_score, the top of
+    the whole ranking when normalizing a later page) is mapped to 100%.
     """
     if not recommendations:
         return []
     
-    max_score = max(score for _, score in recommendations)
+    if max_score is None:
+        max_score = max(score for _, score in recommendations)
     normalized = []
     for media, score in recommendations:
         confidence = (score / max_score) * 100  # Scale to percentage
@@ -0,0 +1,144 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+
+from core.recommender.baseline_recommender import MediaMatrix, rank_scores
+from db.user_profile import ensure_profile, file_version, load_profile
+from db.users import list_users, user_db_path
+from utils.catalog import CATALOG_DB_PATH, CatalogCache
+
+# Where the nightly job stores every user's top-N, served by /recommendations?user= while fresh.
+PRECOMPUTED_DB = os.environ.get("PRECOMPUTED_RECOMMENDATIONS_DB") or "precomputed_recommendations.db"
+
+def init_precomputed_db(db_path: str = PRECOMPUTED_DB):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS precomputed_runs (
+            user TEXT PRIMARY KEY,
+            catalog_version TEXT,
+            personal_version TEXT,
+            eligible INTEGER,
+            computed_at REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS precomputed_recommendations (
+            user TEXT,
+            rank INTEGER,
+            media_id INTEGER,
+            row INTEGER,
+            score REAL,
+            PRIMARY KEY (user, rank)
+        )
+    """)
+    conn.commit()
+    return conn
+
+def batch_rankings(matrix: MediaMatrix, profiles: list, batch_size: int = 64):
+    """
+    Yields the Ranking of each profile, in order. Users are scored batch_size at a time with
+    one sparse x dense product (MediaMatrix.batch_scores), which gives exactly the scores of
+    scoring them one by one.
+    """
+    for start in range(0, len(profiles), batch_size):
+        chunk = profiles[start:start + batch_size]
+        scores = matrix.batch_scores([profile.preference for profile in chunk])
+        for j, profile in enumerate(chunk):
+            yield rank_scores(matrix, scores[:, j].copy(), planned_ids=profile.planned_ids, watched_ids=profile.watched_ids)
+
+def store_top_n(conn, user: str, ranking, top_n: int, catalog_version: str, personal_version: str):
+    """
+    Replaces user's stored top-N with the best top_n items of ranking.
+    """
+    rows, scores, _ = ranking.select(top_n)
+    conn.execute("DELETE FROM precomputed_recommendations WHERE user = ?", (user,))
+    conn.executemany(
+        "INSERT INTO precomputed_recommendations (user, rank, media_id, row, score) VALUES (?, ?, ?, ?, ?)",
+        [
+            (user, rank, int(ranking.matrix.ids[row]), int(row), float(score))
+            for rank, (row, score) in enumerate(zip(rows, scores), start=1)
+        ]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO precomputed_runs (user, catalog_version, personal_version, eligible, computed_at) VALUES (?, ?, ?, ?, ?)",
+        (user, catalog_version, personal_version, len(ranking.rows), time.time())
+    )
+
+def load_precomputed(user: str, personal_db_path: str, top_n: int, catalog_db_path: str = CATALOG_DB_PATH, db_path: str = PRECOMPUTED_DB):
+    """
+    Returns ([(media_id, row, score)], eligible) for the first top_n recommendations of user if
+    they were precomputed from the current catalog and personal list, or None.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        run = conn.execute(
+            "SELECT catalog_version, personal_version, eligible FROM precomputed_runs WHERE user = ?", (user,)
+        ).fetchone()
+        if run is None or run[0] != file_version(catalog_db_path) or run[1] != file_version(personal_db_path):
+            return None
+        items = conn.execute(
+            "SELECT media_id, row, score FROM precomputed_recommendations WHERE user = ? ORDER BY rank LIMIT ?",
+            (user, top_n)
+        ).fetchall()
+    finally:
+        conn.close()
+    if len(items) < min(top_n, run[2]):
+        return None  # precomputed with a smaller top-N
+    return items, run[2]
+
+def precompute(users: list, top_n: int = 100, batch_size: int = 64, catalog_db_path: str = CATALOG_DB_PATH,
+               data_dir: str = None, db_path: str = PRECOMPUTED_DB) -> int:
+    """
+    Scores every user against the catalog and stores their top_n. Returns the number of users.
+    """
+    catalog_version = file_version(catalog_db_path)  # taken first, so a concurrent write makes the results stale
+    start = time.perf_counter()
+    matrix = MediaMatrix(CatalogCache(catalog_db_path, interval_seconds=0).get().media)
+    logging.info(f"Compiled {len(matrix.media)} catalog items in {time.perf_counter() - start:.1f}s.")
+
+    paths = [user_db_path(user, data_dir) for user in users]
+    for path in paths:
+        ensure_profile(path)  # first use changes the file; do it before taking the versions
+    # Taken before the reads, so a list changed while it is read makes its results stale.
+    personal_versions = [file_version(path) for path in paths]
+    profiles = [load_profile(path) for path in paths]
+
+    start = time.perf_counter()
+    conn = init_precomputed_db(db_path)
+    try:
+        for user, personal_version, ranking in zip(users, personal_versions, batch_rankings(matrix, profiles, batch_size)):
+            store_top_n(conn, user.lower(), ranking, top_n, catalog_version, personal_version)
+        conn.commit()
+    finally:
+        conn.close()
+    logging.info(f"Scored and stored the top {top_n} for {len(users)} users in {time.perf_counter() - start:.1f}s.")
+    return len(users)
+
+def main():
+    # Configured here rather than at import: /recommendations imports load_precomputed.
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()]
+    )
+    parser = argparse.ArgumentParser(description="Precompute every user's top-N recommendations.")
+    parser.add_argument("--users", nargs="+", help="Users to score (default: every database in USER_DATA_DIR)")
+    parser.add_argument("--data-dir", help="Directory of per-user databases (default: USER_DATA_DIR)")
+    parser.add_argument("--top-n", type=int, default=100, help="Recommendations stored per user")
+    parser.add_argument("--batch-size", type=int, default=64, help="Users scored per matrix product")
+    parser.add_argument("--db", default=CATALOG_DB_PATH, help="Global catalog database")
+    parser.add_argument("--output", default=PRECOMPUTED_DB, help="Database the results are written to")
+    args = parser.parse_args()
+
+    users = args.users or list_users(args.data_dir)
+    if not users:
+        logging.warning("No users to score.")
+        return
+    precompute(users, args.top_n, args.batch_size, args.db, args.data_dir, args.output)
+
+if __name__ == "__main__":
+    main()
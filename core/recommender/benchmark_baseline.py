@@ -0,0 +1,77 @@
+import time
+import argparse
+import numpy as np
+
+from core.recommender.baseline_recommender import MediaMatrix, compute_similarity, get_global_media, get_user_preferences
+
+def synthetic_catalog(items: int, genres: int = 20, tags: int = 400, seed: int = 0) -> list:
+    """
+    A random catalog shaped like global_media: a few genres and a dozen ranked tags per item.
+    """
+    rng = np.random.default_rng(seed)
+    catalog = []
+    for i in range(items):
+        catalog.append({
+            "id": i + 1,
+            "genres": [f"Genre {g}" for g in rng.choice(genres, int(rng.integers(1, 5)), replace=False)],
+            "tags": [{"name": f"Tag {t}", "rank": int(rng.integers(1, 101))}
+                     for t in rng.choice(tags, int(rng.integers(0, 16)), replace=False)],
+            "average_score": int(rng.integers(30, 95)),
+            "popularity": int(rng.integers(0, 1_000_000)),
+        })
+    return catalog
+
+def synthetic_preferences(genres: int = 20, tags: int = 400, seed: int = 1) -> dict:
+    rng = np.random.default_rng(seed)
+    preference = {f"Genre {g}": int(rng.integers(0, 40)) for g in range(genres)}
+    preference.update({f"Tag {t}": int(rng.integers(0, 40)) for t in rng.choice(tags, tags // 2, replace=False)})
+    return preference
+
+def run_benchmark(catalog: list, preference: dict, repeats: int = 3) -> dict:
+    """
+    Times scoring every item with compute_similarity against MediaMatrix.scores and checks
+    that both give identical scores. Returns a result dict (times in ms).
+    """
+    start = time.perf_counter()
+    matrix = MediaMatrix(catalog)
+    build_ms = (time.perf_counter() - start) * 1000.0
+
+    loop_ms, matrix_ms = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        expected = np.array([compute_similarity(media, preference) for media in catalog], dtype=np.float64)
+        loop_ms.append((time.perf_counter() - start) * 1000.0)
+        start = time.perf_counter()
+        scores = matrix.scores(preference)
+        matrix_ms.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        "items": len(catalog),
+        "features": len(matrix.vocabulary),
+        "nnz": int(matrix.features.nnz),
+        "build_ms": build_ms,
+        "loop_ms": float(np.median(loop_ms)),
+        "matrix_ms": float(np.median(matrix_ms)),
+        "identical": bool(np.array_equal(scores, expected)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-item scoring loop with sparse mat-vec scoring.")
+    parser.add_argument("--items", type=int, default=100_000, help="Size of the synthetic catalog")
+    parser.add_argument("--real", action="store_true", help="Score anilist_global.db with the anilist_data.db preferences instead")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes (the median is reported)")
+    args = parser.parse_args()
+
+    if args.real:
+        catalog, preference = get_global_media(), get_user_preferences()
+    else:
+        catalog, preference = synthetic_catalog(args.items), synthetic_preferences()
+
+    r = run_benchmark(catalog, preference, args.repeats)
+    print(f"{r['items']} items, {r['features']} features, {r['nnz']} non-zeros; matrix built in {r['build_ms']:.0f} ms")
+    print(f"{'compute_similarity loop':<24} {r['loop_ms']:>9.1f} ms")
+    print(f"{'sparse mat-vec':<24} {r['matrix_ms']:>9.1f} ms  ({r['loop_ms'] / max(r['matrix_ms'], 1e-9):.0f}x)")
+    print(f"Scores identical: {r['identical']}")
+
+if __name__ == "__main__":
+    main()
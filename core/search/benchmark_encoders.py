@@ -0,0 +1,120 @@
+import os
+import time
+import argparse
+import numpy as np
+import faiss
+
+from utils.artifacts import ARTIFACT_DIR, has_artifacts, load_ids, load_manifest
+from utils.encoders import ENCODERS, load_encoder
+from utils.shards import is_id_mapped, labels_to_ids
+from utils.versions import INDEX_FILE, current_path
+
+DEFAULT_ENCODERS = ["mpnet", "mpnet-int8", "mpnet-onnx"]
+
+# Typical /query inputs, used when no --queries-file is given.
+DEFAULT_QUERIES = [
+    "dark fantasy with a tragic hero",
+    "wholesome slice of life about cooking",
+    "mecha anime with political intrigue",
+    "romantic comedy set in high school",
+    "psychological thriller with mind games",
+    "isekai where the protagonist is overpowered",
+    "sports anime about volleyball",
+    "space opera with a found family crew",
+    "horror manga with body horror",
+    "time travel mystery",
+    "post-apocalyptic survival story",
+    "magical girl deconstruction",
+    "detective series with a genius lead",
+    "historical drama in feudal Japan",
+    "music anime about a band",
+    "cyberpunk action with hackers",
+]
+
+def time_encoder(model, queries, repeats: int = 3):
+    """
+    Encodes one query at a time (as /query does) and returns (embeddings, p50 ms, p99 ms).
+    The first pass is a warm-up and is not timed.
+    """
+    embeddings = np.stack([model.encode(q, convert_to_numpy=True).astype("float32") for q in queries])
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            model.encode(q, convert_to_numpy=True)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+    return embeddings, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+def overlap_at_k(labels: np.ndarray, reference: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(r[:k])) for a, r in zip(labels, reference))
+    return hits / float(reference.shape[0] * k)
+
+def load_index(artifact_dir: str):
+    """
+    Returns (index, ids, manifest) for the index stored with the artifacts, or None if there is none.
+    """
+    index_path = os.path.join(artifact_dir, INDEX_FILE)
+    if not (has_artifacts(artifact_dir) and os.path.exists(index_path)):
+        return None
+    return faiss.read_index(index_path), load_ids(artifact_dir), load_manifest(artifact_dir)
+
+def run_benchmark(encoders, queries, k=50, artifact_dir=None, repeats=3):
+    """
+    Loads each encoder and measures per-query encode latency. When artifact_dir holds an
+    index, also searches it with every encoder of the index's model and reports top-k
+    overlap with the first such encoder, i.e. how much a faster backend changes results.
+    Returns a list of result dicts.
+    """
+    built = load_index(artifact_dir) if artifact_dir else None
+    reference = None
+    results = []
+    for name in encoders:
+        spec = ENCODERS[name]
+        try:
+            start = time.perf_counter()
+            model = load_encoder(name)
+            load_seconds = time.perf_counter() - start
+        except (ImportError, OSError, RuntimeError) as e:
+            print(f"Skipping {name}: {e}")
+            continue
+
+        embeddings, p50, p99 = time_encoder(model, queries, repeats)
+        result = {"encoder": name, "backend": spec.backend, "load_s": load_seconds, "p50_ms": p50, "p99_ms": p99, "overlap": None}
+        if built is not None and built[2].get("model") == spec.model:
+            index, ids, manifest = built
+            _, labels = index.search(embeddings, k)
+            labels = labels_to_ids(labels, ids, is_id_mapped(manifest))
+            if reference is None:
+                reference = labels
+            result["overlap"] = overlap_at_k(labels, reference, k)
+        results.append(result)
+    return results
+
+def print_results(results, k):
+    print(f"{'encoder':<14} {'backend':<8} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'overlap@' + str(k):>11}")
+    for r in results:
+        overlap = f"{r['overlap']:>11.4f}" if r["overlap"] is not None else f"{'-':>11}"
+        print(f"{r['encoder']:<14} {r['backend']:<8} {r['load_s']:>7.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {overlap}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query-encoding latency and retrieval overlap of encoder backends.")
+    parser.add_argument("--encoders", nargs="+", default=DEFAULT_ENCODERS, choices=sorted(ENCODERS),
+                        help="Encoders to compare; overlap is measured against the first one matching the index's model")
+    parser.add_argument("--artifact-dir", default=current_path() or ARTIFACT_DIR,
+                        help="Index version to search for the overlap column (default: the published version)")
+    parser.add_argument("--queries-file", help="Text file with one query per line (default: built-in sample queries)")
+    parser.add_argument("-k", type=int, default=50, help="Neighbours per query (the /query candidate pool is top_n * 5)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the queries")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    print(f"Benchmarking {len(args.encoders)} encoders on {len(queries)} queries")
+    results = run_benchmark(args.encoders, queries, k=args.k, artifact_dir=args.artifact_dir, repeats=args.repeats)
+    print_results(results, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import time
+import argparse
+import numpy as np
+import faiss
+
+from utils.artifacts import ARTIFACT_DIR, load_artifacts
+from utils.versions import current_path
+from utils.retrieval import apply_search_params
+from utils.rescore import ExactRescorer
+from core.search.index_specs import build_index, index_size_bytes
+
+DEFAULT_SPECS = ["flat", "sqfp16", "sq8", "ivf-flat", "ivf-sq8", "ivf-pq", "hnsw"]
+
+def sample_queries(vectors: np.ndarray, num_queries: int, noise: float = 0.01, seed: int = 0) -> np.ndarray:
+    """
+    Uses perturbed copies of stored vectors as benchmark queries, so the benchmark
+    runs on the current embeddings without loading the encoder.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], min(num_queries, vectors.shape[0]), replace=False)
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    scale = noise * float(np.linalg.norm(queries, axis=1).mean())
+    return queries + rng.normal(0, scale / np.sqrt(queries.shape[1]), queries.shape).astype(np.float32)
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(e[:k])) for a, e in zip(approx, exact))
+    return hits / float(exact.shape[0] * k)
+
+def time_per_query(index, queries: np.ndarray, k: int, rescorer=None, rescore_k: int = 0):
+    """
+    Searches one query at a time (as /query does) and returns (labels, p50 ms, p99 ms).
+    With a rescorer, rescore_k candidates are fetched and re-ranked exactly before the top k are kept.
+    """
+    latencies = []
+    labels = np.empty((queries.shape[0], k), dtype=np.int64)
+    for i in range(queries.shape[0]):
+        start = time.perf_counter()
+        if rescorer is None:
+            _, labels[i : i + 1] = index.search(queries[i : i + 1], k)
+        else:
+            _, candidates = index.search(queries[i : i + 1], max(k, rescore_k))
+            _, labels[i : i + 1] = rescorer.rescore(queries[i : i + 1], candidates, k)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return labels, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+def run_benchmark(vectors, specs, k=50, num_queries=500, nprobes=(1, 8, 32), ef_searches=(16, 64, 256), rescore=0, **index_params):
+    """
+    Builds each index spec over the vectors and measures recall@k against the exact
+    flat index plus per-query latency, sweeping the relevant search-time knob.
+    With rescore > 0, every approximate index is measured a second time with that many
+    candidates re-ranked by exact float32 distance (as FAISS_RESCORE does at query time).
+    Returns a list of result dicts; size_mb is the index's in-memory size and
+    compression its size relative to a float32 flat index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, num_queries)
+    flat_bytes = float(vectors.nbytes)
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    _, exact = exact_index.search(queries, k)
+
+    results = []
+    for spec in specs:
+        try:
+            index, factory, build_seconds = build_index(vectors, spec, **index_params)
+        except (ValueError, RuntimeError) as e:
+            print(f"Skipping {spec}: {e}")
+            continue
+
+        if faiss.try_extract_index_ivf(index) is not None:
+            sweeps = [{"nprobe": n} for n in nprobes]
+        elif hasattr(faiss.downcast_index(index), "hnsw"):
+            sweeps = [{"ef_search": ef} for ef in ef_searches]
+        else:
+            sweeps = [{}]
+
+        size_bytes = index_size_bytes(index)
+        rescorer = ExactRescorer(np.arange(vectors.shape[0]), vectors, index.metric_type) if rescore > 0 and factory != "Flat" else None
+        for params in sweeps:
+            apply_search_params(index, **params)
+            for rescore_k in ([0, rescore] if rescorer is not None else [0]):
+                labels, p50, p99 = time_per_query(index, queries, k, rescorer if rescore_k else None, rescore_k)
+                results.append({
+                    "index": factory,
+                    "params": dict(params, rescore=rescore_k) if rescore_k else params,
+                    "recall": recall_at_k(labels, exact, k),
+                    "p50_ms": p50,
+                    "p99_ms": p99,
+                    "build_s": build_seconds,
+                    "size_mb": size_bytes / (1024 * 1024),
+                    "compression": flat_bytes / size_bytes if size_bytes else 0.0,
+                })
+    return results
+
+def print_results(results, k):
+    print(f"{'index':<22} {'params':<26} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'size MB':>8} {'vs flat':>8}")
+    for r in results:
+        params = ",".join(f"{key}={value}" for key, value in r["params"].items()) or "-"
+        print(
+            f"{r['index']:<22} {params:<26} {r['recall']:>10.4f} {r['p50_ms']:>8.3f} "
+            f"{r['p99_ms']:>8.3f} {r['build_s']:>8.1f} {r['size_mb']:>8.1f} {r['compression']:>7.1f}x"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k and latency of FAISS index types on the current embeddings.")
+    parser.add_argument("--artifact-dir", default=current_path() or ARTIFACT_DIR,
+                        help="Embedding artifacts to benchmark (default: the published index version)")
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS,
+                        help="Preset names or FAISS index_factory strings to compare")
+    parser.add_argument("-k", type=int, default=50, help="Neighbours per query (the /query candidate pool is top_n * 5)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--M", type=int, dest="hnsw_m")
+    parser.add_argument("--rescore", type=int, default=0,
+                        help="Also measure each approximate index with this many candidates re-scored exactly")
+    args = parser.parse_args()
+
+    _, vectors, manifest = load_artifacts(args.artifact_dir)
+    print(f"Benchmarking {manifest['rows']} x {manifest['dim']} vectors ({manifest['model']})")
+    results = run_benchmark(vectors, args.specs, k=args.k, num_queries=args.queries, rescore=args.rescore, nlist=args.nlist, m=args.m, M=args.hnsw_m)
+    print_results(results, args.k)
+
+if __name__ == "__main__":
+    main()
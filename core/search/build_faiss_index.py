@@ -1,11 +1,20 @@
+import os
 import sqlite3
 import numpy as np
 import faiss
-import pickle
 import json
 import logging
+import argparse
 import faulthandler
-from sentence_transformers import SentenceTransformer
+
+from utils.db import media_type_filter
+from utils.artifacts import ARTIFACT_DIR, content_hash, has_artifacts, load_artifacts, load_hashes, write_artifacts
+from utils.shards import is_id_mapped
+from utils.encoders import ENCODER, ENCODERS, get_encoder_spec, load_encoder
+from utils.versions import INDEX_VERSIONS_DIR, INDEX_FILE, create_staging, current_path, new_version, publish_version
+from core.search.index_specs import INDEX_PRESETS, build_index, index_size_bytes, update_index
+from core.search.encoding import CHECKPOINT_DIR, encode_stream, encode_texts
+from core.search.pipeline import READ_CHUNK_SIZE, TextStream
 
 # Enable faulthandler for segmentation fault debugging.
 faulthandler.enable()
@@ -19,8 +28,8 @@ logging.basicConfig(
 
 # Database and file paths.
 DB_PATH = "anilist_global.db"
-EMBEDDINGS_FILE = "embeddings_cache.pkl"
-VECTOR_DB_PATH = "anime_vectors.index"
+VECTOR_DB_PATH = "anime_vectors.index"  # Unversioned output of older builds; read only.
+KEEP_VERSIONS = 3
 
 def extract_filtered_tags(tags_json, threshold=60):
     """
@@ -50,124 +59,313 @@ def extract_filtered_tags(tags_json, threshold=60):
         logging.warning(f"Error parsing tags: {e}")
         return ""
 
-def load_anime_data():
+# Columns read for each anime entry, in the order build_anime_text expects them.
+ANIME_QUERY = "SELECT id, title_english, title_romaji, title_native, genres, tags FROM global_media"
+
+def build_anime_text(row):
     """
-    Load anime data from the SQLite database.
+    Builds the embedding text for one global_media row.
 
-    For each record, we load:
+    For each record, we use:
       - id
       - a preferred title (using title_english if available, then title_romaji, then title_native)
       - genres (stored as JSON in the database) which we convert into a single string.
       - tags (stored as JSON in the database) which we filter by an importance threshold and convert into a string.
 
     Returns:
-      A list of tuples: (anime_id, text) where text is the combination of the title, genres, and filtered tags.
+      (anime_id, text) where text is the combination of the title, genres, and filtered tags.
     """
-    logging.info("Connecting to the database...")
+    anime_id = row[0]
+    title = row[1] or row[2] or row[3] or "Unknown Title"
+
     try:
-        conn = sqlite3.connect(DB_PATH)
+        genres_list = json.loads(row[4]) if row[4] else []
+        genres = " ".join(sorted(set(genres_list)))
     except Exception as e:
-        logging.error(f"Error connecting to database: {e}")
-        raise
+        logging.warning(f"Error parsing genres for anime_id {anime_id}: {e}")
+        genres = ""
 
-    cursor = conn.cursor()
-    # Updated query to also retrieve tags.
-    query = "SELECT id, title_english, title_romaji, title_native, genres, tags FROM global_media"
+    # Use the extracted function for tags.
+    tags_text = extract_filtered_tags(row[5], threshold=60)
+
+    # Combine title, genres, and filtered tags into one text string.
+    return anime_id, f"Title: {title}. Genres: {genres}. Important tags: {tags_text}"
+
+def stream_anime_data(chunk_size=READ_CHUNK_SIZE, media_types=("ANIME",)) -> TextStream:
+    """
+    Returns a TextStream of (ids, texts) chunks over the global_media rows of media_types (all
+    if None). Rows are read with a chunked cursor and turned into text on a background thread,
+    so memory stays flat however large the table is and reading overlaps with encoding.
+    The single index holds anime only; build_shards streams every type.
+    """
+    logging.info(f"Streaming anime data from {DB_PATH}...")
+    conn = sqlite3.connect(DB_PATH)
     try:
-        cursor.execute(query)
-        results = cursor.fetchall()
-        logging.info(f"Fetched {len(results)} records from the database.")
-    except Exception as e:
-        logging.error(f"Error executing query: {e}")
-        results = []
+        query = f"{ANIME_QUERY} {media_type_filter(conn, media_types)}"
     finally:
         conn.close()
-    
-    anime_data = []
-    for row in results:
-        anime_id = row[0]
-        title = row[1] or row[2] or row[3] or "Unknown Title"
-        
-        try:
-            genres_list = json.loads(row[4]) if row[4] else []
-            genres = " ".join(sorted(set(genres_list)))
-        except Exception as e:
-            logging.warning(f"Error parsing genres for anime_id {anime_id}: {e}")
-            genres = ""
-        
-        # Use the extracted function for tags.
-        tags_text = extract_filtered_tags(row[5], threshold=60)
-        # logging.debug(f"Tags extracted {anime_id}: {tags_text}")
-        
-        # Combine title, genres, and filtered tags into one text string.
-        text = f"Title: {title}. Genres: {genres}. Important tags: {tags_text}"
-        # logging.debug(f"Created text entry for anime_id {anime_id}: {text}")
-        anime_data.append((anime_id, text))
-    
-    logging.debug("Completed loading anime data.")  
-    return anime_data
+    return TextStream(DB_PATH, query, build_anime_text, chunk_size=chunk_size)
 
-def build_faiss_index():
-    logging.info("Loading SentenceTransformer model 'all-mpnet-base-v2'...")
-    try:
-        model = SentenceTransformer("all-mpnet-base-v2")
-    except Exception as e:
-        logging.error(f"Error loading SentenceTransformer model: {e}")
-        raise
+def load_anime_data():
+    """
+    Returns every (anime_id, text) pair as a list. Prefer stream_anime_data for builds;
+    this materializes the whole table.
+    """
+    with stream_anime_data() as stream:
+        return [pair for ids, texts in stream for pair in zip(ids, texts)]
 
-    logging.info("Loading anime data from database...")
-    anime_data = load_anime_data()
-    logging.info(f"Building embeddings for {len(anime_data)} anime entries...")
-    
-    ids = []
-    embeddings = []
-    for i, (anime_id, text) in enumerate(anime_data, start=1):
-        try:
-            emb = model.encode(text, convert_to_numpy=True, show_progress_bar=False)
-        except Exception as e:
-            logging.error(f"Error encoding text for anime_id {anime_id}: {e}")
+def encode_anime_stream(model, stream, batch_size=256, workers=1, checkpoint_dir=None, encoder=None):
+    """
+    Encodes a stream of (ids, texts) chunks in batches and returns (ids, embeddings, hashes)
+    with embeddings as a float32 matrix. See core.search.encoding.encode_stream for the
+    batching, multi-process and checkpoint options. Rows that fail to encode are logged and skipped.
+    """
+    logging.info(f"Building embeddings for {stream.rows} anime entries...")
+    ids, embeddings, hashes = encode_stream(
+        model, stream, stream.rows,
+        model_name=get_encoder_spec(encoder).name,
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_dir=checkpoint_dir,
+    )
+    logging.info(f"Embeddings array shape: {embeddings.shape}")
+    return ids, embeddings, hashes
+
+def scan_changes(chunks, old_ids, old_hashes):
+    """
+    Streams (ids, texts) chunks and compares each row's content hash with a previous build.
+
+    Returns (ids, hashes, changed, deleted_ids): every current anime ID and content hash in
+    stream order, the (anime_id, text) pairs that are new or whose text changed, and anime IDs
+    that were indexed before but no longer exist. Only the changed texts are kept in memory.
+    """
+    previous = {int(anime_id): int(old_hash) for anime_id, old_hash in zip(old_ids, old_hashes)}
+    ids, hashes, changed = [], [], []
+    for chunk_ids, chunk_texts in chunks:
+        for anime_id, text in zip(chunk_ids, chunk_texts):
+            new_hash = content_hash(text)
+            ids.append(anime_id)
+            hashes.append(new_hash)
+            if previous.get(anime_id) != new_hash:
+                changed.append((anime_id, text))
+    current = set(ids)
+    deleted_ids = [anime_id for anime_id in previous if anime_id not in current]
+    return ids, np.array(hashes, dtype=np.uint64), changed, deleted_ids
+
+def built_encoder_name(manifest: dict):
+    """
+    Returns the encoder name recorded in a manifest. Builds from before the encoder registry
+    only recorded the model, which was always encoded with the plain PyTorch backend.
+    """
+    if "encoder" in manifest:
+        return manifest["encoder"].get("name")
+    return next((spec.name for spec in ENCODERS.values() if spec.model == manifest.get("model") and spec.backend == "torch"), None)
+
+def load_previous_build(spec):
+    """
+    Returns (ids, vectors, hashes, manifest, index) from the last build, or None if it cannot
+    be updated incrementally (missing files, no content hashes, a different encoder than spec
+    or an index whose labels are row positions rather than anime IDs).
+
+    The published version is used when there is one, otherwise the unversioned files of older builds.
+    """
+    artifact_dir = current_path(INDEX_VERSIONS_DIR)
+    index_path = os.path.join(artifact_dir, INDEX_FILE) if artifact_dir else VECTOR_DB_PATH
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    if not has_artifacts(artifact_dir) or not os.path.exists(index_path):
+        logging.info("No previous build found.")
+        return None
+    ids, vectors, manifest = load_artifacts(artifact_dir)
+    hashes = load_hashes(artifact_dir)
+    if hashes is None:
+        logging.info("Previous build has no content hashes.")
+        return None
+    if built_encoder_name(manifest) != spec.name:
+        logging.info(f"Previous build used encoder '{built_encoder_name(manifest)}', not '{spec.name}'.")
+        return None
+    if not is_id_mapped(manifest):
+        logging.info("Previous index labels are row positions, not anime IDs.")
+        return None
+    return ids, vectors, hashes, manifest, faiss.read_index(index_path)
+
+def update_faiss_index(model, chunks, previous, spec, batch_size=256, workers=1, keep_versions=KEEP_VERSIONS):
+    """
+    Re-encodes only new or changed rows, applies them to a copy of the previous index and
+    publishes the result as a new version.
+
+    Unchanged rows keep their stored vectors. Changed and deleted IDs are removed from the
+    index and the new vectors are added under their anime IDs; index types without removal
+    support (HNSW) are rebuilt from the merged vectors instead. Rows whose new text fails to
+    encode keep their previous vector and hash so the next run retries them.
+    """
+    old_ids, old_vectors, old_hashes, manifest, index = previous
+    current_ids, hashes, changed, deleted_ids = scan_changes(chunks, old_ids, old_hashes)
+    logging.info(f"Incremental build: {len(changed)} new or changed, {len(deleted_ids)} deleted, "
+                 f"{len(current_ids) - len(changed)} unchanged.")
+    if not changed and not deleted_ids:
+        logging.info("Index is up to date.")
+        return
+
+    encoded_ids, encoded_vectors = encode_texts(
+        model,
+        [anime_id for anime_id, _ in changed],
+        [text for _, text in changed],
+        model_name=spec.name,
+        batch_size=batch_size,
+        workers=workers,
+    )
+    encoded = {anime_id: i for i, anime_id in enumerate(encoded_ids)}
+    old_rows = {int(anime_id): row for row, anime_id in enumerate(old_ids)}
+
+    ids, vectors, row_hashes = [], np.empty((len(current_ids), old_vectors.shape[1]), dtype=np.float32), []
+    for row, anime_id in enumerate(current_ids):
+        if anime_id in encoded:
+            vectors[len(ids)] = encoded_vectors[encoded[anime_id]]
+            row_hashes.append(hashes[row])
+        elif anime_id in old_rows:
+            vectors[len(ids)] = old_vectors[old_rows[anime_id]]
+            row_hashes.append(old_hashes[old_rows[anime_id]])
+        else:
             continue
-        embeddings.append(emb)
         ids.append(anime_id)
-        
-        if i % 100 == 0:
-            logging.debug(f"Processed {i} entries...")
-    
-    if not embeddings:
-        logging.error("No embeddings were generated; aborting index build.")
-        return
+    vectors = vectors[:len(ids)]
 
-    embeddings = np.array(embeddings).astype("float32")
-    logging.info(f"Embeddings array shape: {embeddings.shape}")
+    factory = manifest["index"]["factory"]
+    removed = deleted_ids + [anime_id for anime_id in encoded_ids if anime_id in old_rows]
+    index = update_index(index, factory, removed, encoded_ids, encoded_vectors, ids, vectors)
+    if index.ntotal != len(ids):
+        raise ValueError(f"Updated index has {index.ntotal} vectors but {len(ids)} ids")
+
+    save_build(index, ids, vectors, row_hashes, factory, spec, keep_versions)
 
-    logging.info("Creating FAISS index...")
+def save_build(index, ids, embeddings, hashes, factory, spec, keep_versions=KEEP_VERSIONS) -> str:
+    """
+    Writes the index and embedding artifacts into a new version directory and publishes it
+    (see utils.versions). A running API picks the new version up without a restart.
+    Returns the version name.
+    """
+    version = new_version(INDEX_VERSIONS_DIR)
+    staging = create_staging(version, INDEX_VERSIONS_DIR)
+
+    logging.info(f"Saving FAISS index and embedding artifacts to {staging}/...")
     try:
-        index = faiss.IndexFlatL2(embeddings.shape[1])
-        index.add(embeddings)
-        logging.info("FAISS index created and embeddings added.")
+        faiss.write_index(index, os.path.join(staging, INDEX_FILE))
+        write_artifacts(
+            staging, ids, embeddings, spec.model, source_db=DB_PATH,
+            extra={
+                "index": {"factory": factory, "id_mapped": True},
+                "encoder": spec.to_manifest(index.d),
+                "version": version,
+            },
+            hashes=hashes,
+        )
     except Exception as e:
-        logging.error(f"Error building FAISS index: {e}")
+        logging.error(f"Error saving index version {version}: {e}")
         raise
 
-    logging.info(f"Saving FAISS index to {VECTOR_DB_PATH}...")
+    publish_version(version, INDEX_VERSIONS_DIR, keep=keep_versions)
+    logging.info(f"Published index version {version} with {len(ids)} entries.")
+    return version
+
+def build_faiss_index(index_spec="flat", train_size=None, ef_construction=None, batch_size=256, workers=1, checkpoint_dir=CHECKPOINT_DIR, incremental=False, keep_versions=KEEP_VERSIONS, encoder=None, **index_params):
+    """
+    Encodes every anime entry and writes the FAISS index plus embedding artifacts.
+
+    Rows are streamed from the database in chunks (see stream_anime_data) and encoded in
+    batches of batch_size while the next chunk is read, optionally over a pool of worker
+    processes, with checkpoints in checkpoint_dir so an interrupted rebuild resumes where it stopped.
+
+    index_spec selects the index type ("flat", "ivf-flat", "ivf-pq", "hnsw" or any FAISS
+    index_factory string); index_params (nlist, m, M), train_size and ef_construction
+    are passed through to core.search.index_specs.build_index.
+
+    With incremental=True, only rows whose content hash changed since the last build are
+    re-encoded and applied to the existing index (see update_faiss_index); the index type
+    of the previous build is kept. A full build runs when there is no usable previous build.
+
+    Every build is published as a new version under INDEX_VERSIONS_DIR; the newest
+    keep_versions versions are retained for rollback.
+
+    encoder names an entry of utils.encoders.ENCODERS (default: the ENCODER setting) and is
+    recorded in the manifest so the API can refuse to serve the index with another encoder.
+    """
+    spec = get_encoder_spec(encoder)
+    logging.info(f"Loading encoder '{spec.name}' ({spec.model}, {spec.backend})...")
     try:
-        faiss.write_index(index, VECTOR_DB_PATH)
+        model = load_encoder(spec.name)
     except Exception as e:
-        logging.error(f"Error saving FAISS index: {e}")
+        logging.error(f"Error loading encoder: {e}")
         raise
 
-    logging.info(f"Saving embeddings mapping to {EMBEDDINGS_FILE}...")
+    previous = load_previous_build(spec) if incremental else None
+    if incremental and previous is None:
+        logging.info("Falling back to a full build.")
+
+    # A multi-process pool needs chunks large enough to keep every worker busy.
+    with stream_anime_data(chunk_size=max(READ_CHUNK_SIZE, batch_size * (workers or 1))) as stream:
+        if previous is not None:
+            update_faiss_index(model, stream, previous, spec, batch_size=batch_size, workers=workers, keep_versions=keep_versions)
+            return
+        ids, embeddings, hashes = encode_anime_stream(
+            model, stream, batch_size=batch_size, workers=workers, checkpoint_dir=checkpoint_dir, encoder=spec.name
+        )
+    if not ids:
+        logging.error("No embeddings were generated; aborting index build.")
+        return
+
+    logging.info(f"Creating FAISS index ({index_spec})...")
     try:
-        with open(EMBEDDINGS_FILE, "wb") as f:
-            pickle.dump({"ids": ids, "embeddings": embeddings}, f)
+        index, factory, build_seconds = build_index(
+            embeddings, index_spec, ids=ids, train_size=train_size, ef_construction=ef_construction, **index_params
+        )
+        logging.info(
+            f"FAISS index '{factory}' created in {build_seconds:.1f}s "
+            f"({index_size_bytes(index) / (1024 * 1024):.1f} MB)."
+        )
     except Exception as e:
-        logging.error(f"Error saving embeddings mapping: {e}")
+        logging.error(f"Error building FAISS index: {e}")
         raise
-    
-    logging.info(f"Saved FAISS index with {len(ids)} entries.")
+
+    save_build(index, ids, embeddings, hashes, factory, spec, keep_versions)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS index and embedding artifacts.")
+    parser.add_argument("--index-spec", default="flat",
+                        help=f"One of {', '.join(INDEX_PRESETS)} or a FAISS index_factory string (default: flat)")
+    parser.add_argument("--nlist", type=int, help="IVF: number of clusters")
+    parser.add_argument("--m", type=int, help="IVF-PQ: number of sub-quantizers (must divide the embedding dim)")
+    parser.add_argument("--M", type=int, dest="hnsw_m", help="HNSW: neighbours per node")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: construction-time beam width")
+    parser.add_argument("--train-size", type=int, help="IVF/PQ: vectors sampled for training (default: all)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Sentences per encoder forward pass")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encoder processes; 0 uses one per CPU core (default: 1, in-process)")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR,
+                        help="Where encode progress is saved so an interrupted build can resume")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-encode only rows whose text changed since the last build and update the previous index")
+    parser.add_argument("--keep-versions", type=int, default=KEEP_VERSIONS,
+                        help=f"Published index versions to keep, including the new one (default: {KEEP_VERSIONS})")
+    parser.add_argument("--encoder", default=ENCODER, choices=sorted(ENCODERS),
+                        help=f"Encoder from utils/encoders.py (default: ENCODER setting, currently {ENCODER})")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        build_faiss_index()
+        build_faiss_index(
+            args.index_spec,
+            train_size=args.train_size,
+            ef_construction=args.ef_construction,
+            nlist=args.nlist,
+            m=args.m,
+            M=args.hnsw_m,
+            batch_size=args.batch_size,
+            workers=args.workers if args.workers > 0 else os.cpu_count(),
+            checkpoint_dir=args.checkpoint_dir,
+            incremental=args.incremental,
+            keep_versions=args.keep_versions,
+            encoder=args.encoder,
+        )
     except Exception as err:
         logging.exception("An error occurred during FAISS index building:")
\ No newline at end of file
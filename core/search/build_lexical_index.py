@@ -0,0 +1,88 @@
+import re
+import json
+import time
+import sqlite3
+import logging
+import argparse
+
+from utils.lexical import FTS_COLUMNS, FTS_TABLE, FTS_WEIGHTS
+from core.search.build_faiss_index import extract_filtered_tags
+from core.search.pipeline import READ_CHUNK_SIZE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+
+DB_PATH = "anilist_global.db"
+
+# Columns read for each entry, in the order build_fts_row expects them.
+FTS_SOURCE_QUERY = "SELECT id, title_english, title_romaji, title_native, description, genres, tags FROM global_media"
+
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+def build_fts_row(row):
+    """
+    Builds the (rowid, title, description, genres, tags) FTS row for one global_media row.
+    All titles are indexed so English, romaji and native spellings all match; descriptions
+    lose their AniList HTML markup; tags use the same importance threshold as the embeddings.
+    """
+    anime_id, title_english, title_romaji, title_native, description, genres_json, tags_json = row
+    titles = " ".join(title for title in (title_english, title_romaji, title_native) if title)
+    try:
+        genres = " ".join(json.loads(genres_json)) if genres_json else ""
+    except Exception as e:
+        logging.warning(f"Error parsing genres for anime_id {anime_id}: {e}")
+        genres = ""
+    return anime_id, titles, _HTML_TAG.sub(" ", description or ""), genres, extract_filtered_tags(tags_json, threshold=60)
+
+def build_lexical_index(db_path=DB_PATH, chunk_size=READ_CHUNK_SIZE) -> int:
+    """
+    (Re)builds the FTS5 table over global_media and returns the number of indexed rows.
+
+    The table is dropped, recreated and filled in one transaction, so the API keeps
+    searching the previous contents until the commit. Run it after every ingest.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        # porter stems English words so "vampires" finds "vampire"; diacritics are folded.
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, "
+            f"tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        # Makes ORDER BY rank use the weighted bm25() without repeating the weights in every query.
+        conn.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', ?)",
+            (f"bm25({', '.join(str(w) for w in FTS_WEIGHTS)})",)
+        )
+        rows = 0
+        cursor = conn.execute(FTS_SOURCE_QUERY)
+        insert = f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?)"
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            conn.executemany(insert, [build_fts_row(row) for row in chunk])
+            rows += len(chunk)
+        conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logging.info(f"Indexed {rows} entries for keyword search in {time.perf_counter() - start:.1f}s.")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the SQLite FTS5 keyword index over global_media.")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    build_lexical_index(args.db)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sqlite3
+import logging
+import argparse
+import numpy as np
+import faiss
+
+from utils.artifacts import write_artifacts
+from utils.db import has_derived_columns
+from utils.encoders import ENCODER, ENCODERS, get_encoder_spec, load_encoder
+from utils.shards import SHARD_DIR, SHARD_INDEX_FILE
+from core.search.index_specs import INDEX_PRESETS, build_index
+from core.search.build_faiss_index import DB_PATH, stream_anime_data, encode_anime_stream
+
+# Columns of global_media a shard can be keyed on.
+SHARD_KEYS = ("type", "format")
+
+def load_shard_keys(shard_by="type", db_path=DB_PATH) -> dict:
+    """
+    Returns {anime_id: shard_name} for every row, using the given global_media column.
+    Rows with no value (e.g. ingested before the column existed) go to the "UNKNOWN" shard;
+    rows with no type are assumed to be ANIME, which was the only type ingested before.
+    Format shards use the format_norm column materialized by db/migrate_db.py when present.
+    """
+    if shard_by not in SHARD_KEYS:
+        raise ValueError(f"Cannot shard by '{shard_by}'; choose one of {', '.join(SHARD_KEYS)}")
+    default = "ANIME" if shard_by == "type" else "UNKNOWN"
+    conn = sqlite3.connect(db_path)
+    try:
+        column = "format_norm" if shard_by == "format" and has_derived_columns(conn) else shard_by
+        rows = conn.execute(f"SELECT id, {column} FROM global_media").fetchall()
+    finally:
+        conn.close()
+    return {anime_id: (value or default).strip().upper() or default for anime_id, value in rows}
+
+def build_shards(shard_by="type", shard_dir=SHARD_DIR, index_spec="flat", encoder=None, **index_params):
+    """
+    Encodes every anime entry once and writes one FAISS index plus embedding artifacts per shard
+    into shard_dir/<shard_name>/. Shards are assembled in a staging directory and swapped in
+    when complete.
+    """
+    spec = get_encoder_spec(encoder)
+    logging.info(f"Loading encoder '{spec.name}' ({spec.model}, {spec.backend})...")
+    model = load_encoder(spec.name)
+
+    shard_keys = load_shard_keys(shard_by)
+    with stream_anime_data(media_types=None) as stream:  # every type; rows are split by shard_by below
+        ids, embeddings, hashes = encode_anime_stream(model, stream, encoder=spec.name)
+    if not ids:
+        logging.error("No embeddings were generated; aborting shard build.")
+        return
+
+    ids = np.asarray(ids, dtype=np.int64)
+    names = np.array([shard_keys.get(int(anime_id), "UNKNOWN") for anime_id in ids])
+
+    staging_dir = shard_dir.rstrip("/") + ".staging"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    for name in sorted(set(names)):
+        mask = names == name
+        shard_ids, shard_vectors, shard_hashes = ids[mask], embeddings[mask], hashes[mask]
+        try:
+            index, factory, _ = build_index(shard_vectors, index_spec, ids=shard_ids, **index_params)
+        except ValueError as e:
+            # Small shards cannot train IVF/PQ quantizers; an exact index is both correct and fast there.
+            logging.warning(f"Shard {name}: {e}; falling back to a flat index.")
+            index, factory, _ = build_index(shard_vectors, "flat", ids=shard_ids)
+
+        path = os.path.join(staging_dir, name)
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(index, os.path.join(path, SHARD_INDEX_FILE))
+        write_artifacts(
+            path, shard_ids, shard_vectors, spec.model, source_db=DB_PATH,
+            extra={
+                "index": {"factory": factory, "id_mapped": True},
+                "encoder": spec.to_manifest(index.d),
+                "shard": {"name": name, "key": shard_by},
+            },
+            hashes=shard_hashes,
+        )
+        logging.info(f"Shard {name}: {len(shard_ids)} vectors, index '{factory}'.")
+
+    old_dir = shard_dir.rstrip("/") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(shard_dir):
+        os.rename(shard_dir, old_dir)
+    os.rename(staging_dir, shard_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(f"Wrote {len(set(names))} shards to {shard_dir}/.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build one FAISS index per media type or format.")
+    parser.add_argument("--shard-by", choices=SHARD_KEYS, default="type")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    parser.add_argument("--index-spec", default="flat",
+                        help=f"One of {', '.join(INDEX_PRESETS)} or a FAISS index_factory string")
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--M", type=int, dest="hnsw_m")
+    parser.add_argument("--encoder", default=ENCODER, choices=sorted(ENCODERS))
+    args = parser.parse_args()
+    build_shards(args.shard_by, args.shard_dir, args.index_spec, encoder=args.encoder, nlist=args.nlist, m=args.m, M=args.hnsw_m)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import numpy as np
+
+from utils.artifacts import content_hash
+
+CHECKPOINT_DIR = "build_checkpoint"
+PROGRESS_FILE = "progress.json"
+PARTIAL_VECTORS_FILE = "vectors.partial.npy"
+PARTIAL_IDS_FILE = "ids.partial.npy"
+PARTIAL_HASHES_FILE = "hashes.partial.npy"
+
+def input_fingerprint(ids, texts) -> str:
+    """
+    Hashes the ordered (id, text) input so a checkpoint is only resumed for the same rows.
+    """
+    digest = hashlib.sha1()
+    for anime_id, text in zip(ids, texts):
+        digest.update(f"{anime_id}\x1f{text}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+class EncodeCheckpoint:
+    """
+    Progress of an interrupted encode: preallocated memory-mapped vector, ID and content-hash
+    arrays plus a small JSON file recording how many leading rows are complete.
+
+    fingerprint identifies the whole input when it is known up front; streamed input passes
+    None and is instead verified row by row against the stored IDs and content hashes.
+    """
+
+    def __init__(self, checkpoint_dir: str, rows: int, dim: int, fingerprint, model_name: str):
+        self.checkpoint_dir = checkpoint_dir
+        self.rows = rows
+        self.dim = dim
+        self.fingerprint = fingerprint
+        self.model_name = model_name
+        self.rows_done = 0
+        self.failed_rows = []
+        self.vectors = None
+        self.ids = None
+        self.hashes = None
+
+    def _progress_path(self):
+        return os.path.join(self.checkpoint_dir, PROGRESS_FILE)
+
+    def open(self):
+        """
+        Resumes a matching checkpoint or starts a fresh one; returns the memory-mapped vector matrix.
+        """
+        paths = [os.path.join(self.checkpoint_dir, name) for name in (PARTIAL_VECTORS_FILE, PARTIAL_IDS_FILE, PARTIAL_HASHES_FILE)]
+        progress = None
+        if os.path.exists(self._progress_path()) and all(os.path.exists(path) for path in paths):
+            with open(self._progress_path()) as f:
+                progress = json.load(f)
+        expected = {"rows": self.rows, "dim": self.dim, "fingerprint": self.fingerprint, "model": self.model_name}
+        if progress and all(progress.get(key) == value for key, value in expected.items()):
+            self.rows_done = progress["rows_done"]
+            self.failed_rows = progress.get("failed_rows", [])
+            self.vectors, self.ids, self.hashes = (np.lib.format.open_memmap(path, mode="r+") for path in paths)
+            logging.info(f"Resuming encode from checkpoint at row {self.rows_done} of {self.rows}.")
+        else:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            self.vectors = np.lib.format.open_memmap(paths[0], mode="w+", dtype=np.float32, shape=(self.rows, self.dim))
+            self.ids = np.lib.format.open_memmap(paths[1], mode="w+", dtype=np.int64, shape=(self.rows,))
+            self.hashes = np.lib.format.open_memmap(paths[2], mode="w+", dtype=np.uint64, shape=(self.rows,))
+            self.save()
+        return self.vectors
+
+    def save(self):
+        for array in (self.vectors, self.ids, self.hashes):
+            array.flush()
+        tmp_path = self._progress_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "rows": self.rows,
+                "dim": self.dim,
+                "fingerprint": self.fingerprint,
+                "model": self.model_name,
+                "rows_done": self.rows_done,
+                "failed_rows": self.failed_rows,
+            }, f)
+        os.replace(tmp_path, self._progress_path())
+
+    def remove(self):
+        self.vectors = self.ids = self.hashes = None
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+def _encode_chunk(model, texts, batch_size, pool):
+    if pool is not None:
+        return model.encode_multi_process(texts, pool, batch_size=batch_size)
+    return model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+def _iter_chunks(ids, texts, chunk_size):
+    for start in range(0, len(texts), chunk_size):
+        yield list(ids[start:start + chunk_size]), list(texts[start:start + chunk_size])
+
+def encode_texts(model, ids, texts, model_name="", batch_size=256, workers=1, chunk_size=4096, checkpoint_dir=None):
+    """
+    Encodes texts in large batches into a preallocated float32 matrix.
+
+    Parameters:
+      model: a loaded SentenceTransformer.
+      ids / texts: aligned sequences of anime IDs and their embedding texts.
+      batch_size (int): sentences per forward pass.
+      workers (int): >1 spreads encoding over a multi-process pool (one process per CPU core by default).
+      chunk_size (int): rows encoded between progress reports and checkpoint saves.
+      checkpoint_dir (str): if set, progress is saved there and an interrupted run resumes from it.
+
+    Returns:
+      (ids, embeddings) for the rows that encoded successfully. Rows whose batch fails are
+      retried one by one, and rows that still fail are logged and dropped.
+    """
+    ids, embeddings, _ = encode_stream(
+        model, _iter_chunks(ids, texts, chunk_size), len(texts),
+        model_name=model_name,
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_dir=checkpoint_dir,
+        fingerprint=input_fingerprint(ids, texts) if checkpoint_dir else None,
+    )
+    return ids, embeddings
+
+def encode_stream(model, chunks, rows, model_name="", batch_size=256, workers=1, checkpoint_dir=None, fingerprint=None):
+    """
+    Encodes a stream of (ids, texts) chunks, such as a core.search.pipeline.TextStream,
+    into a preallocated float32 matrix of at most rows rows. Only the current chunk's
+    texts are held in memory.
+
+    With checkpoint_dir set, progress is saved after every chunk. On resume, rows already
+    encoded are reused when their anime ID and content hash still match, so the stream
+    does not have to be identical to the interrupted one.
+
+    Returns:
+      (ids, embeddings, hashes) for the rows that encoded successfully, where hashes are the
+      content hashes of the texts (see utils.artifacts.content_hash).
+    """
+    dim = model.get_sentence_embedding_dimension()
+    if rows == 0:
+        return [], np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.uint64)
+
+    checkpoint = None
+    if checkpoint_dir:
+        checkpoint = EncodeCheckpoint(checkpoint_dir, rows, dim, fingerprint, model_name)
+        vectors = checkpoint.open()
+        row_ids, row_hashes = checkpoint.ids, checkpoint.hashes
+        resume_rows = checkpoint.rows_done
+        failed = set(checkpoint.failed_rows)
+    else:
+        vectors = np.empty((rows, dim), dtype=np.float32)
+        row_ids = np.empty(rows, dtype=np.int64)
+        row_hashes = np.empty(rows, dtype=np.uint64)
+        resume_rows = 0
+        failed = set()
+
+    pool = None
+    if workers and workers > 1:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    started = time.perf_counter()
+    offset = encoded = 0
+    try:
+        for chunk_ids, chunk_texts in chunks:
+            chunk_start, chunk_end = offset, offset + len(chunk_texts)
+            if chunk_end > rows:
+                raise ValueError(f"Input has more than the expected {rows} rows")
+            chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+            chunk_hashes = np.array([content_hash(text) for text in chunk_texts], dtype=np.uint64)
+
+            todo = np.ones(len(chunk_texts), dtype=bool)
+            if chunk_start < resume_rows:
+                done = slice(chunk_start, min(chunk_end, resume_rows))
+                width = done.stop - done.start
+                todo[:width] = ~(
+                    (row_ids[done] == chunk_ids[:width]) & (row_hashes[done] == chunk_hashes[:width])
+                    & np.array([row not in failed for row in range(done.start, done.stop)])
+                )
+            row_ids[chunk_start:chunk_end] = chunk_ids
+            row_hashes[chunk_start:chunk_end] = chunk_hashes
+
+            rows_todo = np.flatnonzero(todo)
+            if rows_todo.size:
+                failed.difference_update(int(chunk_start + i) for i in rows_todo)
+                todo_texts = [chunk_texts[i] for i in rows_todo]
+                try:
+                    vectors[chunk_start + rows_todo] = _encode_chunk(model, todo_texts, batch_size, pool)
+                except Exception as e:
+                    logging.warning(f"Batch encode failed for rows {chunk_start}-{chunk_end} ({e}); retrying row by row.")
+                    for i in rows_todo:
+                        try:
+                            vectors[chunk_start + i] = model.encode(chunk_texts[i], convert_to_numpy=True, show_progress_bar=False)
+                        except Exception as row_error:
+                            logging.error(f"Error encoding text for anime_id {chunk_ids[i]}: {row_error}")
+                            failed.add(int(chunk_start + i))
+                encoded += int(rows_todo.size)
+
+            offset = chunk_end
+            if checkpoint is not None:
+                checkpoint.rows_done = max(chunk_end, resume_rows)
+                checkpoint.failed_rows = sorted(failed)
+                checkpoint.save()
+
+            elapsed = time.perf_counter() - started
+            logging.info(f"Encoded {chunk_end}/{rows} rows ({encoded / elapsed if elapsed else 0.0:.1f} rows/s).")
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+    keep = np.zeros(rows, dtype=bool)
+    keep[:offset] = True
+    keep[[row for row in failed if row < offset]] = False
+    kept_ids = [int(anime_id) for anime_id in row_ids[keep]]
+    embeddings = np.array(vectors[keep], dtype=np.float32)
+    hashes = np.array(row_hashes[keep], dtype=np.uint64)
+
+    if checkpoint is not None:
+        checkpoint.remove()
+    return kept_ids, embeddings, hashes
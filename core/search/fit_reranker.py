@@ -0,0 +1,127 @@
+import json
+import time
+import logging
+import argparse
+import numpy as np
+
+from utils.rerank_cache import load_orderings
+from utils.local_reranker import DEFAULT_WEIGHTS, FEATURES, LOCAL_RERANKER_WEIGHTS, LocalReranker, load_catalog
+from utils.retrieval import RetrievalEngine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+
+DB_PATH = "anilist_global.db"
+RERANK_CACHE_DB = "rerank_cache.db"
+
+def ordering_pairs(reranked_ids: list, candidate_ids: list = None):
+    """
+    Turns one Gemini ordering into (preferred, other) ID pairs: every candidate is preferred
+    over each one ranked below it, and over every candidate Gemini left out of its answer.
+    """
+    ranked = list(dict.fromkeys(reranked_ids))
+    kept = set(ranked)
+    dropped = [cid for cid in dict.fromkeys(candidate_ids or []) if cid not in kept]
+    pairs = [(ranked[i], ranked[j]) for i in range(len(ranked)) for j in range(i + 1, len(ranked))]
+    pairs += [(cid, other) for cid in ranked for other in dropped]
+    return pairs
+
+def pair_differences(reranker: LocalReranker, query: str, query_vector, pairs: list, item_vectors) -> np.ndarray:
+    """
+    Returns features(preferred) - features(other) for each pair of one query.
+    item_vectors(ids) returns the stored embeddings of ids (or None).
+    """
+    ids = list(dict.fromkeys(cid for pair in pairs for cid in pair))
+    features = reranker.features(query, query_vector, ids, item_vectors(ids))
+    row = {cid: i for i, cid in enumerate(ids)}
+    return np.array([features[row[a]] - features[row[b]] for a, b in pairs], dtype=np.float64).reshape(len(pairs), len(FEATURES))
+
+def fit_pairwise(differences: np.ndarray, l2: float = 1e-3, iterations: int = 50) -> np.ndarray:
+    """
+    Fits weights w so that sigmoid(d @ w) -- the probability that the preferred item scores
+    higher -- is close to 1 for every pair difference d (pairwise logistic regression, RankNet
+    style). Newton's method; with a handful of features each step is a tiny linear solve.
+    """
+    rows, dim = differences.shape
+    weights = np.zeros(dim)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(differences @ weights)))
+        gradient = -differences.T @ (1.0 - p) / rows + l2 * weights
+        hessian = (differences * (p * (1.0 - p))[:, None]).T @ differences / rows + l2 * np.eye(dim)
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return weights
+
+def pairwise_accuracy(differences: np.ndarray, weights: np.ndarray) -> float:
+    """
+    Share of pairs the weights order the same way Gemini did (ties count as wrong).
+    """
+    return float(np.mean(differences @ weights > 0)) if len(differences) else 0.0
+
+def fit_reranker(orderings, reranker: LocalReranker, encode_batch, item_vectors, holdout_every: int = 5, l2: float = 1e-3) -> dict:
+    """
+    Distills the local reranker from logged Gemini orderings. Every holdout_every-th query is
+    held out to compare the fitted weights with the defaults. Returns the weights-file dict.
+    """
+    orderings = [o for o in orderings if len(o[2]) > 1 or o[1]]
+    if not orderings:
+        raise ValueError("No logged Gemini orderings to fit on; run /query with rerank=gemini first")
+    query_vectors = encode_batch([query for query, _, _ in orderings])
+
+    train, holdout = [], []
+    for i, (query, candidate_ids, reranked_ids) in enumerate(orderings):
+        pairs = ordering_pairs(reranked_ids, candidate_ids)
+        if pairs:
+            differences = pair_differences(reranker, query, query_vectors[i], pairs, item_vectors)
+            (holdout if holdout_every and i % holdout_every == holdout_every - 1 else train).append(differences)
+    train = np.vstack(train) if train else np.zeros((0, len(FEATURES)))
+    holdout = np.vstack(holdout) if holdout else np.zeros((0, len(FEATURES)))
+    if not len(train):
+        raise ValueError("Not enough logged orderings to fit on")
+
+    weights = fit_pairwise(train, l2=l2)
+    default = np.array([DEFAULT_WEIGHTS[name] for name in FEATURES])
+    return {
+        "features": list(FEATURES),
+        "weights": [round(float(w), 6) for w in weights],
+        "queries": len(orderings),
+        "train_pairs": int(len(train)),
+        "holdout_pairs": int(len(holdout)),
+        "train_accuracy": round(pairwise_accuracy(train, weights), 4),
+        "holdout_accuracy": round(pairwise_accuracy(holdout, weights), 4),
+        "default_holdout_accuracy": round(pairwise_accuracy(holdout, default), 4),
+        "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the local reranker's weights from logged Gemini orderings.")
+    parser.add_argument("--cache-db", default=RERANK_CACHE_DB, help="Rerank cache holding the Gemini orderings")
+    parser.add_argument("--prompt-version", help="Only use orderings from this rerank prompt version (default: all)")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--output", default=LOCAL_RERANKER_WEIGHTS)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    orderings = load_orderings(args.cache_db, args.prompt_version)
+    logging.info(f"Loaded {len(orderings)} Gemini orderings from {args.cache_db}.")
+    engine = RetrievalEngine().load()
+    if engine.item_vectors([]) is None:
+        logging.warning("The index has no embedding artifacts; the similarity feature will be 0.")
+    fitted = fit_reranker(orderings, LocalReranker(load_catalog(args.db)), engine.encode_batch, engine.item_vectors, l2=args.l2)
+
+    with open(args.output, "w") as f:
+        json.dump(fitted, f, indent=2)
+    logging.info(
+        f"Pairwise agreement with Gemini on held-out queries: {fitted['holdout_accuracy']:.3f} "
+        f"(default weights: {fitted['default_holdout_accuracy']:.3f}). Weights written to {args.output}."
+    )
+    for name, weight in zip(FEATURES, fitted["weights"]):
+        logging.info(f"  {name:<12} {weight:+.3f}")
+
+if __name__ == "__main__":
+    main()
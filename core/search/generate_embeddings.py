@@ -1,58 +1,78 @@
-import sqlite3
 import json
-import pickle
-from sentence_transformers import SentenceTransformer
+
+from utils.artifacts import write_artifacts
+from utils.encoders import get_encoder_spec, load_encoder
+from core.search.encoding import encode_stream
+from core.search.pipeline import READ_CHUNK_SIZE, TextStream
+
+# Description-based embeddings, kept apart from the index's artifacts in embeddings/: they are
+# encoded from different text, so the two must never be loaded in place of each other.
+DESCRIPTION_ARTIFACT_DIR = "description_embeddings"
+
+GLOBAL_ANIME_QUERY = """
+SELECT id, title_english, title_romaji, title_native, description, genres, tags
+FROM global_media
+"""
+
+def build_global_text(row):
+    anime_id = row[0]
+    title = row[1] or row[2] or row[3] or ""
+    description = row[4] if row[4] else ""
+    try:
+        genres = json.loads(row[5]) if row[5] else []
+    except Exception:
+        genres = []
+    try:
+        tags_data = json.loads(row[6]) if row[6] else []
+    except Exception:
+        tags_data = []
+
+    # Extract tag names from tags_data (assuming tags_data is a list of dicts)
+    tags = []
+    for t in tags_data:
+        if isinstance(t, dict):
+            tags.append(t.get("name", ""))
+        else:
+            tags.append(str(t))
+
+    # Combine title, description, genres, and tags into one text.
+    input_text = f"{title} {description} {' '.join(genres)} {' '.join(tags)}"
+    return anime_id, input_text
+
+def stream_global_anime(global_db_path="anilist_global.db", chunk_size=READ_CHUNK_SIZE) -> TextStream:
+    """
+    Streams (ids, texts) chunks over global_media, reading and assembling text on a
+    background thread so long descriptions never sit in memory all at once.
+    """
+    return TextStream(global_db_path, GLOBAL_ANIME_QUERY, build_global_text, chunk_size=chunk_size)
 
 def load_global_anime(global_db_path="anilist_global.db"):
-    conn = sqlite3.connect(global_db_path)
-    cursor = conn.cursor()
-    query = """
-    SELECT id, title_english, title_romaji, title_native, description, genres, tags
-    FROM global_media
+    with stream_global_anime(global_db_path) as stream:
+        return [pair for ids, texts in stream for pair in zip(ids, texts)]
+
+def generate_embeddings(encoder=None, artifact_dir=DESCRIPTION_ARTIFACT_DIR, batch_size=256, workers=1,
+                        global_db_path="anilist_global.db"):
+    """
+    Encodes title, description, genres and tags of every global_media row and writes them as
+    embedding artifacts (see utils.artifacts) into artifact_dir. Returns the manifest.
     """
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
-    
-    anime_list = []
-    for row in results:
-        anime_id = row[0]
-        title = row[1] or row[2] or row[3] or ""
-        description = row[4] if row[4] else ""
-        try:
-            genres = json.loads(row[5]) if row[5] else []
-        except Exception:
-            genres = []
-        try:
-            tags_data = json.loads(row[6]) if row[6] else []
-        except Exception:
-            tags_data = []
-        
-        # Extract tag names from tags_data (assuming tags_data is a list of dicts)
-        tags = []
-        for t in tags_data:
-            if isinstance(t, dict):
-                tags.append(t.get("name", ""))
-            else:
-                tags.append(str(t))
-        
-        # Combine title, description, genres, and tags into one text.
-        input_text = f"{title} {description} {' '.join(genres)} {' '.join(tags)}"
-        anime_list.append((anime_id, input_text))
-    return anime_list
-
-def generate_embeddings(model_name="all-mpnet-base-v2", output_file="embeddings_cache.pkl"):
-    print("Loading model...")
-    model = SentenceTransformer(model_name)
-    print("Loading anime data from global database...")
-    anime_list = load_global_anime()
-    embeddings = {}
-    for anime_id, text in anime_list:
-        embedding = model.encode(text, convert_to_numpy=True)
-        embeddings[anime_id] = embedding
-    with open(output_file, "wb") as f:
-        pickle.dump(embeddings, f)
-    print(f"Embeddings saved to {output_file}")
+    spec = get_encoder_spec(encoder)
+    print(f"Loading encoder '{spec.name}' ({spec.model}, {spec.backend})...")
+    model = load_encoder(spec.name)
+    print("Streaming anime data from global database...")
+    with stream_global_anime(global_db_path, chunk_size=max(READ_CHUNK_SIZE, batch_size * (workers or 1))) as stream:
+        ids, vectors, hashes = encode_stream(
+            model, stream, stream.rows,
+            model_name=spec.name,
+            batch_size=batch_size,
+            workers=workers,
+        )
+    manifest = write_artifacts(
+        artifact_dir, ids, vectors, spec.model, source_db=global_db_path, hashes=hashes,
+        extra={"encoder": spec.to_manifest(vectors.shape[1])},
+    )
+    print(f"Saved {manifest['rows']} x {manifest['dim']} embeddings to {artifact_dir}")
+    return manifest
 
 if __name__ == "__main__":
     generate_embeddings()
\ No newline at end of file
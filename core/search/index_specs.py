@@ -0,0 +1,120 @@
+import time
+import logging
+import numpy as np
+import faiss
+
+# Named presets for the index types we build. Any other FAISS index_factory string is accepted as-is.
+#   Flat       exact L2 scan over every vector (the original behaviour)
+#   IVF-Flat   inverted file: scans only the nprobe closest of nlist clusters
+#   IVF-PQ     inverted file with product-quantized vectors (m sub-quantizers)
+#   HNSW       graph index with M neighbours per node
+#   SQ8        exact scan over 8-bit scalar-quantized vectors (4x smaller than Flat)
+#   SQfp16     exact scan over float16 vectors (2x smaller than Flat)
+#   IVF-SQ8    inverted file over 8-bit scalar-quantized vectors
+# Compressed indexes can be paired with an exact float32 re-score of the top candidates
+# (FAISS_RESCORE, see utils/rescore.py).
+INDEX_PRESETS = {
+    "flat": "Flat",
+    "ivf-flat": "IVF{nlist},Flat",
+    "ivf-pq": "IVF{nlist},PQ{m}",
+    "hnsw": "HNSW{M}",
+    "sq8": "SQ8",
+    "sqfp16": "SQfp16",
+    "ivf-sq8": "IVF{nlist},SQ8",
+}
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 256,
+    "m": 64,
+    "M": 32,
+}
+
+def resolve_index_spec(spec: str = "flat", **params) -> str:
+    """
+    Turns a preset name ("flat", "ivf-flat", "ivf-pq", "hnsw", "sq8", ...) plus training parameters
+    into a FAISS index_factory string. Strings that are not presets are returned unchanged,
+    so "IVF1024,PQ32" or "HNSW64" can be passed directly.
+    """
+    template = INDEX_PRESETS.get(spec.lower())
+    if template is None:
+        return spec
+    values = dict(DEFAULT_INDEX_PARAMS)
+    values.update({k: v for k, v in params.items() if v is not None})
+    return template.format(**values)
+
+def build_index(embeddings: np.ndarray, spec: str = "flat", ids=None, train_size: int = None, ef_construction: int = None, **params):
+    """
+    Builds and fills a FAISS index for the given float32 embeddings.
+
+    Parameters:
+      embeddings (ndarray): (rows x dim) float32 matrix.
+      spec (str): preset name or FAISS index_factory string.
+      ids (array): optional anime IDs. When given, the index is id-mapped: searches return
+                   anime IDs instead of row positions and rows can be removed or replaced by ID.
+                   IVF indexes (including ones behind a transform such as "OPQ16,IVF...") store
+                   the IDs natively; other types are wrapped in IndexIDMap2.
+      train_size (int): number of vectors sampled for training IVF / PQ indexes (default: all rows).
+      ef_construction (int): HNSW construction-time beam width.
+      params: preset parameters (nlist, m, M).
+
+    Returns:
+      (index, factory_string, build_seconds)
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    factory = resolve_index_spec(spec, **params)
+    start = time.perf_counter()
+
+    index = faiss.index_factory(embeddings.shape[1], factory)
+    # Decided on the built index rather than the factory string, so transform-prefixed IVF
+    # factories are caught too: IndexIDMap2 over an IVF index mislabels results after remove_ids.
+    wrap_ids = ids is not None and faiss.try_extract_index_ivf(index) is None
+    if wrap_ids:
+        index = faiss.IndexIDMap2(index)
+
+    if ef_construction is not None:
+        hnsw_index = faiss.downcast_index(index.index if wrap_ids else index)
+        if hasattr(hnsw_index, "hnsw"):
+            hnsw_index.hnsw.efConstruction = ef_construction
+
+    if not index.is_trained:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and embeddings.shape[0] < ivf.nlist:
+            raise ValueError(f"Index '{factory}' needs at least {ivf.nlist} training vectors, got {embeddings.shape[0]}")
+        train_vectors = embeddings
+        if train_size is not None and train_size < embeddings.shape[0]:
+            rng = np.random.default_rng(0)
+            train_vectors = embeddings[rng.choice(embeddings.shape[0], train_size, replace=False)]
+        logging.info(f"Training '{factory}' on {train_vectors.shape[0]} vectors...")
+        index.train(train_vectors)
+
+    if ids is not None:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    return index, factory, time.perf_counter() - start
+
+def update_index(index, factory: str, remove_ids, add_ids, add_vectors, all_ids, all_vectors):
+    """
+    Applies an incremental change to an id-mapped index: removes remove_ids, then adds
+    add_vectors under add_ids. Index types that cannot remove vectors (HNSW) are rebuilt
+    from all_ids / all_vectors instead, which still avoids re-encoding unchanged rows.
+
+    Returns the updated (possibly new) index.
+    """
+    remove_ids = np.asarray(remove_ids, dtype=np.int64)
+    try:
+        if remove_ids.size:
+            index.remove_ids(remove_ids)
+    except RuntimeError as e:
+        logging.info(f"Index '{factory}' does not support removal ({str(e).splitlines()[0]}); rebuilding from stored vectors.")
+        rebuilt, _, _ = build_index(all_vectors, factory, ids=all_ids)
+        return rebuilt
+    if len(add_ids):
+        index.add_with_ids(np.ascontiguousarray(add_vectors, dtype=np.float32), np.asarray(add_ids, dtype=np.int64))
+    return index
+
+def index_size_bytes(index) -> int:
+    """
+    Returns the serialized size of an index, a close proxy for its resident memory.
+    """
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,107 @@
+import queue
+import sqlite3
+import threading
+
+READ_CHUNK_SIZE = 1000
+PREFETCH_DEPTH = 4
+
+_DONE = object()
+
+class TextStream:
+    """
+    Streams (ids, texts) chunks out of SQLite on a background thread.
+
+    The reader thread pulls rows with a chunked cursor (fetchmany), turns each row into an
+    (anime_id, text) pair with make_text and hands finished chunks over a bounded queue.
+    Only a few chunks are ever held in memory, and reading plus text assembly overlap with
+    whatever the consumer does with the previous chunk (typically encoding).
+
+    The row count and the rows come from one read transaction, so self.rows matches what
+    is streamed even if the table is written to concurrently. make_text may return None
+    to skip a row; such rows are not counted as streamed.
+
+    Usage:
+      with TextStream(db_path, query, make_text) as stream:
+          for ids, texts in stream:
+              ...
+    """
+
+    def __init__(self, db_path: str, query: str, make_text, chunk_size: int = READ_CHUNK_SIZE, depth: int = PREFETCH_DEPTH):
+        self.db_path = db_path
+        self.query = query
+        self.make_text = make_text
+        self.chunk_size = chunk_size
+        self.rows = None
+        self._queue = queue.Queue(maxsize=depth)
+        self._count = queue.Queue(maxsize=1)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._read, name="text-stream", daemon=True)
+        self._thread.start()
+        rows = self._count.get()
+        if isinstance(rows, BaseException):
+            self.close()
+            raise rows
+        self.rows = rows
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, item) -> bool:
+        # Blocks while the consumer is behind, but gives up promptly once it has gone away.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        conn = None
+        counted = False
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("BEGIN")
+            self._count.put(conn.execute(f"SELECT COUNT(*) FROM ({self.query})").fetchone()[0])
+            counted = True
+            cursor = conn.execute(self.query)
+            while not self._stopped.is_set():
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                ids, texts = [], []
+                for row in rows:
+                    pair = self.make_text(row)
+                    if pair is not None:
+                        ids.append(pair[0])
+                        texts.append(pair[1])
+                if ids and not self._put((ids, texts)):
+                    return
+            self._put(_DONE)
+        except BaseException as e:
+            if counted:
+                self._put(e)
+            else:
+                self._count.put(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
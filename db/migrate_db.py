@@ -1,26 +1,121 @@
 import sqlite3
+import json
+import time
+import argparse
+
+from utils.quality import best_tv_rank, compute_quality_score, normalize_format
+from utils.titles import preferred_title
 
 db_path = "anilist_global.db"
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-try:
-    cursor.execute("ALTER TABLE global_media ADD COLUMN average_score INTEGER;")
-    print("Added column: average_score")
-except sqlite3.OperationalError as e:
-    print("Column average_score may already exist:", e)
-
-try:
-    cursor.execute("ALTER TABLE global_media ADD COLUMN popularity INTEGER;")
-    print("Added column: popularity")
-except sqlite3.OperationalError as e:
-    print("Column popularity may already exist:", e)
-
-try:
-    cursor.execute("ALTER TABLE global_media ADD COLUMN rankings TEXT;")
-    print("Added column: rankings")
-except sqlite3.OperationalError as e:
-    print("Column rankings may already exist:", e)
-
-conn.commit()
-conn.close()
\ No newline at end of file
+
+# Derived columns materialized from the raw columns, so readers select ready-to-use values
+# instead of parsing JSON and picking titles for every row.
+DERIVED_COLUMNS = {
+    "display_title": "TEXT",      # utils.titles.preferred_title; NULL if the entry has no title
+    "best_tv_rank": "INTEGER",    # best positive TV rank in rankings; NULL if none
+    "quality_score": "REAL",      # utils.quality.compute_quality_score
+    "format_norm": "TEXT",        # utils.quality.normalize_format, e.g. "TV", "UNKNOWN"
+}
+
+# Covering indexes for the common filters: {name: columns}. Quality ranking happens in memory, so
+# these serve the shard and keyword-filter reads of format_norm and type.
+INDEXES = {
+    # Keyword-search format filter (joined on id) and load_shard_keys("format").
+    "idx_global_media_format_norm": "format_norm, id",
+    # load_shard_keys("type").
+    "idx_global_media_type": "type, id",
+}
+
+# Raw columns read to derive the columns above, in the order derive_row expects them.
+SOURCE_QUERY = """
+    SELECT id, title_english, title_romaji, title_native, average_score, popularity, rankings, format
+    FROM global_media
+"""
+
+def add_columns(conn):
+    """
+    Adds columns introduced after the first schema, including the derived ones.
+    """
+    cursor = conn.cursor()
+    for column, column_type in [
+        ("average_score", "INTEGER"),
+        ("popularity", "INTEGER"),
+        ("rankings", "TEXT"),
+        ("format", "TEXT"),
+        ("type", "TEXT"),
+    ] + list(DERIVED_COLUMNS.items()):
+        try:
+            cursor.execute(f"ALTER TABLE global_media ADD COLUMN {column} {column_type};")
+            print(f"Added column: {column}")
+        except sqlite3.OperationalError as e:
+            print(f"Column {column} may already exist:", e)
+
+def derive_row(row):
+    """
+    Returns (display_title, best_tv_rank, quality_score, format_norm, id) for one SOURCE_QUERY row.
+    """
+    anime_id, title_english, title_romaji, title_native, average_score, popularity, rankings_json, fmt = row
+    try:
+        rankings = json.loads(rankings_json) if rankings_json else []
+    except Exception:
+        rankings = []
+    rank = best_tv_rank(rankings)
+    info = {"average_score": average_score, "popularity": popularity, "format": fmt or "", "best_tv_rank": rank}
+    return (
+        preferred_title(title_english, title_romaji, title_native),
+        rank,
+        compute_quality_score(info),
+        normalize_format(fmt),
+        anime_id,
+    )
+
+def materialize_derived_columns(conn, chunk_size=1000) -> int:
+    """
+    Recomputes every derived column from the raw columns and returns the number of rows.
+    """
+    cursor = conn.execute(SOURCE_QUERY)
+    rows = 0
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        conn.executemany(
+            "UPDATE global_media SET display_title = ?, best_tv_rank = ?, quality_score = ?, format_norm = ? WHERE id = ?",
+            [derive_row(row) for row in chunk]
+        )
+        rows += len(chunk)
+    return rows
+
+def create_indexes(conn):
+    for name, columns in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON global_media ({columns})")
+
+def migrate(path=db_path):
+    """
+    Brings global_media up to the current schema, refreshes the derived columns and creates
+    the covering indexes.
+    Safe to run repeatedly; the ingest scripts run it after every ingest.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    try:
+        add_columns(conn)
+        rows = materialize_derived_columns(conn)
+        create_indexes(conn)
+        # Without statistics the planner joins keyword results on the primary key and skips the
+        # format_norm index; ANALYZE lets it see the covering lookup is cheaper.
+        conn.execute("ANALYZE global_media")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Materialized derived columns for {rows} rows in {time.perf_counter() - start:.1f}s.")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate anilist_global.db and refresh its derived columns.")
+    parser.add_argument("--db", default=db_path)
+    args = parser.parse_args()
+    migrate(args.db)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+
+personal_db_path = "anilist_data.db"
+
+# Profiles kept in memory by get_user_profile, least recently used evicted first. With
+# multi-user serving (db/users.py) there is one per user database.
+USER_PROFILE_CACHE_SIZE = int(os.environ.get("USER_PROFILE_CACHE_SIZE") or 256)
+
+# The user profile the baseline recommender scores with, stored next to the list it is derived from:
+# - profile_weights: genre/tag -> accumulated transformed rating of COMPLETED, scored entries
+#   (what baseline_recommender.get_user_preferences computes);
+# - profile_media: per media ID, how many PLANNING and other-status list entries it has
+#   (the planned and watched sets).
+# Triggers on media_list_entries and media keep both up to date, one entry at a time, in the
+# transaction that changes the list.
+PROFILE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS profile_weights (
+        feature TEXT PRIMARY KEY,
+        weight REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS profile_media (
+        media_id INTEGER PRIMARY KEY,
+        planning INTEGER NOT NULL,
+        other INTEGER NOT NULL
+    )
+    """,
+]
+
+# transform_rating: 7->1, 8->2, 9->3, 10->4, below 7 -> 0.
+ENTRY_WEIGHT = "(CASE WHEN {e}.score < 7 THEN 0 ELSE {e}.score - 6 END)"
+COUNTS_WEIGHT = "COALESCE(SUM(CASE WHEN score < 7 THEN 0 ELSE score - 6 END), 0)"
+
+def _json_list(expr: str) -> str:
+    return f"json_each(CASE WHEN json_valid({expr}) THEN {expr} ELSE '[]' END)"
+
+def _feature_weights(genres: str, tags: str, weight: str, where: str = "1", source: str = "") -> str:
+    """
+    (feature, weight) rows for the genre and tag names of media rows (tags stored as names or
+    {"name", "rank"} dicts). source is an optional FROM prefix the other expressions refer to.
+    """
+    tag_name = "CASE WHEN t.type = 'object' THEN COALESCE(json_extract(t.value, '$.name'), '') ELSE t.value END"
+    return f"""
+        SELECT g.value AS feature, {weight} AS weight FROM {source} {_json_list(genres)} g WHERE {where}
+        UNION ALL
+        SELECT {tag_name}, {weight} FROM {source} {_json_list(tags)} t WHERE {where}
+    """
+
+def _add_weights(genres: str, tags: str, weight: str, where: str = "1") -> str:
+    return f"""
+        INSERT INTO profile_weights (feature, weight)
+        SELECT feature, weight FROM ({_feature_weights(genres, tags, weight, where)}) WHERE 1
+        ON CONFLICT(feature) DO UPDATE SET weight = weight + excluded.weight;
+    """
+
+def _entry_weights(e: str, sign: str) -> str:
+    media = f"(SELECT {{}} FROM media WHERE id = {e}.media_id)"
+    return _add_weights(
+        media.format("genres"), media.format("tags"), f"{sign}{ENTRY_WEIGHT.format(e=e)}",
+        where=f"{e}.status = 'COMPLETED' AND {e}.score IS NOT NULL",
+    )
+
+def _entry_counts(e: str, sign: str) -> str:
+    return f"""
+        INSERT INTO profile_media (media_id, planning, other)
+        SELECT {e}.media_id, {sign}COALESCE({e}.status = 'PLANNING', 0), {sign}COALESCE({e}.status != 'PLANNING', 0)
+        WHERE {e}.media_id IS NOT NULL
+        ON CONFLICT(media_id) DO UPDATE SET planning = planning + excluded.planning, other = other + excluded.other;
+        DELETE FROM profile_media WHERE media_id = {e}.media_id AND planning = 0 AND other = 0;
+    """
+
+def _media_weights(m: str, sign: str) -> str:
+    completed = (
+        f"(SELECT {COUNTS_WEIGHT} FROM media_list_entries "
+        f"WHERE media_id = {m}.id AND status = 'COMPLETED' AND score IS NOT NULL)"
+    )
+    return _add_weights(f"{m}.genres", f"{m}.tags", f"{sign}{completed}")
+
+PROFILE_TRIGGERS = {
+    "profile_entry_insert": ("AFTER INSERT ON media_list_entries", _entry_weights("NEW", "") + _entry_counts("NEW", "")),
+    "profile_entry_delete": ("AFTER DELETE ON media_list_entries", _entry_weights("OLD", "-") + _entry_counts("OLD", "-")),
+    "profile_entry_update": (
+        "AFTER UPDATE OF media_id, status, score ON media_list_entries",
+        _entry_weights("OLD", "-") + _entry_counts("OLD", "-") + _entry_weights("NEW", "") + _entry_counts("NEW", ""),
+    ),
+    "profile_media_insert": ("AFTER INSERT ON media", _media_weights("NEW", "")),
+    "profile_media_delete": ("AFTER DELETE ON media", _media_weights("OLD", "-")),
+    "profile_media_update": ("AFTER UPDATE OF id, genres, tags ON media", _media_weights("OLD", "-") + _media_weights("NEW", "")),
+}
+
+def rebuild_profile(conn):
+    """
+    Recomputes the profile tables from the whole list.
+    """
+    conn.execute("DELETE FROM profile_weights")
+    conn.execute("DELETE FROM profile_media")
+    rows = _feature_weights(
+        "m.genres", "m.tags", ENTRY_WEIGHT.format(e="e"),
+        where="e.status = 'COMPLETED' AND e.score IS NOT NULL",
+        source="media_list_entries e JOIN media m ON m.id = e.media_id,",
+    )
+    conn.execute(f"INSERT INTO profile_weights (feature, weight) SELECT feature, SUM(weight) FROM ({rows}) GROUP BY feature")
+    conn.execute("""
+        INSERT INTO profile_media (media_id, planning, other)
+        SELECT media_id, SUM(COALESCE(status = 'PLANNING', 0)), SUM(COALESCE(status != 'PLANNING', 0))
+        FROM media_list_entries WHERE media_id IS NOT NULL
+        GROUP BY media_id
+    """)
+    conn.execute("DELETE FROM profile_media WHERE planning = 0 AND other = 0")
+
+def _installed_triggers(conn) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+def install_profile(conn, rebuild: bool = False) -> bool:
+    """
+    Creates the profile tables and triggers if they are missing, filling the tables from the
+    current list the first time (or whenever rebuild is set). Returns True if it did anything.
+    """
+    if not rebuild and set(PROFILE_TRIGGERS) <= _installed_triggers(conn):
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not rebuild and set(PROFILE_TRIGGERS) <= _installed_triggers(conn):
+            conn.commit()  # installed by another connection while this one waited for the lock
+            return False
+        for statement in PROFILE_TABLES:
+            conn.execute(statement)
+        rebuild_profile(conn)
+        existing = _installed_triggers(conn)
+        for name, (event, body) in PROFILE_TRIGGERS.items():
+            if name not in existing:
+                conn.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+class UserProfile:
+    """
+    Preference weights (genre/tag -> weight) and the planned and watched media ID sets.
+    """
+
+    def __init__(self, preference: dict, planned_ids: set, watched_ids: set):
+        self.preference = preference
+        self.planned_ids = planned_ids
+        self.watched_ids = watched_ids
+
+def ensure_profile(db_path: str = personal_db_path) -> bool:
+    """
+    install_profile on the database at db_path. Returns True if it did anything.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return install_profile(conn)
+    finally:
+        conn.close()
+
+def load_profile(db_path: str = personal_db_path) -> UserProfile:
+    conn = sqlite3.connect(db_path)
+    try:
+        install_profile(conn)
+        preference = dict(conn.execute("SELECT feature, weight FROM profile_weights WHERE weight != 0"))
+        planned, watched = set(), set()
+        for media_id, planning, other in conn.execute("SELECT media_id, planning, other FROM profile_media"):
+            if planning > 0:
+                planned.add(media_id)
+            if other > 0:
+                watched.add(media_id)
+    finally:
+        conn.close()
+    return UserProfile(preference, planned, watched)
+
+def file_version(path: str) -> str:
+    """
+    Modification time and size of an SQLite file and its write-ahead log, if any, plus the
+    file change counter in the database header (bumped by every commit outside WAL mode).
+    """
+    parts = []
+    for name in (path, path + "-wal"):
+        if os.path.exists(name):
+            stat = os.stat(name)
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    if parts:
+        with open(path, "rb") as f:
+            f.seek(24)
+            parts.append(f.read(4).hex())
+    return ",".join(parts)
+
+_profiles = OrderedDict()  # db_path -> (file_version, UserProfile), least recently used first
+_profiles_lock = threading.Lock()  # guards _profiles only; databases are read outside it
+
+def get_user_profile(db_path: str = personal_db_path, max_entries: int = None) -> UserProfile:
+    """
+    Returns the profile stored in db_path, re-read only when the file has changed. At most
+    max_entries (default USER_PROFILE_CACHE_SIZE) profiles are kept.
+
+    The install and read happen outside the cache lock, so a slow or locked database only
+    delays requests for its own user.
+    """
+    max_entries = USER_PROFILE_CACHE_SIZE if max_entries is None else max_entries
+    version = file_version(db_path)
+    with _profiles_lock:
+        cached = _profiles.get(db_path)
+        if cached is not None and cached[0] == version:
+            _profiles.move_to_end(db_path)
+            return cached[1]
+    if ensure_profile(db_path):
+        version = file_version(db_path)  # first use changes the file
+    # Taken before the read, so a write committed during it is picked up by the next call.
+    profile = load_profile(db_path)
+    with _profiles_lock:
+        _profiles[db_path] = (version, profile)
+        _profiles.move_to_end(db_path)
+        while len(_profiles) > max_entries:
+            _profiles.popitem(last=False)
+    return profile
+
+def main():
+    parser = argparse.ArgumentParser(description="Install and rebuild the user profile tables in anilist_data.db.")
+    parser.add_argument("--db", default=personal_db_path)
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        install_profile(conn, rebuild=True)
+        features, media = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("profile_weights", "profile_media"))
+    finally:
+        conn.close()
+    print(f"Rebuilt the user profile: {features} weighted genres/tags, {media} listed media.")
+
+if __name__ == "__main__":
+    main()
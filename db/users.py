@@ -0,0 +1,35 @@
+import os
+import re
+
+from db.user_profile import personal_db_path
+
+# Multi-user personal data: one database per AniList user, <USER_DATA_DIR>/<username>.db, each with
+# the anilist_data.db schema (and its own profile tables). Without a user, the single-user
+# anilist_data.db is used as before.
+USER_DATA_DIR = os.environ.get("USER_DATA_DIR") or "users"
+
+# AniList usernames are letters and digits; also accept - and _ but never path separators.
+USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def user_db_path(user: str = None, data_dir: str = None) -> str:
+    """
+    Returns the personal database of user, or anilist_data.db without one.
+    Raises ValueError for a name that is not a valid username.
+    """
+    if not user:
+        return personal_db_path
+    if not USERNAME_PATTERN.match(user):
+        raise ValueError(f"Invalid user name '{user}'")
+    return os.path.join(data_dir or USER_DATA_DIR, f"{user.lower()}.db")
+
+def list_users(data_dir: str = None) -> list:
+    """
+    Returns the users with a personal database in data_dir, sorted.
+    """
+    data_dir = data_dir or USER_DATA_DIR
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(
+        name[:-3] for name in os.listdir(data_dir)
+        if name.endswith(".db") and USERNAME_PATTERN.match(name[:-3])
+    )
@@ -5,8 +5,12 @@ import requests
 import sqlite3
 import json
 import webbrowser
+import argparse
 from requests_oauthlib import OAuth2Session
 
+from db.user_profile import install_profile
+from db.users import user_db_path
+
 # Load environment variables
 load_dotenv()
 
@@ -167,6 +171,8 @@ def init_db(db_path="anilist_data.db"):
     ''')
     
     conn.commit()
+    # Profile tables and triggers that keep the recommender's preference profile up to date.
+    install_profile(conn)
     return conn
 
 def store_data_to_db(data, conn):
@@ -225,6 +231,10 @@ def store_data_to_db(data, conn):
 # --------------------------
 
 def main():
+    parser = argparse.ArgumentParser(description="Fetch an AniList user's list into a local database.")
+    parser.add_argument("--user-store", action="store_true",
+                        help="Store the list in USER_DATA_DIR/<username>.db (multi-user serving) instead of anilist_data.db")
+    args = parser.parse_args()
     try:
         print("Starting OAuth2 authentication with AniList...")
         token = oauth2_authenticate()
@@ -237,11 +247,14 @@ def main():
         data = fetch_anilist_data(token, username)
         print("Data fetched successfully.\n")
         
+        db_path = user_db_path(username if args.user_store else None)
+        if args.user_store:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
         print("Initializing database...")
-        conn = init_db()
+        conn = init_db(db_path)
         print("Storing data into the database...")
         store_data_to_db(data, conn)
-        print("Data stored successfully in 'anilist_data.db'")
+        print(f"Data stored successfully in '{db_path}'")
         conn.close()
     except Exception as e:
         print("An error occurred:", e)
@@ -3,13 +3,19 @@ import sqlite3
 import json
 import time
 import os
+import sys
+
+from db.migrate_db import migrate
 
 # AniList GraphQL API endpoint
 ANILIST_API_URL = "https://graphql.anilist.co"
 
-# GraphQL query to fetch global anime data using pagination
+# Media types that can be ingested into global_media. Each gets its own search shard.
+MEDIA_TYPES = ("ANIME", "MANGA")
+
+# GraphQL query to fetch global media data (anime or manga) using pagination
 GLOBAL_QUERY = '''
-query ($page: Int, $perPage: Int) {
+query ($page: Int, $perPage: Int, $type: MediaType) {
   Page(page: $page, perPage: $perPage) {
     pageInfo {
       total
@@ -18,8 +24,10 @@ query ($page: Int, $perPage: Int) {
       hasNextPage
       perPage
     }
-    media(type: ANIME) {
+    media(type: $type) {
       id
+      type
+      format
       title {
         romaji
         english
@@ -46,6 +54,10 @@ query ($page: Int, $perPage: Int) {
 
 CHECKPOINT_FILE = "checkpoint.txt"
 
+def checkpoint_file(media_type="ANIME"):
+    # ANIME keeps the original checkpoint name so in-progress ingests resume where they left off.
+    return CHECKPOINT_FILE if media_type == "ANIME" else f"checkpoint_{media_type.lower()}.txt"
+
 def init_global_db(db_path="anilist_global.db"):
     """
     Initializes a separate SQLite database for global AniList data with extended fields.
@@ -64,19 +76,27 @@ def init_global_db(db_path="anilist_global.db"):
             tags TEXT,
             average_score INTEGER,
             popularity INTEGER,
-            rankings TEXT
+            rankings TEXT,
+            format TEXT,
+            type TEXT
         )
     ''')
+    # Older databases predate the format/type columns; add them in place.
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(global_media)")}
+    for column in ("format", "type"):
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE global_media ADD COLUMN {column} TEXT")
     conn.commit()
     return conn
 
-def fetch_global_data(page, per_page=50):
+def fetch_global_data(page, per_page=50, media_type="ANIME"):
     """
-    Fetches one page of global anime data from AniList.
+    Fetches one page of global media data of the given type (ANIME or MANGA) from AniList.
     """
     variables = {
         "page": page,
-        "perPage": per_page
+        "perPage": per_page,
+        "type": media_type
     }
     response = requests.post(
         ANILIST_API_URL,
@@ -109,6 +129,8 @@ def store_global_data(data, conn):
         average_score = media.get('averageScore')
         popularity = media.get('popularity')
         rankings = media.get('rankings', [])
+        media_format = media.get('format')
+        media_type = media.get('type')
         
         # Store full tag info (name and rank) as JSON for flexibility
         tags_list = media.get('tags', [])
@@ -118,8 +140,8 @@ def store_global_data(data, conn):
         
         cursor.execute('''
             INSERT INTO global_media 
-            (id, title_romaji, title_english, title_native, episodes, description, genres, tags, average_score, popularity, rankings)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (id, title_romaji, title_english, title_native, episodes, description, genres, tags, average_score, popularity, rankings, format, type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(id) DO UPDATE SET
                 title_romaji=excluded.title_romaji,
                 title_english=excluded.title_english,
@@ -130,49 +152,55 @@ def store_global_data(data, conn):
                 tags=excluded.tags,
                 average_score=excluded.average_score,
                 popularity=excluded.popularity,
-                rankings=excluded.rankings
+                rankings=excluded.rankings,
+                format=excluded.format,
+                type=excluded.type
         ''', (
             media_id, title_romaji, title_english, title_native, episodes, description,
-            genres_json, tags_json, average_score, popularity, rankings_json
+            genres_json, tags_json, average_score, popularity, rankings_json, media_format, media_type
         ))
     
     conn.commit()
     return page_data.get('pageInfo', {})
 
-def read_checkpoint():
+def read_checkpoint(media_type="ANIME"):
     """
     Reads the checkpoint file to determine which page to start from.
     """
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, "r") as f:
+    path = checkpoint_file(media_type)
+    if os.path.exists(path):
+        with open(path, "r") as f:
             try:
                 return int(f.read().strip())
             except ValueError:
                 return 1
     return 1
 
-def write_checkpoint(page):
+def write_checkpoint(page, media_type="ANIME"):
     """
     Writes the current page number to the checkpoint file.
     """
-    with open(CHECKPOINT_FILE, "w") as f:
+    with open(checkpoint_file(media_type), "w") as f:
         f.write(str(page))
 
-def main():
+def main(media_type="ANIME"):
+    media_type = media_type.upper()
+    if media_type not in MEDIA_TYPES:
+        raise ValueError(f"Unknown media type {media_type}; expected one of {', '.join(MEDIA_TYPES)}")
     conn = init_global_db()
     per_page = 50
     # Start from the checkpoint if available; otherwise, start at page 1.
-    current_page = read_checkpoint()
+    current_page = read_checkpoint(media_type)
 
     while True:
         try:
-            print(f"Fetching page {current_page}...")
-            data = fetch_global_data(current_page, per_page)
+            print(f"Fetching {media_type} page {current_page}...")
+            data = fetch_global_data(current_page, per_page, media_type)
             page_info = store_global_data(data, conn)
             print(f"Stored page {current_page} of {page_info.get('lastPage')}.")
             
             # Write checkpoint after a successful page fetch and store.
-            write_checkpoint(current_page)
+            write_checkpoint(current_page, media_type)
             
             if page_info.get('hasNextPage'):
                 current_page += 1
@@ -181,8 +209,8 @@ def main():
             else:
                 print("Global data ingestion completed!")
                 # Optionally, remove the checkpoint file if ingestion is complete.
-                if os.path.exists(CHECKPOINT_FILE):
-                    os.remove(CHECKPOINT_FILE)
+                if os.path.exists(checkpoint_file(media_type)):
+                    os.remove(checkpoint_file(media_type))
                 break
 
         except Exception as e:
@@ -192,6 +220,9 @@ def main():
             # The checkpoint remains so that you resume from the failed page.
     
     conn.close()
+    # Refresh the derived columns (display title, quality score, ...) for the new rows.
+    migrate()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Usage: python global_ingest.py [ANIME|MANGA]
+    main(sys.argv[1] if len(sys.argv) > 1 else "ANIME")
\ No newline at end of file
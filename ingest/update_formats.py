@@ -2,6 +2,8 @@ import sqlite3
 import requests
 import time
 
+from db.migrate_db import migrate
+
 ANILIST_API_URL = "https://graphql.anilist.co"
 
 def fetch_formats_from_anilist_batch(ids, retries: int = 3, initial_backoff: float = 5.0) -> dict:
@@ -90,6 +92,8 @@ def update_formats(db_path="anilist_global.db", batch_size: int = 50):
     
     conn.close()
     print(f"Updated format for {updated} records out of {total_records}.")
+    # format_norm and quality_score depend on the format.
+    migrate(db_path)
 
 if __name__ == "__main__":
     update_formats()
\ No newline at end of file
@@ -1,8 +1,32 @@
-# main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routers import query, recommendations, fuzzy_search
+from fastapi.concurrency import run_in_threadpool
+from routers import query, recommendations, fuzzy_search, admin
+from utils.retrieval import RetrievalEngine, set_engine, start_batcher, stop_batcher, start_reloader, stop_reloader
+from utils.execution import shutdown_cpu_executor
+from utils.catalog import start_catalog_refresher, stop_catalog_refresher
 
-app = FastAPI(title="AniList Recommender API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the encoder, FAISS index and id mapping once and share them across routers.
+    engine = await run_in_threadpool(lambda: RetrievalEngine().load())
+    set_engine(engine)
+    print("Retrieval engine loaded:", engine.stats())
+    start_batcher()
+    # Swap in newly published index versions without a restart.
+    start_reloader()
+    # Reload the parsed catalog when anilist_global.db changes.
+    start_catalog_refresher()
+    yield
+    stop_catalog_refresher()
+    stop_reloader()
+    stop_batcher()
+    shutdown_cpu_executor()
+    if engine.query_cache is not None:
+        engine.query_cache.close()  # commits pending query embedding writes
+    set_engine(None)
+
+app = FastAPI(title="AniList Recommender API", lifespan=lifespan)
 
 # Include the query endpoint router
 app.include_router(query.router, prefix="/query", tags=["query"])
@@ -13,6 +37,9 @@ app.include_router(recommendations.router, prefix="/recommendations", tags=["rec
 # Include the fuzzy search endpoint router
 app.include_router(fuzzy_search.router, prefix="/search", tags=["fuzzy_search"])
 
+# Include the admin endpoints (index version and hot reload)
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,42 @@
+# routers/admin.py
+from fastapi import APIRouter, HTTPException
+
+from utils.retrieval import get_engine, get_reloader, get_lexical_index
+from utils.versions import INDEX_VERSIONS_DIR, list_versions
+from utils.execution import run_cpu
+
+router = APIRouter()
+
+@router.get("/index")
+def index_status():
+    """
+    Reports the index version being served, when it was loaded, the published versions
+    on disk and the state of the background hot reloader.
+    """
+    engine = get_engine()
+    reloader = get_reloader()
+    return {
+        "active_version": engine.version,
+        "loaded_at": engine.loaded_at,
+        "load_seconds": round(engine.load_seconds, 3),
+        "vectors": engine.stats()["vectors"],
+        "reloadable": engine.reloadable,
+        "versions": list_versions(reloader.versions_dir if reloader is not None else INDEX_VERSIONS_DIR),
+        "reloader": reloader.stats() if reloader is not None else None,
+    }
+
+@router.post("/index/reload")
+async def reload_index():
+    """
+    Checks for a newly published index version now instead of waiting for the next poll,
+    retrying a version that previously failed to load. Also re-checks whether the keyword
+    index for hybrid search exists.
+    """
+    await run_cpu(get_lexical_index().refresh)
+    reloader = get_reloader()
+    if reloader is None:
+        raise HTTPException(status_code=409, detail="Index hot reload is disabled (INDEX_RELOAD_INTERVAL=0)")
+    reloaded = await run_cpu(reloader.check, True)
+    if reloader.last_error:
+        raise HTTPException(status_code=500, detail=reloader.last_error)
+    return {"reloaded": reloaded, "active_version": get_engine().version}
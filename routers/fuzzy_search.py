@@ -1,27 +1,32 @@
 from fastapi import APIRouter, HTTPException, Query
-import sqlite3
 from rapidfuzz import process, fuzz
-from functools import lru_cache
+
+from utils.catalog import get_catalog
+from utils.titles import preferred_title
 
 router = APIRouter()
 
-@lru_cache(maxsize=1)
+def catalog_titles(catalog) -> list:
+    """
+    (anime_id, title) for every titled entry of a catalog snapshot, where title is the
+    display_title materialized by db/migrate_db.py, or else title_english > title_romaji > title_native.
+    """
+    titles = []
+    for anime_id, info in catalog.info.items():
+        title = info.get("display_title") or preferred_title(
+            info.get("title_english"), info.get("title_romaji"), info.get("title_native")
+        )
+        if title:
+            titles.append((anime_id, title))
+    return titles
+
 def get_all_titles() -> list:
     """
-    Load all anime titles from the global database and cache them.
-    Each entry is a tuple: (anime_id, title), where title is chosen as:
-      title_english > title_romaji > title_native.
+    Returns the titles of the current catalog snapshot (see utils.catalog), built once per
+    snapshot and rebuilt by the catalog refresher after a re-ingest.
     """
     try:
-        conn = sqlite3.connect("anilist_global.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, title_romaji, title_english, title_native
-            FROM global_media
-        """)
-        rows = cursor.fetchall()
-        conn.close()
+        return get_catalog().derived("fuzzy_titles", catalog_titles)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -31,15 +36,6 @@ def get_all_titles() -> list:
                 'module': type(e).__module__
             }
         ) from e
-    finally:
-        conn.close()
-    
-    titles = []
-    for row in rows:
-        title = row["title_english"] or row["title_romaji"] or row["title_native"]
-        if title:
-            titles.append((row["id"], title))
-    return titles
 
 @router.get("/fuzzy",
     summary="Fuzzy search anime titles",
@@ -1,15 +1,32 @@
 # routers/query.py
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from typing import Optional, List
 from pydantic import BaseModel
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import asyncio
+import os
 
-from utils.db import load_global_anime_info, load_embeddings_cache
-from utils.retrieval import retrieve_similar_anime
-from utils.reranker import rerank_candidates_with_gemini
-from utils.quality import compute_quality_score
+from utils.db import get_global_anime_info
+from utils.catalog import get_catalog_cache
+from utils.retrieval import retrieve_similar_anime, fuse_candidates, hybrid_enabled, get_engine, get_batcher, get_lexical_index
+from utils.reranker import (
+    rerank_candidates_with_deadline,
+    rerank_stats,
+    get_rerank_cache,
+    record_rerank_path,
+    RERANK_PATH_LOCAL,
+    RERANK_PATH_NONE,
+)
+from utils.local_reranker import get_local_reranker
+from utils.quality import get_quality_table
 from utils.titles import get_english_title
+from utils.execution import (
+    AdmissionController,
+    run_cpu,
+    QUERY_MAX_CONCURRENCY,
+    QUERY_MAX_QUEUE,
+    QUERY_RETRY_AFTER_SECONDS,
+)
 
 router = APIRouter()
 
@@ -18,26 +35,52 @@ class Recommendation(BaseModel):
     title: str
     confidence: float
 
-# Load global metadata and embeddings once.
-global_anime_info = load_global_anime_info()
-embeddings_cache = load_embeddings_cache()
+# Global metadata and quality scores come from the shared catalog snapshot (see utils.catalog),
+# loaded here and refreshed in the background. The encoder and FAISS index live in the shared
+# retrieval engine (see utils.retrieval.get_engine), loaded at app startup.
+get_quality_table()
 
-# Use the same model that was used to generate the FAISS index.
-model = SentenceTransformer("all-mpnet-base-v2")
+# Latency budget for the Gemini rerank step. Past the deadline the endpoint answers with
+# the FAISS + quality-score ordering. RERANK_HEDGE_MS (optional) sends a second request
+# if the first has not answered in that time.
+RERANK_DEADLINE_MS = float(os.environ.get("RERANK_DEADLINE_MS", "1500"))
+RERANK_HEDGE_MS = float(os.environ["RERANK_HEDGE_MS"]) if os.environ.get("RERANK_HEDGE_MS") else None
+
+# Default rerank mode when a request does not pass ?rerank=: "gemini" (remote LLM),
+# "local" (in-process feature model, see utils/local_reranker.py) or "none".
+RERANK_MODES = ("gemini", "local", "none")
+RERANK_MODE = os.environ.get("RERANK_MODE") or "gemini"
+
+# Candidates sent to the reranker, as a multiple of top_n. Keyword fusion brings exact hits
+# near the top of the list, so hybrid retrieval gets by with a smaller pool than dense-only.
+DENSE_CANDIDATE_MULTIPLIER = int(os.environ.get("DENSE_CANDIDATE_MULTIPLIER") or 5)
+HYBRID_CANDIDATE_MULTIPLIER = int(os.environ.get("HYBRID_CANDIDATE_MULTIPLIER") or 3)
+
+admission = AdmissionController(QUERY_MAX_CONCURRENCY, QUERY_MAX_QUEUE, QUERY_RETRY_AFTER_SECONDS)
 
 def cosine_similarity(vec1, vec2):
     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
-@router.get("/", response_model=List[Recommendation])
-def query_recommendations(
-    q: str = Query(..., description="Your natural language query for anime recommendations"),
-    top_n: int = Query(10, description="Number of recommendations to return")
-):
-    # (1) Retrieve candidate anime IDs from FAISS.
-    candidate_ids = retrieve_similar_anime(q, top_k=top_n * 5)
-    print("DEBUG: Candidate IDs from FAISS:", candidate_ids)
-    
-    # (2) Build candidate details from global metadata.
+@router.get("/stats")
+def query_stats():
+    """
+    Reports retrieval engine load time, memory footprint, query-embedding cache
+    hit/miss counters, keyword search, micro-batching and catalog refresh statistics.
+    """
+    stats = get_engine().stats()
+    stats["lexical"] = get_lexical_index().stats()
+    batcher = get_batcher()
+    stats["batching"] = batcher.stats() if batcher is not None else None
+    stats["rerank"] = rerank_stats()
+    stats["admission"] = admission.stats()
+    stats["catalog"] = get_catalog_cache().stats()
+    return stats
+
+def build_candidates(candidate_ids: list) -> list:
+    """
+    Builds candidate details from global metadata for the re-ranking prompt.
+    """
+    global_anime_info = get_global_anime_info()
     candidates = []
     for cid in candidate_ids:
         info = global_anime_info.get(cid, {})
@@ -48,29 +91,93 @@ def query_recommendations(
             "average_score": info.get("average_score", 0),
             "popularity": info.get("popularity", 0)
         })
-    
-    # (3) Use Gemini to re-rank these candidates.
-    reranked_ids = rerank_candidates_with_gemini(q, candidates)
-    print("DEBUG: Reranked candidate IDs from Gemini:", reranked_ids)
-    
-    # (4) Re-order candidates based on Gemini’s re-ranking.
+    return candidates
+
+def rerank_locally(query: str, candidate_ids: list) -> list:
+    """
+    Orders all candidates with the local reranker. The query embedding comes from the query
+    cache (it was just computed for retrieval) and candidate embeddings from the engine's
+    memory-mapped artifacts.
+    """
+    engine = get_engine()
+    return get_local_reranker().rerank(query, engine.encode(query), candidate_ids, engine.item_vectors(candidate_ids))
+
+def rank_candidates(candidates: list, reranked_ids, top_n: int, keep_order: bool = False) -> List[Recommendation]:
+    # Re-order candidates based on Gemini’s re-ranking.
     id_to_candidate = {c["id"]: c for c in candidates}
-    reranked_candidates = [id_to_candidate[cid] for cid in reranked_ids if cid in id_to_candidate]
-    if not reranked_candidates:
-        reranked_candidates = candidates  # Fallback
-    
-    # (5) Optionally, adjust scores based on quality if needed.
-    # For example, you could re-compute a final score:
-    final_candidates = sorted(
-        reranked_candidates,
-        key=lambda c: compute_quality_score(global_anime_info.get(c["id"], {})),
-        reverse=True
-    )[:top_n]
-    
-    # (6) Build and return the response.
-    response_list = []
-    for candidate in final_candidates:
-        confidence = compute_quality_score(global_anime_info.get(candidate["id"], {})) * 100
-        response_list.append(Recommendation(id=candidate["id"], title=candidate["title"], confidence=confidence))
-    
-    return response_list
\ No newline at end of file
+    reranked = [cid for cid in reranked_ids or [] if cid in id_to_candidate]
+    if not reranked:
+        reranked = [c["id"] for c in candidates]  # Fallback: FAISS order, sorted by quality below
+        keep_order = False
+
+    quality = get_quality_table()
+    if keep_order:
+        # The local reranker already weighs score, popularity and format, so its order is kept.
+        top_ids = reranked[:top_n]
+        scores = quality.scores_for(top_ids)
+    else:
+        # Keep the top_n by precomputed quality score (ties keep the reranked order).
+        top_ids, scores = quality.rank(reranked, top_n)
+    # The quality scores become the confidence.
+    return [
+        Recommendation(id=cid, title=id_to_candidate[cid]["title"], confidence=score * 100)
+        for cid, score in zip(top_ids, scores.tolist())
+    ]
+
+@router.get("/", response_model=List[Recommendation])
+async def query_recommendations(
+    response: Response,
+    q: str = Query(..., description="Your natural language query for anime recommendations"),
+    top_n: int = Query(10, description="Number of recommendations to return"),
+    shards: Optional[str] = Query(None, description="Comma-separated search shards to restrict to, e.g. 'ANIME' or 'TV,MOVIE'"),
+    rerank: Optional[str] = Query(None, description="Rerank mode: 'gemini', 'local' or 'none' (default: RERANK_MODE)")
+):
+    rerank_mode = (rerank or RERANK_MODE).lower()
+    if rerank_mode not in RERANK_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown rerank mode '{rerank}'; choose one of {', '.join(RERANK_MODES)}")
+    shard_names = [name.strip().upper() for name in shards.split(",") if name.strip()] if shards else None
+
+    # CPU stages run on the dedicated executor; the batched search and the Gemini call are
+    # awaited on the event loop, so waiting never holds an executor thread.
+    # Requests beyond the admission queue are turned away with 503 + Retry-After.
+    async with admission:
+        # (1) Retrieve candidate anime IDs from FAISS, fused with keyword matches when available.
+        # One availability check per request, used for both the pool size and the retrieval mode.
+        hybrid = hybrid_enabled()
+        pool = top_n * (HYBRID_CANDIDATE_MULTIPLIER if hybrid else DENSE_CANDIDATE_MULTIPLIER)
+        try:
+            batcher = get_batcher()
+            if batcher is not None:
+                dense_ids = await asyncio.wrap_future(batcher.submit(q, pool, shard_names))
+            else:
+                dense_ids = await run_cpu(retrieve_similar_anime, q, pool, shard_names)
+            candidate_ids, retrieval_mode = await run_cpu(fuse_candidates, q, dense_ids, pool, shard_names, hybrid)
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=e.args[0] if e.args else "Unknown shard")
+        print("DEBUG: Candidate IDs from", retrieval_mode, "retrieval:", candidate_ids)
+        response.headers["X-Retrieval"] = retrieval_mode
+        
+        # (2) Build candidate details from global metadata.
+        candidates = build_candidates(candidate_ids)
+        
+        # (3) Re-rank these candidates: with Gemini within the latency budget, in-process
+        # with the local reranker, or not at all.
+        if rerank_mode == "gemini":
+            reranked_ids, rerank_path = await rerank_candidates_with_deadline(
+                q,
+                candidates,
+                deadline_seconds=RERANK_DEADLINE_MS / 1000.0,
+                hedge_after_seconds=RERANK_HEDGE_MS / 1000.0 if RERANK_HEDGE_MS is not None else None,
+                cache=get_rerank_cache(),
+            )
+        elif rerank_mode == "local":
+            reranked_ids, rerank_path = await run_cpu(rerank_locally, q, candidate_ids), RERANK_PATH_LOCAL
+            record_rerank_path(rerank_path)
+        else:
+            reranked_ids, rerank_path = None, RERANK_PATH_NONE
+            record_rerank_path(rerank_path)
+        print("DEBUG: Reranked candidate IDs:", reranked_ids, "path:", rerank_path)
+        response.headers["X-Rerank-Path"] = rerank_path
+        
+        # (4) Re-order and score the candidates, then build the response.
+        return await run_cpu(rank_candidates, candidates, reranked_ids, top_n, rerank_path == RERANK_PATH_LOCAL)
@@ -1,10 +1,21 @@
 # routers/recommendations.py
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from typing import Optional, List
 from pydantic import BaseModel
-from core.recommender.baseline_recommender import recommend_top_media, normalize_recommendations
+import os
+from core.recommender.baseline_recommender import (
+    get_ranking,
+    get_media_matrix,
+    data_version,
+    genre_filter,
+    normalize_recommendations,
+    encode_cursor,
+    decode_cursor,
+)
+from core.recommender.batch_recommend import load_precomputed
+from db.users import user_db_path
 from utils.titles import get_english_title
-from utils.db import load_global_anime_info
+from utils.db import get_global_anime_info
 
 router = APIRouter()
 
@@ -15,15 +26,72 @@ class Recommendation(BaseModel):
 
 @router.get("/", response_model=List[Recommendation])
 def recommendations_endpoint(
+    response: Response,
     desired_genre: Optional[str] = Query(None, description="Filter recommendations by a desired genre"),
-    top_n: int = Query(10, description="Number of recommendations to return")
+    genres: Optional[List[str]] = Query(None, description="Filter by several genres/tags (repeat the parameter)"),
+    genre_match: str = Query("any", description="Combine several genres with 'any' (OR) or 'all' (AND)"),
+    top_n: int = Query(10, description="Number of recommendations to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page, to fetch the next one"),
+    user: Optional[str] = Query(None, description="AniList user to recommend for (default: the single-user anilist_data.db)")
 ):
-    # Use your baseline recommendation logic.
-    raw_recommendations = recommend_top_media(top_n=top_n, desired_genre=desired_genre)
-    normalized_recs = normalize_recommendations(raw_recommendations)
-    
-    # Load global anime metadata to get titles.
-    global_anime_info = load_global_anime_info()
+    try:
+        personal_db_path = user_db_path(user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if user and not os.path.exists(personal_db_path):
+        raise HTTPException(status_code=404, detail=f"No list data for user '{user}'")
+    user = user.lower() if user else None
+
+    desired_genres = ([desired_genre] if desired_genre else []) + (genres or [])
+    try:
+        filter_key = genre_filter(desired_genres, genre_match)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    after = None
+    if cursor:
+        try:
+            page_cursor = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if page_cursor["genre_filter"] != filter_key:
+            raise HTTPException(status_code=400, detail="Cursor was issued for a different genre filter")
+        if page_cursor["user"] != user:
+            raise HTTPException(status_code=400, detail="Cursor was issued for a different user")
+        after = page_cursor["after"]
+
+    # A user's first unfiltered page comes from the nightly batch (core/recommender/batch_recommend.py)
+    # while it matches the current catalog and list; it has the exact scores a live ranking would.
+    precomputed = load_precomputed(user, personal_db_path, top_n) if user and not filter_key and not cursor else None
+    matrix = get_media_matrix()
+    if precomputed is not None and any(
+        row >= len(matrix.ids) or matrix.ids[row] != media_id for media_id, row, _ in precomputed[0]
+    ):
+        precomputed = None  # the served catalog snapshot is not the one the batch read yet
+    if precomputed is not None:
+        response.headers["X-Recommendations-Source"] = "precomputed"
+        items, eligible = precomputed
+        normalized_recs = normalize_recommendations(
+            [(matrix.media[row], score) for _, row, score in items], max_score=items[0][2] if items else None
+        )
+        if eligible > len(items) and items:
+            _, last_row, last_score = items[-1]
+            version = data_version(matrix, personal_db_path)
+            response.headers["X-Next-Cursor"] = encode_cursor(version, filter_key, (last_score, last_row), user)
+    else:
+        response.headers["X-Recommendations-Source"] = "live"
+        # Use your baseline recommendation logic. Later pages are cut from the cached ranking
+        # of the first page while the catalog and personal list are unchanged.
+        ranking = get_ranking(desired_genres, genre_match, personal_db_path)
+        if cursor and page_cursor["version"] != ranking.version:
+            raise HTTPException(status_code=410, detail="The recommendations changed since this cursor was issued; start again without a cursor")
+        raw_recommendations, next_after = ranking.page(top_n, after)
+        normalized_recs = normalize_recommendations(raw_recommendations, max_score=ranking.top_score)
+        if next_after is not None:
+            response.headers["X-Next-Cursor"] = encode_cursor(ranking.version, filter_key, next_after, user)
+
+    # Global anime metadata for titles, loaded once per process.
+    global_anime_info = get_global_anime_info()
     
     response_list = []
     for media, confidence in normalized_recs:
@@ -31,4 +99,4 @@ def recommendations_endpoint(
         title = get_english_title(info)
         response_list.append(Recommendation(id=media["id"], title=title, confidence=confidence))
     
-    return response_list
\ No newline at end of file
+    return response_list
@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+from fastapi import HTTPException
+from utils.execution import AdmissionController, run_cpu
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_rejects_once_queue_is_full(self):
+        async def scenario():
+            controller = AdmissionController(max_concurrency=1, max_queue=1, retry_after_seconds=7)
+            release = asyncio.Event()
+
+            async def hold():
+                async with controller:
+                    await release.wait()
+
+            running = asyncio.ensure_future(hold())
+            queued = asyncio.ensure_future(hold())
+            await asyncio.sleep(0)
+            self.assertEqual((controller.active, controller.waiting), (1, 1))
+
+            with self.assertRaises(HTTPException) as ctx:
+                async with controller:
+                    pass
+            self.assertEqual(ctx.exception.status_code, 503)
+            self.assertEqual(ctx.exception.headers["Retry-After"], "7")
+
+            release.set()
+            await asyncio.gather(running, queued)
+            self.assertEqual(controller.stats()["admitted"], 2)
+            self.assertEqual(controller.stats()["rejected"], 1)
+
+        asyncio.run(scenario())
+
+    def test_run_cpu(self):
+        self.assertEqual(asyncio.run(run_cpu(sum, [1, 2, 3])), 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+from utils.artifacts import write_artifacts, load_artifacts, load_ids, convert_pickle
+
+class TestEmbeddingArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "embeddings")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_is_memory_mapped(self):
+        vectors = np.arange(12, dtype=np.float64).reshape(3, 4)
+        write_artifacts(self.dir, [10, 20, 30], vectors, "test-model")
+
+        ids, loaded, manifest = load_artifacts(self.dir)
+        self.assertIsInstance(loaded, np.memmap)
+        self.assertEqual(loaded.dtype, np.float32)
+        self.assertEqual(ids.dtype, np.int64)
+        self.assertEqual(list(ids), [10, 20, 30])
+        np.testing.assert_array_equal(loaded, vectors.astype(np.float32))
+        self.assertEqual((manifest["rows"], manifest["dim"], manifest["model"]), (3, 4, "test-model"))
+
+    def test_ids_only(self):
+        write_artifacts(self.dir, [1, 2], np.zeros((2, 3)), "test-model")
+        self.assertEqual(list(load_ids(self.dir)), [1, 2])
+
+    def test_mismatched_rows_rejected(self):
+        with self.assertRaises(ValueError):
+            write_artifacts(self.dir, [1, 2, 3], np.zeros((2, 3)), "test-model")
+
+    def test_convert_both_pickle_layouts(self):
+        builder_pickle = os.path.join(self.tmp.name, "builder.pkl")
+        with open(builder_pickle, "wb") as f:
+            pickle.dump({"ids": [5, 6], "embeddings": np.ones((2, 3), dtype=np.float32)}, f)
+        manifest = convert_pickle(builder_pickle, self.dir)
+        self.assertEqual(manifest["rows"], 2)
+
+        dict_pickle = os.path.join(self.tmp.name, "dict.pkl")
+        with open(dict_pickle, "wb") as f:
+            pickle.dump({7: np.zeros(3), 8: np.ones(3)}, f)
+        convert_pickle(dict_pickle, self.dir)
+        ids, vectors, _ = load_artifacts(self.dir)
+        self.assertEqual(list(ids), [7, 8])
+        np.testing.assert_array_equal(vectors[1], np.ones(3, dtype=np.float32))
+
+if __name__ == '__main__':
+    unittest.main()
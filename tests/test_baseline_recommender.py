@@ -0,0 +1,132 @@
+import unittest
+import numpy as np
+
+from core.recommender.baseline_recommender import (
+    MediaMatrix,
+    RankingCache,
+    compute_similarity,
+    decode_cursor,
+    encode_cursor,
+    genre_filter,
+    rank_media,
+    score_media,
+)
+from core.recommender.benchmark_baseline import synthetic_catalog
+
+def loop_rank(catalog, preference, top_n, desired_genre, planned_ids, watched_ids):
+    """
+    The per-item loop recommend_top_media ran before the catalog was compiled into a matrix.
+    """
+    recommendations = []
+    for media in catalog:
+        if media["id"] in watched_ids:
+            continue
+        genres_lower = [g.lower() for g in media["genres"]]
+        tags_lower = [tag.get("name", "").lower() if isinstance(tag, dict) else tag.lower() for tag in media["tags"]]
+        if desired_genre and desired_genre.lower() not in genres_lower and desired_genre.lower() not in tags_lower:
+            continue
+        sim = compute_similarity(media, preference)
+        if desired_genre:
+            if desired_genre.lower() in genres_lower:
+                sim *= 1.2
+            elif desired_genre.lower() in tags_lower:
+                sim *= 1.1
+        if media["id"] in planned_ids:
+            sim *= 1.5
+        recommendations.append((media, sim))
+    return sorted(recommendations, key=lambda r: r[1], reverse=True)[:top_n]
+
+class TestMediaMatrix(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.catalog = synthetic_catalog(2000, seed=2)
+        # A genre also used as a tag, plain-string tags and items without features.
+        self.catalog[0]["tags"].append({"name": "Genre 1", "rank": 70})
+        self.catalog[1]["tags"] = ["Tag 7", "genre 2"]
+        self.catalog[2].update(genres=[], tags=[], average_score=None, popularity=None)
+        # Non-integer weights so that any change in summation order would show up.
+        self.preference = {f"Genre {g}": float(rng.random() * 9) for g in range(20)}
+        self.preference.update({f"Tag {t}": float(rng.random() * 9) for t in range(0, 400, 3)})
+        self.preference["Unknown"] = 5.0
+
+    def test_scores_are_identical_to_compute_similarity(self):
+        scores = MediaMatrix(self.catalog).scores(self.preference)
+        expected = [compute_similarity(media, self.preference) for media in self.catalog]
+        self.assertEqual(scores.tolist(), expected)
+
+    def test_rank_media_matches_the_loop(self):
+        matrix = MediaMatrix(self.catalog)
+        planned = {m["id"] for m in self.catalog[::7]}
+        watched = {m["id"] for m in self.catalog[::5]}
+        for desired_genre in (None, "genre 2", "TAG 7", "Genre 1", "Missing"):
+            expected = loop_rank(self.catalog, self.preference, 25, desired_genre, planned, watched)
+            actual = rank_media(matrix, self.preference, 25, desired_genre, planned, watched)
+            self.assertEqual([(m["id"], s) for m, s in actual], [(m["id"], s) for m, s in expected], desired_genre)
+
+    def test_multi_genre_filters(self):
+        matrix = MediaMatrix(self.catalog)
+        def names(media):
+            return {g.lower() for g in media["genres"]} | {(t.get("name", "") if isinstance(t, dict) else t).lower() for t in media["tags"]}
+        wanted = ["genre 1", "TAG 7"]
+        for match, keep in (("any", lambda m: names(m) & {"genre 1", "tag 7"}), ("all", lambda m: {"genre 1", "tag 7"} <= names(m))):
+            ranked = rank_media(matrix, self.preference, len(self.catalog), wanted, genre_match=match)
+            self.assertTrue(ranked)
+            self.assertEqual({m["id"] for m, _ in ranked}, {m["id"] for m in self.catalog if keep(m)}, match)
+            for media, score in ranked:
+                genres = {g.lower() for g in media["genres"]}
+                boost = 1.2 if genres & {"genre 1", "tag 7"} else 1.1
+                self.assertEqual(score, compute_similarity(media, self.preference) * boost)
+        # One name is the same filter whatever the match mode.
+        self.assertEqual(genre_filter(["Genre 1"], "all"), genre_filter("genre 1"))
+        self.assertIsNone(genre_filter([]))
+        with self.assertRaises(ValueError):
+            genre_filter("Action", "most")
+
+    def test_empty_catalog(self):
+        self.assertEqual(rank_media(MediaMatrix([]), self.preference, 10, "Action"), [])
+
+class TestPagination(unittest.TestCase):
+
+    def test_pages_concatenate_to_the_full_ranking(self):
+        catalog = synthetic_catalog(500, genres=5, tags=16, seed=4)  # few features, many ties
+        for media in catalog:
+            media.update(average_score=0, popularity=0)
+        preference = {"Genre 0": 2, "Genre 1": 1, "Tag 2": 3}
+        matrix = MediaMatrix(catalog)
+        expected = rank_media(matrix, preference, top_n=len(catalog), desired_genre="genre 1", watched_ids={1, 2})
+
+        ranking = score_media(matrix, preference, desired_genre="genre 1", watched_ids={1, 2}, version="v1")
+        pages, after = [], None
+        while True:
+            cursor = encode_cursor(ranking.version, genre_filter("genre 1"), after) if after else None
+            if cursor:
+                decoded = decode_cursor(cursor)
+                self.assertEqual(decoded["version"], "v1")
+                self.assertEqual(decoded["genre_filter"], genre_filter("Genre 1"))
+                self.assertEqual(decoded["after"], after)
+            items, after = ranking.page(37, after)
+            pages.extend(items)
+            if after is None:
+                break
+        self.assertEqual([(m["id"], s) for m, s in pages], [(m["id"], s) for m, s in expected])
+        self.assertEqual(ranking.top_score, expected[0][1])
+
+    def test_malformed_cursor(self):
+        for cursor in ("", "not-a-cursor", encode_cursor("v", None, (1.0, 2))[:-3]):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_ranking_cache(self):
+        cache = RankingCache(ttl_seconds=60, max_entries=2)
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cache.get_or_compute("v1", genre_filter("Action"), compute), 1)
+        self.assertEqual(cache.get_or_compute("v1", genre_filter(["action"], "all"), compute), 1)
+        self.assertEqual(cache.get_or_compute("v2", genre_filter("Action"), compute), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.ttl_seconds = -1
+        self.assertEqual(cache.get_or_compute("v2", genre_filter("Action"), compute), 3)
+
+if __name__ == '__main__':
+    unittest.main()
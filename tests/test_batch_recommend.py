@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import numpy as np
+
+from core.recommender.baseline_recommender import MediaMatrix, score_media
+from core.recommender.batch_recommend import batch_rankings, load_precomputed, precompute
+from core.recommender.benchmark_baseline import synthetic_catalog
+from db.user_profile import UserProfile, load_profile
+from db.users import list_users, user_db_path
+from utils.catalog import CatalogCache
+
+def make_global_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+        "genres TEXT, tags TEXT, average_score INTEGER, popularity INTEGER, rankings TEXT, format TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO global_media (id, title_romaji, genres, tags, average_score, popularity, rankings, format) "
+        "VALUES (?, ?, ?, ?, ?, ?, '[]', 'TV')",
+        [
+            (i, f"Romaji {i}", json.dumps(["Action"] if i % 2 else ["Drama"]), json.dumps([{"name": "Vampire", "rank": 80}] if i % 3 else []), 50 + i, 100 * i)
+            for i in rows
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+def make_user_db(path, entries):
+    # Schema of ingest/anilist.py's init_db.
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+        "episodes INTEGER, description TEXT, genres TEXT, tags TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE media_list_entries (id INTEGER PRIMARY KEY AUTOINCREMENT, media_id INTEGER, list_name TEXT, "
+        "status TEXT, score REAL, progress INTEGER, repeat INTEGER)"
+    )
+    for media_id, genres, status, score in entries:
+        conn.execute("INSERT OR IGNORE INTO media (id, genres, tags) VALUES (?, ?, '[]')", (media_id, json.dumps(genres)))
+        conn.execute(
+            "INSERT INTO media_list_entries (media_id, list_name, status, score) VALUES (?, 'list', ?, ?)",
+            (media_id, status, score),
+        )
+    conn.commit()
+    conn.close()
+
+class TestBatchScoring(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = synthetic_catalog(1500, seed=4)
+        rng = np.random.default_rng(5)
+        self.profiles = []
+        for _ in range(7):
+            preference = {f"Genre {g}": float(rng.random() * 9) for g in range(20) if rng.random() < 0.6}
+            preference.update({f"Tag {t}": float(rng.random() * 9) for t in range(0, 400, 5) if rng.random() < 0.5})
+            ids = [m["id"] for m in self.catalog]
+            planned = set(rng.choice(ids, 30, replace=False).tolist())
+            watched = set(rng.choice(ids, 60, replace=False).tolist())
+            self.profiles.append(UserProfile(preference, planned, watched))
+        self.profiles.append(UserProfile({}, set(), set()))
+
+    def test_batch_scores_are_identical_to_single_user_scores(self):
+        matrix = MediaMatrix(self.catalog)
+        scores = matrix.batch_scores([p.preference for p in self.profiles])
+        self.assertEqual(scores.shape, (len(self.catalog), len(self.profiles)))
+        for j, profile in enumerate(self.profiles):
+            self.assertEqual(scores[:, j].tolist(), matrix.scores(profile.preference).tolist())
+        self.assertEqual(matrix.batch_scores([]).shape, (len(self.catalog), 0))
+
+    def test_batch_rankings_match_score_media(self):
+        matrix = MediaMatrix(self.catalog)
+        rankings = list(batch_rankings(matrix, self.profiles, batch_size=3))
+        self.assertEqual(len(rankings), len(self.profiles))
+        for ranking, profile in zip(rankings, self.profiles):
+            expected = score_media(matrix, profile.preference, planned_ids=profile.planned_ids, watched_ids=profile.watched_ids)
+            self.assertEqual(ranking.rows.tolist(), expected.rows.tolist())
+            self.assertEqual(ranking.scores.tolist(), expected.scores.tolist())
+            self.assertEqual(ranking.page(20), expected.page(20))
+
+class TestUsers(unittest.TestCase):
+
+    def test_user_db_path(self):
+        self.assertEqual(user_db_path(None), "anilist_data.db")
+        self.assertEqual(user_db_path("Some_User-1", "data"), os.path.join("data", "some_user-1.db"))
+        for name in ("../etc", "a/b", "a.b", "x" * 65, " "):
+            with self.assertRaises(ValueError):
+                user_db_path(name)
+
+    def test_list_users(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.assertEqual(list_users(os.path.join(data_dir, "missing")), [])
+            for name in ("bob.db", "alice.db", "notes.txt", "bad name.db"):
+                open(os.path.join(data_dir, name), "w").close()
+            self.assertEqual(list_users(data_dir), ["alice", "bob"])
+
+class TestPrecomputed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.global_db = os.path.join(self.tmp.name, "global.db")
+        self.data_dir = os.path.join(self.tmp.name, "users")
+        self.output = os.path.join(self.tmp.name, "precomputed.db")
+        os.makedirs(self.data_dir)
+        make_global_db(self.global_db, range(1, 31))
+        make_user_db(user_db_path("alice", self.data_dir), [(1, ["Action"], "COMPLETED", 9), (4, ["Drama"], "PLANNING", None)])
+        make_user_db(user_db_path("bob", self.data_dir), [(2, ["Drama"], "COMPLETED", 10)])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, user, top_n):
+        return load_precomputed(user, user_db_path(user, self.data_dir), top_n, self.global_db, self.output)
+
+    def test_round_trip_matches_the_live_ranking(self):
+        self.assertIsNone(self.load("alice", 5))
+        self.assertEqual(precompute(["alice", "Bob"], 10, 1, self.global_db, self.data_dir, self.output), 2)
+
+        items, eligible = self.load("alice", 5)
+        self.assertEqual(eligible, 29)  # media 1 is watched
+        self.assertEqual(len(items), 5)
+        self.assertIsNotNone(self.load("bob", 10))
+        self.assertIsNone(self.load("bob", 11))  # only the top 10 were stored
+
+        matrix = MediaMatrix(CatalogCache(self.global_db, 0).get().media)
+        profile = load_profile(user_db_path("alice", self.data_dir))
+        live = score_media(matrix, profile.preference, planned_ids=profile.planned_ids, watched_ids=profile.watched_ids)
+        rows, scores, _ = live.select(5)
+        self.assertEqual(items, [(int(matrix.ids[r]), int(r), float(s)) for r, s in zip(rows, scores)])
+
+    def test_changes_make_results_stale(self):
+        precompute(["alice", "bob"], 10, 64, self.global_db, self.data_dir, self.output)
+        time.sleep(0.01)
+        conn = sqlite3.connect(user_db_path("alice", self.data_dir))
+        conn.execute("INSERT INTO media_list_entries (media_id, status, score) VALUES (6, 'COMPLETED', 8)")
+        conn.commit()
+        conn.close()
+        self.assertIsNone(self.load("alice", 5))
+        self.assertIsNotNone(self.load("bob", 5))
+
+        conn = sqlite3.connect(self.global_db)
+        conn.execute("UPDATE global_media SET popularity = 1 WHERE id = 3")
+        conn.commit()
+        conn.close()
+        self.assertIsNone(self.load("bob", 5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import unittest
+from utils.batching import QueryBatcher
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+
+    def search_batch(self, queries, k, shards=None):
+        self.calls.append((list(queries), k))
+        return [[len(q) * 10 + i for i in range(k)] for q in queries]
+
+class TestQueryBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = FakeEngine()
+        self.batcher = QueryBatcher(lambda: self.engine, max_batch=8, max_wait_ms=200).start()
+
+    def tearDown(self):
+        self.batcher.stop()
+
+    def test_concurrent_requests_share_one_batch(self):
+        futures = [self.batcher.submit("q" * n, k=n) for n in range(1, 5)]
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(len(self.engine.calls), 1)
+        queries, k = self.engine.calls[0]
+        self.assertEqual(queries, ["q", "qq", "qqq", "qqqq"])
+        self.assertEqual(k, 4)
+        # Each caller gets its own results, truncated to the k it asked for.
+        self.assertEqual(results[0], [10])
+        self.assertEqual(results[2], [30, 31, 32])
+
+    def test_awaiting_from_the_event_loop_batches_without_threads(self):
+        # /query awaits the batcher future on the event loop instead of blocking an executor thread.
+        async def run():
+            return await asyncio.gather(*(asyncio.wrap_future(self.batcher.submit("q" * n, k=1)) for n in range(1, 9)))
+        results = asyncio.run(run())
+        self.assertEqual(len(self.engine.calls), 1)
+        self.assertEqual(len(self.engine.calls[0][0]), 8)
+        self.assertEqual(results[7], [80])
+
+    def test_batch_size_is_capped(self):
+        barrier = threading.Barrier(10)
+        results = []
+
+        def worker(i):
+            barrier.wait()
+            results.append(self.batcher.search(f"query {i}", 1, timeout=5))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(len(queries) <= 8 for queries, _ in self.engine.calls))
+        self.assertEqual(self.batcher.stats()["requests"], 10)
+
+    def test_errors_propagate_to_callers(self):
+        def broken(queries, k, shards=None):
+            raise RuntimeError("index unavailable")
+        self.engine.search_batch = broken
+        with self.assertRaises(RuntimeError):
+            self.batcher.search("q", 1, timeout=5)
+
+    def test_shard_selections_are_searched_separately(self):
+        seen = []
+        original = self.engine.search_batch
+
+        def recording(queries, k, shards=None):
+            seen.append((tuple(queries), tuple(shards) if shards else None))
+            return original(queries, k, shards)
+        self.engine.search_batch = recording
+
+        futures = [
+            self.batcher.submit("a", 1),
+            self.batcher.submit("b", 1, shards=["TV"]),
+            self.batcher.submit("c", 1),
+        ]
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual(sorted(seen, key=str), sorted([(("a", "c"), None), (("b",), ("TV",))], key=str))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from core.recommender.baseline_recommender import MediaMatrix, get_global_media
+from core.search import build_faiss_index
+from db.migrate_db import migrate
+from routers.fuzzy_search import catalog_titles
+from utils.catalog import Catalog, CatalogCache
+from utils.db import load_global_anime_info
+from utils.local_reranker import catalog_entries, load_catalog
+
+def make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+        "genres TEXT, tags TEXT, average_score INTEGER, popularity INTEGER, rankings TEXT, format TEXT)"
+    )
+    insert_rows(conn, rows)
+    conn.close()
+
+def insert_rows(conn, rows):
+    conn.executemany(
+        "INSERT INTO global_media (id, title_romaji, genres, tags, average_score, popularity, rankings, format) "
+        "VALUES (?, ?, ?, ?, 70, 1000, '[]', 'TV')",
+        [(i, f"Romaji {i}", json.dumps(["Action"]), json.dumps([{"name": "Vampire", "rank": 80}]) if i % 2 else None) for i in rows],
+    )
+    conn.commit()
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "global.db")
+        make_db(self.db_path, range(1, 6))
+        self.cache = CatalogCache(self.db_path, interval_seconds=0)
+
+    def tearDown(self):
+        self.cache.stop()
+        self.tmp.cleanup()
+
+    def test_loads_once_and_matches_get_global_media(self):
+        catalog = self.cache.get()
+        self.assertIs(self.cache.get(), catalog)
+        self.assertEqual(catalog.media, get_global_media(self.db_path))
+        self.assertEqual(catalog.info[1]["tags"], [{"name": "Vampire", "rank": 80}])
+        builds = []
+        build = lambda c: builds.append(1) or len(c.info)
+        self.assertEqual(catalog.derived("size", build), 5)
+        self.assertEqual(catalog.derived("size", build), 5)
+        self.assertEqual(len(builds), 1)
+        self.assertFalse(self.cache.check())
+
+    def test_refreshes_on_commit_and_rebuilds_derived(self):
+        old = self.cache.get()
+        old.derived("size", lambda c: len(c.info))
+        conn = sqlite3.connect(self.db_path)
+        insert_rows(conn, [6])
+        conn.close()
+
+        self.assertTrue(self.cache.check())
+        new = self.cache.get()
+        self.assertIsNot(new, old)
+        self.assertEqual(new._derived["size"][1], 6)  # built before the swap
+        self.assertEqual(len(old.info), 5)  # requests holding the old snapshot are unaffected
+        self.assertFalse(self.cache.check())
+
+    def test_detects_a_replaced_file_in_the_background(self):
+        self.cache.get()
+        replacement = os.path.join(self.tmp.name, "new.db")
+        make_db(replacement, range(1, 9))
+        os.replace(replacement, self.db_path)
+        self.cache.interval = 0.02
+        self.cache.start()
+        deadline = time.time() + 5
+        while self.cache.refreshes == 0 and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(len(self.cache.get().info), 8)
+
+    def test_request_path_readers_are_built_from_the_snapshot(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""UPDATE global_media SET rankings = '[{"type": "RATED", "rank": 5}]', format = 'MOVIE' WHERE id = 2""")
+        conn.commit()
+        conn.close()
+        self.assertEqual(catalog_entries(self.cache.get()), load_catalog(self.db_path))
+        migrate(self.db_path)  # the snapshot then carries best_tv_rank instead of rankings
+        self.cache.check()
+        self.assertEqual(catalog_entries(self.cache.get()), load_catalog(self.db_path))
+
+        self.assertEqual(catalog_titles(self.cache.get()), [(i, f"Romaji {i}") for i in range(1, 6)])
+        conn = sqlite3.connect(self.db_path)
+        insert_rows(conn, [6])
+        conn.close()
+        self.cache.get().derived("fuzzy_titles", catalog_titles)
+        self.assertTrue(self.cache.check())
+        self.assertEqual(self.cache.get()._derived["fuzzy_titles"][1][-1], (6, "Romaji 6"))
+
+class TestMixedMediaTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "global.db")
+        make_db(self.db_path, range(1, 7))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ALTER TABLE global_media ADD COLUMN type TEXT")
+        # 1-3 are anime, 4 predates the type column (anime), 5-6 are manga.
+        conn.execute("UPDATE global_media SET type = 'ANIME' WHERE id <= 3")
+        conn.execute("UPDATE global_media SET type = 'MANGA', format = 'MANGA' WHERE id >= 5")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_catalog_and_recommender_read_anime_by_default(self):
+        catalog = CatalogCache(self.db_path, interval_seconds=0).get()
+        self.assertEqual(sorted(catalog.info), [1, 2, 3, 4])  # also what the quality table scores
+        self.assertEqual(catalog.info[4]["type"], "ANIME")
+        self.assertEqual([m["id"] for m in catalog.media], [1, 2, 3, 4])
+        self.assertEqual(get_global_media(self.db_path), catalog.media)
+
+        with mock.patch.object(build_faiss_index, "DB_PATH", self.db_path):
+            with build_faiss_index.stream_anime_data() as stream:
+                self.assertEqual([i for ids, _ in stream for i in ids], [1, 2, 3, 4])
+            with build_faiss_index.stream_anime_data(media_types=None) as stream:
+                self.assertEqual(stream.rows, 6)  # shards cover every type
+
+    def test_other_types_are_served_but_never_recommended(self):
+        info = load_global_anime_info(self.db_path, with_tags=True, media_types=("ANIME", "MANGA"))
+        self.assertEqual(sorted(info), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(info[5]["type"], "MANGA")
+        catalog = Catalog(info)
+        self.assertEqual(MediaMatrix(catalog.media).ids.tolist(), [1, 2, 3, 4])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import faiss
+import torch
+
+from utils.artifacts import write_artifacts
+from utils.encoders import ENCODERS, check_index_encoder, get_encoder_spec, quantize_int8
+from utils.retrieval import RetrievalEngine
+from utils.versions import INDEX_FILE, create_staging, new_version, publish_version
+from core.search.build_faiss_index import built_encoder_name
+
+class FakeModel:
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+def publish_index(versions_dir, encoder, dim=8):
+    vectors = np.random.default_rng(0).normal(size=(10, dim)).astype(np.float32)
+    version = new_version(versions_dir)
+    staging = create_staging(version, versions_dir)
+    extra = {"encoder": encoder.to_manifest(dim), "index": {"factory": "Flat", "id_mapped": False}}
+    write_artifacts(staging, np.arange(10), vectors, encoder.model, extra=extra)
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(staging, INDEX_FILE))
+    publish_version(version, versions_dir)
+    return version
+
+class TestEncoders(unittest.TestCase):
+
+    def test_registry_lookup(self):
+        self.assertEqual(get_encoder_spec("mpnet-int8").model, get_encoder_spec("mpnet").model)
+        self.assertEqual(get_encoder_spec("mpnet-int8").backend, "int8")
+        with self.assertRaises(ValueError):
+            get_encoder_spec("bert-huge")
+
+    def test_backends_of_the_same_model_are_compatible(self):
+        manifest = {"model": "all-mpnet-base-v2", "dim": 768, "encoder": ENCODERS["mpnet"].to_manifest(768)}
+        for name in ("mpnet", "mpnet-int8", "mpnet-onnx"):
+            check_index_encoder(ENCODERS[name], 768, manifest)
+
+    def test_mismatched_model_or_dim_is_rejected(self):
+        manifest = {"model": "all-mpnet-base-v2", "dim": 768, "encoder": ENCODERS["mpnet"].to_manifest(768)}
+        with self.assertRaises(ValueError):
+            check_index_encoder(ENCODERS["minilm"], 384, manifest)
+        with self.assertRaises(ValueError):
+            check_index_encoder(ENCODERS["mpnet"], 384, manifest)
+        with self.assertRaises(ValueError):
+            check_index_encoder(ENCODERS["mpnet"], 384, None, index_dim=768)
+
+    def test_legacy_manifests_are_checked_by_model(self):
+        legacy = {"model": "all-mpnet-base-v2", "dim": 768}
+        check_index_encoder(ENCODERS["mpnet-int8"], 768, legacy)
+        with self.assertRaises(ValueError):
+            check_index_encoder(ENCODERS["minilm"], 768, legacy)
+        self.assertEqual(built_encoder_name(legacy), "mpnet")
+
+    def test_quantize_int8_replaces_linear_layers(self):
+        model = torch.nn.Sequential(torch.nn.Linear(16, 32), torch.nn.ReLU(), torch.nn.Linear(32, 4))
+        quantized = quantize_int8(model)
+        self.assertFalse(any(type(m) is torch.nn.Linear for m in quantized.modules()))
+        x = torch.randn(3, 16)
+        self.assertTrue(torch.allclose(quantized(x), model(x), atol=0.1))
+
+    def test_engine_refuses_index_built_with_another_model(self):
+        with tempfile.TemporaryDirectory() as versions_dir:
+            version = publish_index(versions_dir, ENCODERS["minilm"])
+            engine = RetrievalEngine(encoder="mpnet", shard_dir=None, versions_dir=versions_dir, version=version)
+            with self.assertRaisesRegex(ValueError, "minilm"):
+                engine.load(model=FakeModel(8))
+
+            engine = RetrievalEngine(encoder="minilm-int8", shard_dir=None, versions_dir=versions_dir, version=version)
+            engine.load(model=FakeModel(8))
+            self.assertEqual(engine.stats()["backend"], "int8")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from core.search import generate_embeddings
+from core.search.encoding import encode_texts, encode_stream, EncodeCheckpoint, input_fingerprint
+from utils.artifacts import load_artifacts
+
+class FakeModel:
+    """
+    Encodes a text as [len(text)] * dim and records how many texts it saw.
+    """
+
+    def __init__(self, dim=4, fail_on=None, stop_after=None):
+        self.dim = dim
+        self.fail_on = fail_on
+        self.stop_after = stop_after
+        self.encoded = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else texts
+        if self.stop_after is not None and self.encoded >= self.stop_after:
+            raise KeyboardInterrupt
+        if self.fail_on in batch:
+            raise ValueError("bad row")
+        self.encoded += len(batch)
+        out = np.array([[len(t)] * self.dim for t in batch], dtype=np.float32)
+        return out[0] if single else out
+
+class TestEncodeTexts(unittest.TestCase):
+
+    def test_batches_into_preallocated_matrix(self):
+        texts = ["a" * n for n in range(1, 11)]
+        ids, vectors = encode_texts(FakeModel(), list(range(10)), texts, batch_size=4, chunk_size=4)
+        self.assertEqual(ids, list(range(10)))
+        self.assertEqual(vectors.shape, (10, 4))
+        self.assertEqual(vectors[:, 0].tolist(), list(range(1, 11)))
+
+    def test_failed_rows_are_dropped(self):
+        texts = ["a", "bb", "bad", "dddd"]
+        ids, vectors = encode_texts(FakeModel(fail_on="bad"), [1, 2, 3, 4], texts, chunk_size=2)
+        self.assertEqual(ids, [1, 2, 4])
+        self.assertEqual(vectors[:, 0].tolist(), [1, 2, 4])
+
+    def test_resumes_from_checkpoint(self):
+        texts = ["a" * n for n in range(1, 9)]
+        ids = list(range(8))
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint_dir = os.path.join(tmp, "ckpt")
+            with self.assertRaises(KeyboardInterrupt):
+                encode_texts(FakeModel(stop_after=4), ids, texts, model_name="m", chunk_size=2, checkpoint_dir=checkpoint_dir)
+
+            resumed = FakeModel()
+            out_ids, vectors = encode_texts(resumed, ids, texts, model_name="m", chunk_size=2, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(resumed.encoded, 4)  # Only the unfinished half was re-encoded.
+            self.assertEqual(out_ids, ids)
+            self.assertEqual(vectors[:, 0].tolist(), list(range(1, 9)))
+            self.assertFalse(os.path.exists(checkpoint_dir))
+
+    def test_streamed_resume_reencodes_rows_that_changed(self):
+        texts = ["a" * n for n in range(1, 9)]
+        ids = list(range(8))
+        chunks = lambda texts: ((ids[i:i + 2], texts[i:i + 2]) for i in range(0, 8, 2))
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint_dir = os.path.join(tmp, "ckpt")
+            with self.assertRaises(KeyboardInterrupt):
+                encode_stream(FakeModel(stop_after=4), chunks(texts), 8, model_name="m", checkpoint_dir=checkpoint_dir)
+
+            # Row 1 changed between runs; only it and the unfinished rows are encoded.
+            texts[1] = "z" * 9
+            resumed = FakeModel()
+            out_ids, vectors, hashes = encode_stream(resumed, chunks(texts), 8, model_name="m", checkpoint_dir=checkpoint_dir)
+            self.assertEqual(resumed.encoded, 5)
+            self.assertEqual(out_ids, ids)
+            self.assertEqual(vectors[:, 0].tolist(), [1, 9, 3, 4, 5, 6, 7, 8])
+            self.assertEqual(len(hashes), 8)
+
+    def test_checkpoint_for_different_input_is_discarded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = EncodeCheckpoint(tmp, 4, 2, input_fingerprint([1], ["a"]), "m")
+            first.open()
+            first.rows_done = 2
+            first.save()
+
+            other = EncodeCheckpoint(tmp, 4, 2, input_fingerprint([1], ["b"]), "m")
+            other.open()
+            self.assertEqual(other.rows_done, 0)
+
+class TestGenerateEmbeddings(unittest.TestCase):
+
+    def test_writes_artifacts_apart_from_the_index(self):
+        self.assertNotEqual(generate_embeddings.DESCRIPTION_ARTIFACT_DIR, "embeddings")
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "global.db")
+            conn = sqlite3.connect(db_path)
+            conn.execute(
+                "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_english TEXT, title_romaji TEXT, "
+                "title_native TEXT, description TEXT, genres TEXT, tags TEXT)"
+            )
+            conn.executemany(
+                "INSERT INTO global_media (id, title_english, description, genres, tags) VALUES (?, ?, ?, '[]', '[]')",
+                [(7, "Frieren", "An elf mage."), (9, "Mushishi", None)],
+            )
+            conn.commit()
+            conn.close()
+
+            artifact_dir = os.path.join(tmp, "out")
+            with mock.patch.object(generate_embeddings, "load_encoder", return_value=FakeModel()):
+                manifest = generate_embeddings.generate_embeddings(artifact_dir=artifact_dir, global_db_path=db_path)
+            ids, vectors, loaded = load_artifacts(artifact_dir)
+            self.assertEqual(ids.tolist(), [7, 9])
+            self.assertEqual(vectors.shape, (2, 4))
+            self.assertEqual(loaded["encoder"], manifest["encoder"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import faiss
+
+from utils.artifacts import content_hash, write_artifacts, load_hashes, load_manifest
+from utils.shards import labels_to_ids
+from core.search.index_specs import build_index, update_index
+from utils.versions import current_path, INDEX_FILE
+import core.search.build_faiss_index as builder
+
+def random_vectors(rows, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+
+class HashModel:
+    """
+    Encodes a text as a deterministic pseudo-random vector and counts the texts it saw.
+    """
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.encoded = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else texts
+        self.encoded += len(batch)
+        out = np.stack([random_vectors(1, self.dim, content_hash(t) % (2 ** 32))[0] for t in batch])
+        return out[0] if single else out
+
+class TestIncrementalIndex(unittest.TestCase):
+
+    def test_content_hash_is_stable_and_text_sensitive(self):
+        self.assertEqual(content_hash("Title: A."), content_hash("Title: A."))
+        self.assertNotEqual(content_hash("Title: A."), content_hash("Title: B."))
+        self.assertLess(content_hash("x"), 2 ** 64)
+
+    def test_id_mapped_indexes_return_anime_ids(self):
+        vectors = random_vectors(300)
+        ids = np.arange(300, dtype=np.int64) * 7 + 1000
+        for spec in ("flat", "ivf-flat", "hnsw"):
+            index, _, _ = build_index(vectors, spec, ids=ids, nlist=4, M=8)
+            if spec == "ivf-flat":
+                faiss.extract_index_ivf(index).nprobe = 4
+            _, labels = index.search(vectors[:5], 1)
+            np.testing.assert_array_equal(labels_to_ids(labels, ids, id_mapped=True)[:, 0], ids[:5])
+
+    def test_update_index_replaces_and_removes_vectors(self):
+        vectors = random_vectors(300)
+        ids = np.arange(300, dtype=np.int64) + 1
+        replacement = random_vectors(2, seed=1)
+        all_ids = ids[1:]
+        all_vectors = vectors[1:].copy()
+        all_vectors[:2] = replacement  # ids 2 and 3 change; id 1 is deleted
+
+        for spec in ("flat", "ivf-flat", "hnsw"):
+            index, factory, _ = build_index(vectors, spec, ids=ids, nlist=4, M=8)
+            index = update_index(index, factory, [1, 2, 3], [2, 3], replacement, all_ids, all_vectors)
+            if spec == "ivf-flat":
+                faiss.extract_index_ivf(index).nprobe = 4
+            self.assertEqual(index.ntotal, 299, spec)
+            _, labels = index.search(replacement, 1)
+            self.assertEqual(labels[:, 0].tolist(), [2, 3], spec)
+            _, labels = index.search(vectors[:1], 5)
+            self.assertNotIn(1, labels[0].tolist(), spec)
+
+    def test_transform_prefixed_ivf_keeps_ids_after_removal(self):
+        vectors = random_vectors(400, dim=16)
+        ids = np.arange(400, dtype=np.int64) + 1000
+        for spec in ("OPQ4,IVF8,Flat", "PCA8,IVF8,Flat"):
+            index, factory, _ = build_index(vectors, spec, ids=ids)
+            self.assertNotIsInstance(index, faiss.IndexIDMap2, spec)
+            faiss.extract_index_ivf(index).nprobe = 8
+            index = update_index(index, factory, [1000, 1001], [], np.zeros((0, 16), np.float32), ids[2:], vectors[2:])
+            self.assertEqual(index.ntotal, 398, spec)
+            _, labels = index.search(vectors[5:6], 1)
+            self.assertEqual(labels[0, 0], 1005, spec)
+
+    def test_hashes_round_trip_and_are_cleared_by_hashless_writes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ids, vectors = [5, 6], random_vectors(2)
+            write_artifacts(tmp, ids, vectors, "m", hashes=[content_hash("a"), content_hash("b")])
+            self.assertEqual(load_hashes(tmp).tolist(), [content_hash("a"), content_hash("b")])
+            self.assertTrue(load_manifest(tmp)["has_hashes"])
+            with self.assertRaises(ValueError):
+                write_artifacts(tmp, ids, vectors, "m", hashes=[1])
+            write_artifacts(tmp, ids, vectors, "m")
+            self.assertIsNone(load_hashes(tmp))
+
+    def test_scan_finds_new_changed_and_deleted_rows(self):
+        chunks = [([1, 2], ["same", "edited"]), ([4], ["new"])]
+        old_hashes = [content_hash("same"), content_hash("original"), content_hash("gone")]
+        ids, hashes, changed, deleted_ids = builder.scan_changes(chunks, [1, 2, 3], old_hashes)
+        self.assertEqual(ids, [1, 2, 4])
+        self.assertEqual(hashes.tolist(), [content_hash(t) for t in ("same", "edited", "new")])
+        self.assertEqual(changed, [(2, "edited"), (4, "new")])
+        self.assertEqual(deleted_ids, [3])
+
+    def test_incremental_build_reencodes_only_changed_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            versions_dir = os.path.join(tmp, "index_versions")
+            db_path = os.path.join(tmp, "global.db")
+            paths = {
+                "DB_PATH": db_path,
+                "ARTIFACT_DIR": os.path.join(tmp, "embeddings"),
+                "VECTOR_DB_PATH": os.path.join(tmp, "anime.index"),
+                "INDEX_VERSIONS_DIR": versions_dir,
+            }
+            conn = sqlite3.connect(db_path)
+            conn.execute("CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_english TEXT, title_romaji TEXT, title_native TEXT, genres TEXT, tags TEXT)")
+            conn.executemany("INSERT INTO global_media (id, title_english) VALUES (?, ?)", [(i, f"Show {i}") for i in range(1, 101)])
+            conn.commit()
+
+            def vector_of(title):
+                return model.encode([builder.build_anime_text((0, title, None, None, None, None))[1]])
+
+            model = HashModel()
+            with mock.patch.multiple(builder, **paths), \
+                 mock.patch.object(builder, "load_encoder", return_value=model), \
+                 mock.patch.object(builder, "READ_CHUNK_SIZE", 16):
+                builder.build_faiss_index("flat", batch_size=8, checkpoint_dir=None)
+                self.assertEqual(model.encoded, 100)
+
+                conn.execute("UPDATE global_media SET title_english = 'Renamed' WHERE id = 1")
+                conn.execute("DELETE FROM global_media WHERE id = 2")
+                conn.execute("INSERT INTO global_media (id, title_english) VALUES (500, 'Show 500')")
+                conn.commit()
+                model.encoded = 0
+                builder.build_faiss_index("flat", batch_size=8, checkpoint_dir=None, incremental=True)
+                self.assertEqual(model.encoded, 2)
+
+                index = faiss.read_index(os.path.join(current_path(versions_dir), INDEX_FILE))
+                self.assertEqual(index.ntotal, 100)
+                for title, anime_id in (("Renamed", 1), ("Show 500", 500), ("Show 50", 50)):
+                    _, labels = index.search(vector_of(title), 1)
+                    self.assertEqual(labels[0, 0], anime_id)
+                _, labels = index.search(vector_of("Show 2"), 100)
+                self.assertNotIn(2, labels[0].tolist())
+
+                hashes = load_hashes(current_path(versions_dir))
+                self.assertEqual(len(hashes), 100)
+
+                model.encoded = 0
+                builder.build_faiss_index("flat", batch_size=8, checkpoint_dir=None, incremental=True)
+                self.assertEqual(model.encoded, 0)
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
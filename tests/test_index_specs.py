@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+import faiss
+from core.search.index_specs import resolve_index_spec, build_index
+from utils.retrieval import apply_search_params
+
+class TestIndexSpecs(unittest.TestCase):
+
+    def test_presets_resolve_to_factory_strings(self):
+        self.assertEqual(resolve_index_spec("flat"), "Flat")
+        self.assertEqual(resolve_index_spec("ivf-flat", nlist=128), "IVF128,Flat")
+        self.assertEqual(resolve_index_spec("IVF-PQ", nlist=64, m=16), "IVF64,PQ16")
+        self.assertEqual(resolve_index_spec("hnsw", M=48), "HNSW48")
+        # Unknown names are passed through as raw index_factory strings.
+        self.assertEqual(resolve_index_spec("IVF1024,SQ8"), "IVF1024,SQ8")
+
+    def test_ivf_requires_enough_training_vectors(self):
+        vectors = np.zeros((10, 8), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            build_index(vectors, "ivf-flat", nlist=64)
+
+    def test_search_params_apply_only_where_relevant(self):
+        vectors = np.random.default_rng(0).normal(size=(500, 8)).astype(np.float32)
+        ivf, _, _ = build_index(vectors, "ivf-flat", nlist=8)
+        self.assertEqual(apply_search_params(ivf, nprobe=4, ef_search=32), {"nprobe": 4})
+        self.assertEqual(faiss.extract_index_ivf(ivf).nprobe, 4)
+
+        hnsw, _, _ = build_index(vectors, "hnsw", M=8)
+        self.assertEqual(apply_search_params(hnsw, nprobe=4, ef_search=32), {"efSearch": 32})
+
+        flat, _, _ = build_index(vectors, "flat")
+        self.assertEqual(flat.ntotal, 500)
+        self.assertEqual(apply_search_params(flat, nprobe=4), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from utils.versions import (
+    CURRENT_LINK,
+    create_staging,
+    current_path,
+    current_version,
+    list_versions,
+    new_version,
+    publish_version,
+)
+from utils.reloader import IndexReloader
+
+def publish(versions_dir, keep=3):
+    version = new_version(versions_dir)
+    staging = create_staging(version, versions_dir)
+    with open(os.path.join(staging, "index.faiss"), "w") as f:
+        f.write(version)
+    publish_version(version, versions_dir, keep=keep)
+    return version
+
+class FakeEngine:
+
+    def __init__(self, version, reloadable=True):
+        self.version = version
+        self.reloadable = reloadable
+
+class TestIndexVersions(unittest.TestCase):
+
+    def test_publish_swaps_current_and_prunes_old_versions(self):
+        with tempfile.TemporaryDirectory() as versions_dir:
+            self.assertIsNone(current_version(versions_dir))
+            published = [publish(versions_dir, keep=2) for _ in range(3)]
+
+            self.assertEqual(len(set(published)), 3)
+            self.assertEqual(current_version(versions_dir), published[-1])
+            self.assertEqual(list_versions(versions_dir), published[1:])
+            self.assertTrue(os.path.islink(os.path.join(versions_dir, CURRENT_LINK)))
+            with open(os.path.join(current_path(versions_dir), "index.faiss")) as f:
+                self.assertEqual(f.read(), published[-1])
+
+    def test_unpublished_staging_is_invisible(self):
+        with tempfile.TemporaryDirectory() as versions_dir:
+            first = publish(versions_dir)
+            create_staging(new_version(versions_dir), versions_dir)
+            self.assertEqual(current_version(versions_dir), first)
+            self.assertEqual(list_versions(versions_dir), [first])
+
+class TestIndexReloader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.versions_dir = self.tmp.name
+        self.engine = FakeEngine(publish(self.versions_dir))
+        self.loaded = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_reloader(self, load_engine=None):
+        def set_engine(engine):
+            self.engine = engine
+
+        def default_load(version, previous):
+            self.loaded.append((version, previous.version))
+            return FakeEngine(version)
+
+        return IndexReloader(self.versions_dir, lambda: self.engine, set_engine, load_engine or default_load)
+
+    def test_swaps_engine_only_when_a_new_version_is_published(self):
+        reloader = self.make_reloader()
+        self.assertFalse(reloader.check())
+
+        old_version = self.engine.version
+        new = publish(self.versions_dir)
+        self.assertTrue(reloader.check())
+        self.assertEqual(self.engine.version, new)
+        self.assertEqual(self.loaded, [(new, old_version)])
+        self.assertFalse(reloader.check())
+        self.assertEqual(reloader.stats()["reloads"], 1)
+
+    def test_failed_load_keeps_serving_and_is_not_retried_until_forced(self):
+        calls = []
+
+        def broken_load(version, previous):
+            calls.append(version)
+            raise ValueError("corrupt index")
+
+        reloader = self.make_reloader(broken_load)
+        served = self.engine
+        bad = publish(self.versions_dir)
+
+        self.assertFalse(reloader.check())
+        self.assertFalse(reloader.check())
+        self.assertIs(self.engine, served)
+        self.assertEqual(calls, [bad])
+        self.assertEqual(reloader.failed_version, bad)
+        self.assertIn("corrupt index", reloader.last_error)
+
+        self.assertFalse(reloader.check(force=True))
+        self.assertEqual(calls, [bad, bad])
+
+    def test_sharded_engines_are_left_alone(self):
+        self.engine = FakeEngine(None, reloadable=False)
+        reloader = self.make_reloader()
+        publish(self.versions_dir)
+        self.assertFalse(reloader.check())
+        self.assertEqual(self.loaded, [])
+
+    def test_background_thread_picks_up_new_version(self):
+        swapped = threading.Event()
+        reloader = self.make_reloader()
+
+        def set_engine(engine):
+            self.engine = engine
+            swapped.set()
+
+        reloader.set_engine = set_engine
+        reloader.interval = 0.01
+        reloader.start()
+        try:
+            new = publish(self.versions_dir)
+            self.assertTrue(swapped.wait(5))
+            self.assertEqual(self.engine.version, new)
+        finally:
+            reloader.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.lexical import LexicalIndex, reciprocal_rank_fusion, to_match_query
+from core.search.build_lexical_index import build_lexical_index
+import utils.retrieval as retrieval
+
+ROWS = [
+    # id, title_english, title_romaji, description, genres, tags, type
+    (1, "Night Walkers", None, "A girl hunts <i>vampires</i> in Tokyo.", ["Action"], [{"name": "Vampire", "rank": 90}], "ANIME"),
+    (2, None, "Kuroi Tsuki", "A quiet story about a bakery.", ["Slice of Life"], [{"name": "Cooking", "rank": 80}], "ANIME"),
+    (3, "Vampire Bakery", None, "Pastries at midnight.", ["Comedy"], [], "MANGA"),
+    (4, "Space Freight", None, "Haulers in the asteroid belt meet a vampire.", ["Sci-Fi"], [{"name": "Space", "rank": 70}], None),
+]
+
+def make_db(path, rows=ROWS):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_english TEXT, title_romaji TEXT, title_native TEXT, "
+        "description TEXT, genres TEXT, tags TEXT, type TEXT, format TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO global_media (id, title_english, title_romaji, description, genres, tags, type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, en, ro, desc, json.dumps(g), json.dumps(t), ty) for i, en, ro, desc, g, t, ty in rows],
+    )
+    conn.commit()
+    conn.close()
+
+class TestLexicalSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "global.db")
+        make_db(self.db_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_match_query_drops_stopwords_and_quotes_words(self):
+        self.assertEqual(to_match_query("Anime like Cowboy Bebop"), '"cowboy" OR "bebop"')
+        self.assertEqual(to_match_query('NEAR "x" NOT title:y*'), '"near" OR "not" OR "title"')
+        self.assertIsNone(to_match_query("something like that"))
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]])
+        self.assertEqual(fused[:2], [1, 3])
+        self.assertEqual(reciprocal_rank_fusion([[5, 6], [7]], limit=2), [5, 7])
+
+    def test_search_ranks_title_hits_first_and_stems(self):
+        index = LexicalIndex(self.db_path)
+        self.assertFalse(index.available())
+        self.assertEqual(build_lexical_index(self.db_path), 4)
+        self.assertTrue(index.available())
+
+        results = index.search("vampires", 10)
+        self.assertEqual(results[0], 3)
+        self.assertEqual(set(results), {1, 3, 4})
+        self.assertEqual(index.search("kuroi tsuki", 10), [2])
+        self.assertEqual(index.search("the", 10), [])
+
+    def test_search_filters_like_shards(self):
+        build_lexical_index(self.db_path)
+        index = LexicalIndex(self.db_path)
+        self.assertEqual(sorted(index.search("vampire", 10, "type", ["ANIME"])), [1, 4])
+        self.assertEqual(index.search("vampire", 10, "type", ["MANGA"]), [3])
+
+    def test_rebuild_replaces_contents(self):
+        build_lexical_index(self.db_path)
+        index = LexicalIndex(self.db_path)
+        self.assertEqual(index.search("asteroid", 10), [4])
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM global_media WHERE id = 4")
+        conn.commit()
+        conn.close()
+        build_lexical_index(self.db_path)
+        self.assertEqual(index.search("asteroid", 10), [])
+
+    def test_retrieve_candidates_fuses_keyword_hits(self):
+        build_lexical_index(self.db_path)
+        engine = mock.Mock(sharded=None)
+        with mock.patch.object(retrieval, "_lexical", LexicalIndex(self.db_path)), \
+             mock.patch.object(retrieval, "get_engine", return_value=engine), \
+             mock.patch.object(retrieval, "retrieve_similar_anime", return_value=[2, 4]):
+            ids, mode = retrieval.retrieve_candidates("vampire bakery", 3)
+            self.assertEqual(mode, "hybrid")
+            # The single index holds anime only, so the manga keyword hit (3) is left out.
+            self.assertEqual(sorted(ids), [1, 2, 4])
+
+            # Unrestricted searches of a sharded engine cover every media type.
+            engine.sharded = mock.Mock()
+            ids, _ = retrieval.retrieve_candidates("vampire bakery", 3)
+            self.assertIn(3, ids)
+
+            with mock.patch.object(retrieval, "HYBRID_SEARCH", 0):
+                self.assertEqual(retrieval.retrieve_candidates("vampire bakery", 3), ([2, 4], "dense"))
+
+    def test_availability_is_cached_until_refresh(self):
+        index = LexicalIndex(self.db_path)
+        with mock.patch.object(retrieval, "_lexical", index):
+            self.assertFalse(retrieval.hybrid_enabled())
+            build_lexical_index(self.db_path)
+            with mock.patch.object(index, "available", side_effect=AssertionError("queried per request")):
+                self.assertFalse(retrieval.hybrid_enabled())
+            index.refresh()
+            self.assertTrue(retrieval.hybrid_enabled())
+            # The caller's answer is used as-is, so pool size and mode always agree.
+            self.assertEqual(retrieval.fuse_candidates("vampire bakery", [2, 4], 3, hybrid=False), ([2, 4], "dense"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import os
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+from utils.local_reranker import DEFAULT_WEIGHTS, FEATURES, LocalReranker, load_weights
+from core.search.fit_reranker import fit_reranker, ordering_pairs
+from utils import catalog as catalog_module
+from utils.catalog import CatalogCache
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+CATALOG = {
+    1: {"average_score": 85, "popularity": 500_000, "rankings": [{"rank": 10}], "format": "TV",
+        "genres": ["Horror"], "tags": [{"name": "Vampire", "rank": 90}]},
+    2: {"average_score": 85, "popularity": 500_000, "rankings": [], "format": "TV_SHORT",
+        "genres": ["Horror"], "tags": [{"name": "Vampire", "rank": 90}]},
+    3: {"average_score": 60, "popularity": 1_000, "rankings": [], "format": "OVA",
+        "genres": ["Comedy"], "tags": [{"name": "Vampire", "rank": 20}]},
+}
+
+def column(name):
+    return FEATURES.index(name)
+
+class TestLocalReranker(unittest.TestCase):
+
+    def test_features(self):
+        reranker = LocalReranker(CATALOG, weights=np.ones(len(FEATURES)))
+        vectors = np.array([[1, 0], [0, 1], [1, 1], [0, 0]], dtype=np.float32)
+        features = reranker.features("vampires in horror", np.array([2, 0], dtype=np.float32), [1, 2, 3, 99], vectors)
+
+        np.testing.assert_allclose(features[:, column("similarity")], [1.0, 0.0, np.sqrt(0.5), 0.0], atol=1e-6)
+        self.assertEqual(features[:, column("is_tv")].tolist(), [1, 0, 0, 0])
+        self.assertEqual(features[:, column("is_short")].tolist(), [0, 1, 0, 0])
+        self.assertEqual(features[:, column("is_ova")].tolist(), [0, 0, 1, 0])
+        self.assertAlmostEqual(features[0, column("ranking")], 0.9, places=6)
+        # "vampires" folds onto the Vampire tag; item 3's Vampire tag is below the importance threshold.
+        self.assertEqual(features[:, column("tag_overlap")].tolist(), [1.0, 1.0, 0.0, 0.0])
+        self.assertFalse(features[3].any())
+
+        without_vectors = reranker.features("vampires", None, [1], None)
+        self.assertEqual(without_vectors[0, column("similarity")], 0.0)
+
+    def test_default_weights_prefer_high_quality_tv(self):
+        reranker = LocalReranker(CATALOG, weights=load_weights(None))
+        self.assertEqual(reranker.rerank("vampire", None, [3, 2, 1]), [1, 2, 3])
+        self.assertEqual(reranker.rerank("vampire", None, [3, 2, 1], limit=2), [1, 2])
+
+    def test_weights_file(self):
+        default = np.float32([DEFAULT_WEIGHTS[name] for name in FEATURES]).tolist()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "weights.json")
+            self.assertEqual(load_weights(path).tolist(), default)
+            with open(path, "w") as f:
+                json.dump({"features": list(FEATURES), "weights": list(range(len(FEATURES)))}, f)
+            self.assertEqual(load_weights(path).tolist(), list(range(len(FEATURES))))
+            with open(path, "w") as f:
+                json.dump({"features": ["similarity"], "weights": [1.0]}, f)
+            self.assertEqual(load_weights(path).tolist(), default)
+
+    def test_ordering_pairs(self):
+        self.assertEqual(ordering_pairs([3, 1], [1, 2, 3]), [(3, 1), (3, 2), (1, 2)])
+        self.assertEqual(ordering_pairs([3, 1]), [(3, 1)])
+
+    def test_fit_recovers_orderings_from_a_hidden_preference(self):
+        rng = np.random.default_rng(0)
+        formats = ["TV", "MOVIE", "OVA", "TV_SHORT"]
+        catalog = {
+            i: {"average_score": int(rng.integers(40, 95)), "popularity": int(rng.integers(100, 900_000)),
+                "rankings": [], "format": formats[i % 4], "genres": [], "tags": []}
+            for i in range(200)
+        }
+        vectors = rng.normal(size=(200, 8)).astype(np.float32)
+        hidden = np.zeros(len(FEATURES))
+        hidden[column("similarity")] = 1.0
+        hidden[column("is_short")] = -3.0
+        reranker = LocalReranker(catalog, weights=hidden)
+
+        orderings = []
+        query_vectors = rng.normal(size=(60, 8)).astype(np.float32)
+        for q in range(60):
+            candidates = [int(c) for c in rng.choice(200, 15, replace=False)]
+            orderings.append((f"q{q}", candidates, reranker.rerank("", query_vectors[q], candidates, vectors[candidates], limit=10)))
+
+        fitted = fit_reranker(
+            orderings,
+            LocalReranker(catalog, weights=load_weights(None)),
+            encode_batch=lambda queries: query_vectors[[int(q[1:]) for q in queries]],
+            item_vectors=lambda ids: vectors[ids],
+        )
+        self.assertEqual(fitted["features"], list(FEATURES))
+        self.assertGreater(fitted["holdout_accuracy"], 0.95)
+        self.assertGreater(fitted["holdout_accuracy"], fitted["default_holdout_accuracy"])
+        weights = dict(zip(FEATURES, fitted["weights"]))
+        self.assertGreater(weights["similarity"], 0)
+        self.assertLess(weights["is_short"], 0)
+
+class TestLocalRerankMode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp.name, "global.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+            "genres TEXT, tags TEXT, average_score INTEGER, popularity INTEGER, rankings TEXT, format TEXT)"
+        )
+        # Higher IDs have higher quality scores.
+        conn.executemany(
+            "INSERT INTO global_media (id, title_romaji, genres, tags, average_score, popularity, rankings, format) "
+            "VALUES (?, ?, '[]', '[]', ?, 1000, '[]', 'TV')",
+            [(i, f"Romaji {i}", 50 + 5 * i) for i in range(1, 7)],
+        )
+        conn.commit()
+        conn.close()
+        patcher = mock.patch.object(catalog_module, "_catalog_cache", CatalogCache(db_path, interval_seconds=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def query(self, rerank, reranked_ids):
+        from fastapi import Response
+        from routers import query
+
+        response = Response()
+        with mock.patch.object(query, "hybrid_enabled", return_value=False), \
+                mock.patch.object(query, "get_batcher", return_value=None), \
+                mock.patch.object(query, "retrieve_similar_anime", return_value=[1, 2, 3, 4, 5, 6]), \
+                mock.patch.object(query, "fuse_candidates", return_value=([1, 2, 3, 4, 5, 6], "dense")), \
+                mock.patch.object(query, "rerank_locally", return_value=reranked_ids):
+            results = asyncio.run(query.query_recommendations(response, q="vampires", top_n=3, shards=None, rerank=rerank))
+        return [r.id for r in results], response.headers["X-Rerank-Path"]
+
+    def test_local_mode_keeps_the_reranker_order(self):
+        self.assertEqual(self.query("local", [2, 5, 1, 6, 3, 4]), ([2, 5, 1], "local"))
+        # Without a reranker the candidates are ordered by quality.
+        self.assertEqual(self.query("none", None), ([6, 5, 4], "none"))
+
+if __name__ == '__main__':
+    unittest.main()
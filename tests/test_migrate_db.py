@@ -0,0 +1,121 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from core.search.build_shards import load_shard_keys
+from core.search.build_lexical_index import build_lexical_index
+from db.migrate_db import INDEXES, migrate
+from utils.db import load_global_anime_info
+from utils.lexical import LexicalIndex
+from utils.quality import QualityTable, compute_quality_score
+from utils.titles import get_english_title
+
+ROWS = [
+    # id, title_english, title_romaji, title_native, average_score, popularity, rankings, format
+    (1, "  Frieren ", "Sousou no Frieren", None, 91, 600_000, [{"type": "TV", "rank": 3}, {"type": "TV", "rank": 12}], "TV"),
+    (2, "", "Kimi no Na wa", None, 85, 900_000, [{"type": "RATED", "rank": 1}], "MOVIE"),
+    (3, None, None, None, None, None, [], None),
+    (4, None, None, "ハイキュー", 70, 1_000, [{"type": "TV", "rank": 150}], "tv"),
+    (5, "Short", None, None, 60, 20_000, [], "TV_SHORT"),
+]
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE global_media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+        "description TEXT, genres TEXT, tags TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO global_media (id, title_english, title_romaji, title_native, genres) VALUES (?, ?, ?, ?, '[]')",
+        [row[:4] for row in ROWS],
+    )
+    # Columns added by later ingests, as on an older database.
+    for column, column_type in (("average_score", "INTEGER"), ("popularity", "INTEGER"), ("rankings", "TEXT"), ("format", "TEXT")):
+        conn.execute(f"ALTER TABLE global_media ADD COLUMN {column} {column_type}")
+    conn.executemany(
+        "UPDATE global_media SET average_score = ?, popularity = ?, rankings = ?, format = ? WHERE id = ?",
+        [(avg, pop, json.dumps(rankings), fmt, anime_id) for anime_id, _, _, _, avg, pop, rankings, fmt in ROWS],
+    )
+    conn.commit()
+    conn.close()
+
+class TestMigrateDb(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "global.db")
+        make_db(self.db_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_derived_columns_match_the_python_derivations(self):
+        before = load_global_anime_info(self.db_path)
+        self.assertEqual(migrate(self.db_path), len(ROWS))
+        self.assertEqual(migrate(self.db_path), len(ROWS))  # idempotent
+
+        conn = sqlite3.connect(self.db_path)
+        rows = {row[0]: row[1:] for row in conn.execute(
+            "SELECT id, display_title, best_tv_rank, quality_score, format_norm FROM global_media"
+        )}
+        conn.close()
+        self.assertEqual(rows[1][:2], ("Frieren", 3))
+        self.assertEqual(rows[2][0], "Kimi no Na wa")
+        self.assertEqual(rows[3], (None, None, 0.0, "UNKNOWN"))
+        self.assertEqual(rows[4][3], "TV")
+        for anime_id, info in before.items():
+            self.assertEqual(rows[anime_id][2], compute_quality_score(info), anime_id)
+
+        after = load_global_anime_info(self.db_path)
+        self.assertNotIn("rankings", after[1])
+        for anime_id in before:
+            self.assertEqual(get_english_title(after[anime_id]), get_english_title(before[anime_id]))
+        ids = list(before)
+        self.assertEqual(
+            QualityTable.from_info(after).scores_for(ids).tolist(),
+            QualityTable.from_info(before).scores_for(ids).tolist(),
+        )
+
+    def test_format_readers_use_format_norm(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE global_media SET format = ' movie ' WHERE id = 2")
+        conn.commit()
+        conn.close()
+        migrate(self.db_path)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE global_media SET format = 'stale' WHERE id = 5")  # raw column not read
+        conn.commit()
+        conn.close()
+        self.assertEqual(
+            load_shard_keys("format", self.db_path),
+            {1: "TV", 2: "MOVIE", 3: "UNKNOWN", 4: "TV", 5: "TV_SHORT"},
+        )
+        self.assertEqual(LexicalIndex(self.db_path)._shard_expression("format"), "m.format_norm")
+
+    def test_filters_use_the_covering_indexes(self):
+        migrate(self.db_path)
+        self.assertEqual(migrate(self.db_path), len(ROWS))  # indexes already exist
+        build_lexical_index(self.db_path)
+        lexical = LexicalIndex(self.db_path)
+        statements = []
+        lexical._connection().set_trace_callback(statements.append)
+        self.assertEqual(lexical.search("frieren", filter_column="format", filter_values=["TV"]), [1])
+        keyword_filter = next(sql for sql in statements if sql.startswith("SELECT f.rowid"))
+
+        conn = sqlite3.connect(self.db_path)
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertLessEqual(set(INDEXES), names)
+        for sql, index in [
+            (keyword_filter, "idx_global_media_format_norm"),
+            ("SELECT id, format_norm FROM global_media", "idx_global_media_format_norm"),  # load_shard_keys("format")
+            ("SELECT id, type FROM global_media", "idx_global_media_type"),  # load_shard_keys("type")
+        ]:
+            plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            self.assertIn(f"COVERING INDEX {index}", plan, sql)
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
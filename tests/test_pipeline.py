@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from core.search.pipeline import TextStream
+
+QUERY = "SELECT id, name FROM items ORDER BY id"
+
+class TestTextStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "items.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO items VALUES (?, ?)", [(i, f"item {i}") for i in range(1, 26)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streams_rows_in_chunks(self):
+        with TextStream(self.db_path, QUERY, lambda row: (row[0], row[1].upper()), chunk_size=10) as stream:
+            self.assertEqual(stream.rows, 25)
+            chunks = list(stream)
+        self.assertEqual([len(ids) for ids, _ in chunks], [10, 10, 5])
+        self.assertEqual(chunks[0][1][0], "ITEM 1")
+        self.assertEqual([i for ids, _ in chunks for i in ids], list(range(1, 26)))
+
+    def test_rows_can_be_skipped(self):
+        make_text = lambda row: None if row[0] % 2 else (row[0], row[1])
+        with TextStream(self.db_path, QUERY, make_text, chunk_size=4) as stream:
+            ids = [i for chunk_ids, _ in stream for i in chunk_ids]
+        self.assertEqual(ids, list(range(2, 26, 2)))
+
+    def test_errors_reach_the_consumer(self):
+        def make_text(row):
+            if row[0] == 12:
+                raise ValueError("bad row")
+            return row[0], row[1]
+
+        with TextStream(self.db_path, QUERY, make_text, chunk_size=5) as stream:
+            with self.assertRaises(ValueError):
+                list(stream)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            with TextStream(self.db_path, "SELECT * FROM missing", make_text):
+                pass
+
+    def test_consumer_can_stop_early(self):
+        with TextStream(self.db_path, QUERY, lambda row: (row[0], row[1]), chunk_size=1, depth=1) as stream:
+            first = next(iter(stream))
+        self.assertEqual(first, ([1], ["item 1"]))
+
+if __name__ == '__main__':
+    unittest.main()
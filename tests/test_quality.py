@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+
+from utils.quality import QualityTable, compute_quality_score, top_k_indices
+
+def random_catalog(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    formats = ["TV", "MOVIE", "OVA", "ONA", "SPECIAL", "TV_SHORT", "MUSIC", "", "tv"]
+    catalog = {}
+    for i in rng.choice(100_000, rows, replace=False):
+        rankings = [
+            {"type": str(rng.choice(["TV", "RATED", "POPULAR", "tv"])), "rank": int(rng.integers(-5, 300))}
+            for _ in range(int(rng.integers(0, 4)))
+        ]
+        catalog[int(i)] = {
+            "average_score": None if rng.random() < 0.1 else int(rng.integers(10, 95)),
+            "popularity": None if rng.random() < 0.1 else int(rng.integers(0, 2_000_000)),
+            "rankings": rankings,
+            "format": str(rng.choice(formats)),
+        }
+    return catalog
+
+class TestQualityTable(unittest.TestCase):
+
+    def test_matches_compute_quality_score(self):
+        catalog = random_catalog()
+        table = QualityTable.from_info(catalog)
+        ids = list(catalog)
+        expected = [compute_quality_score(catalog[i]) for i in ids]
+        self.assertEqual(table.scores_for(ids).tolist(), expected)
+        self.assertEqual(table.scores_for([-1, 10**9]).tolist(), [0.0, 0.0])
+
+    def test_top_k_indices_matches_a_stable_sort(self):
+        rng = np.random.default_rng(1)
+        for n, k in ((0, 3), (1, 1), (50, 10), (50, 50), (50, 80), (200, 7)):
+            scores = rng.integers(0, 5, n).astype(np.float64)  # many ties
+            expected = sorted(range(n), key=lambda i: scores[i], reverse=True)[:k]
+            self.assertEqual(top_k_indices(scores, k).tolist(), expected, (n, k))
+
+    def test_rank_keeps_input_order_for_ties(self):
+        catalog = {
+            1: {"average_score": 80, "popularity": 0, "format": "MOVIE"},
+            2: {"average_score": 80, "popularity": 0, "format": "MOVIE"},
+            3: {"average_score": 90, "popularity": 0, "format": "TV", "rankings": [{"type": "TV", "rank": 50}]},
+        }
+        table = QualityTable.from_info(catalog)
+        ids, scores = table.rank([2, 99, 1, 3], 3)
+        self.assertEqual(ids, [3, 2, 1])
+        self.assertAlmostEqual(scores[0], 0.9 * 4 * 1.5 + 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
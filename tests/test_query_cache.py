@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from utils.query_cache import normalize_query, QueryEmbeddingCache
+
+class TestNormalizeQuery(unittest.TestCase):
+
+    def test_case_and_whitespace(self):
+        self.assertEqual(
+            normalize_query("  Show that has   COOKING\tas key element "),
+            "show that has cooking as key element"
+        )
+
+    def test_unicode_compatibility_forms(self):
+        # Full-width letters fold to their ASCII equivalents.
+        self.assertEqual(normalize_query("ＣＯＯＫＩＮＧ"), "cooking")
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = QueryEmbeddingCache("m")
+        calls = []
+        compute = lambda q: calls.append(q) or np.ones(4)
+        cache.get_or_compute("Cooking anime", compute)
+        cache.get_or_compute("cooking  ANIME", compute)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_lru_eviction_by_bytes(self):
+        # Each vector is 16 bytes; room for two.
+        cache = QueryEmbeddingCache("m", max_bytes=32)
+        cache.put("a", np.zeros(4))
+        cache.put("b", np.zeros(4))
+        cache.get("a")
+        cache.put("c", np.zeros(4))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        cache = QueryEmbeddingCache("m", ttl_seconds=-1)
+        cache.put("a", np.zeros(4))
+        self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_persistence_is_scoped_by_model(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "cache.db")
+            cache = QueryEmbeddingCache("m", db_path=db_path)
+            cache.put("Cooking", np.arange(4))
+            cache.close()
+
+            warm = QueryEmbeddingCache("m", db_path=db_path)
+            np.testing.assert_array_equal(warm.get("cooking"), np.arange(4, dtype=np.float32))
+            self.assertEqual(warm.stats()["hits"], 1)
+            warm.close()
+
+            other_model = QueryEmbeddingCache("other", db_path=db_path)
+            self.assertIsNone(other_model.get("cooking"))
+            other_model.close()
+
+    def test_warm_start_keeps_the_newest_entries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "cache.db")
+            cache = QueryEmbeddingCache("m", db_path=db_path, commit_every=4)
+            for i, query in enumerate("abcde"):
+                cache.put(query, np.full(4, i))
+                cache._conn.execute("UPDATE query_embeddings SET stored_at = ? WHERE query = ?", (float(i), query))  # distinct times
+            cache.close()
+
+            # Room for two 16-byte vectors: the two newest are loaded, the newest most recently used.
+            warm = QueryEmbeddingCache("m", db_path=db_path, max_bytes=32)
+            self.assertEqual(list(warm._entries), ["d", "e"])
+            self.assertEqual(warm.stats()["evictions"], 0)
+            warm.close()
+
+    def test_sqlite_rows_are_pruned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "cache.db")
+            cache = QueryEmbeddingCache("m", db_path=db_path, max_rows=3)
+            for i in range(5):
+                cache.put(f"q{i}", np.zeros(4))
+                cache._conn.execute("UPDATE query_embeddings SET stored_at = ? WHERE query = ?", (float(i), f"q{i}"))
+            cache.close()
+
+            reopened = QueryEmbeddingCache("m", db_path=db_path, max_rows=3)
+            queries = [row[0] for row in reopened._conn.execute("SELECT query FROM query_embeddings ORDER BY query")]
+            self.assertEqual(queries, ["q2", "q3", "q4"])
+            reopened.close()
+
+            expired = QueryEmbeddingCache("m", db_path=db_path, ttl_seconds=60)
+            self.assertEqual(expired._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0], 0)
+            expired.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+import sqlite3
+from utils.rerank_cache import RerankCache, load_orderings
+
+class TestRerankCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "rerank.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hit_uses_normalized_query_and_ordered_candidates(self):
+        cache = RerankCache(self.db_path, "v1")
+        cache.put("Cooking Anime", [1, 2, 3], [3, 1, 2])
+        self.assertEqual(cache.get("  cooking   anime", [1, 2, 3]), [3, 1, 2])
+        # A different candidate order is a different FAISS result and must miss.
+        self.assertIsNone(cache.get("cooking anime", [2, 1, 3]))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.close()
+
+    def test_prompt_version_change_invalidates(self):
+        cache = RerankCache(self.db_path, "v1")
+        cache.put("q", [1, 2], [2, 1])
+        cache.close()
+
+        reopened = RerankCache(self.db_path, "v2")
+        self.assertIsNone(reopened.get("q", [1, 2]))
+        self.assertEqual(reopened.stats()["rows"], 0)
+        reopened.close()
+
+    def test_ttl_and_size_eviction(self):
+        cache = RerankCache(self.db_path, "v1", ttl_seconds=-1)
+        cache.put("q", [1], [1])
+        self.assertIsNone(cache.get("q", [1]))
+        cache.close()
+
+        cache = RerankCache(self.db_path, "v1", max_rows=2)
+        for i in range(5):
+            cache.put(f"q{i}", [i], [i])
+        cache.evict()
+        self.assertEqual(cache.stats()["rows"], 2)
+        self.assertEqual(cache.get("q4", [4]), [4])
+        cache.close()
+
+    def test_hits_defer_last_used_writes(self):
+        cache = RerankCache(self.db_path, "v1", max_rows=2, touch_flush_every=3)
+        cache.put("old", [1], [1])
+        cache.put("new", [2], [2])
+        changes = cache._conn.total_changes
+        self.assertEqual(cache.get("old", [1]), [1])
+        self.assertEqual(cache._conn.total_changes, changes)  # nothing written per hit
+        # The pending touch still counts for eviction: "new" is now the least recently used.
+        cache.put("newest", [3], [3])
+        cache.evict()
+        self.assertEqual(cache.get("old", [1]), [1])
+        self.assertIsNone(cache.get("new", [2]))
+        for _ in range(2):
+            cache.get("old", [1])
+        self.assertFalse(cache._touched)  # flushed after touch_flush_every hits
+        cache.close()
+
+    def test_orderings_log_the_candidates_shown(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE rerank_cache (query TEXT, candidates_hash TEXT, prompt_version TEXT, candidate_ids TEXT, "
+            "stored_at REAL, last_used REAL, PRIMARY KEY (query, candidates_hash, prompt_version))"
+        )
+        conn.execute("INSERT INTO rerank_cache VALUES ('old', 'h', 'v1', '2,1', 0, 0)")
+        conn.commit()
+        conn.close()
+
+        cache = RerankCache(self.db_path, "v1")
+        cache.put("Mecha", [4, 5, 6], [6, 4])
+        cache.close()
+        self.assertEqual(
+            sorted(load_orderings(self.db_path, "v1")),
+            [("mecha", [4, 5, 6], [6, 4]), ("old", None, [2, 1])]
+        )
+        self.assertEqual(load_orderings(self.db_path, "v2"), [])
+
+if __name__ == '__main__':
+    unittest.main()
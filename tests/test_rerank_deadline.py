@@ -0,0 +1,67 @@
+import os
+import asyncio
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+from utils import reranker
+
+CANDIDATES = [
+    {"id": 1, "title": "A", "format": "TV", "average_score": 80, "popularity": 1000},
+    {"id": 2, "title": "B", "format": "OVA", "average_score": 70, "popularity": 500},
+]
+
+def fake_gemini(delays, results):
+    """
+    Returns a stand-in for _gemini_rerank_async whose n-th call sleeps delays[n]
+    and then returns (or raises) results[n].
+    """
+    calls = []
+
+    async def _fake(prompt):
+        n = len(calls)
+        calls.append(prompt)
+        await asyncio.sleep(delays[n])
+        if isinstance(results[n], Exception):
+            raise results[n]
+        return results[n]
+
+    return _fake, calls
+
+class TestRerankWithDeadline(unittest.TestCase):
+
+    def run_rerank(self, fake, deadline, hedge=None):
+        with mock.patch.object(reranker, "_gemini_rerank_async", fake):
+            return asyncio.run(reranker.rerank_candidates_with_deadline("q", CANDIDATES, deadline, hedge))
+
+    def test_answer_within_deadline(self):
+        fake, calls = fake_gemini([0.0], [[2, 1]])
+        self.assertEqual(self.run_rerank(fake, 1.0), ([2, 1], reranker.RERANK_PATH_GEMINI))
+        self.assertEqual(len(calls), 1)
+
+    def test_deadline_falls_back(self):
+        fake, _ = fake_gemini([5.0], [[2, 1]])
+        self.assertEqual(self.run_rerank(fake, 0.05), (None, reranker.RERANK_PATH_TIMEOUT))
+
+    def test_error_falls_back(self):
+        fake, _ = fake_gemini([0.0], [RuntimeError("boom")])
+        self.assertEqual(self.run_rerank(fake, 1.0), (None, reranker.RERANK_PATH_ERROR))
+
+    def test_hedged_request_wins(self):
+        fake, calls = fake_gemini([5.0, 0.0], [[1, 2], [2, 1]])
+        self.assertEqual(self.run_rerank(fake, 1.0, hedge=0.02), ([2, 1], reranker.RERANK_PATH_HEDGED))
+        self.assertEqual(len(calls), 2)
+
+    def test_original_request_wins_after_hedge_is_sent(self):
+        fake, calls = fake_gemini([0.1, 5.0], [[2, 1], [1, 2]])
+        self.assertEqual(self.run_rerank(fake, 1.0, hedge=0.02), ([2, 1], reranker.RERANK_PATH_GEMINI))
+        self.assertEqual(len(calls), 2)
+
+    def test_at_most_one_hedge_when_the_first_request_fails(self):
+        # The first request fails after the hedge went out; no third request is sent.
+        fake, calls = fake_gemini([0.1, 0.2, 0.0], [RuntimeError("boom"), [2, 1], [1, 2]])
+        self.assertEqual(self.run_rerank(fake, 1.0, hedge=0.02), ([2, 1], reranker.RERANK_PATH_HEDGED))
+        self.assertEqual(len(calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
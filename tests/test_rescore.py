@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+import numpy as np
+import faiss
+
+from utils.artifacts import write_artifacts
+from utils.rescore import ExactRescorer
+from utils.shards import load_sharded_index
+from core.search.index_specs import build_index, index_size_bytes
+from core.search.benchmark_index import run_benchmark
+from utils.retrieval import RetrievalEngine
+
+def clustered_vectors(rows=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return (centers[rng.integers(0, 20, rows)] + 0.3 * rng.normal(size=(rows, dim))).astype(np.float32)
+
+class TestExactRescore(unittest.TestCase):
+
+    def test_rescore_orders_candidates_by_exact_distance(self):
+        vectors = clustered_vectors()
+        ids = np.arange(len(vectors), dtype=np.int64) * 3 + 7
+        queries = vectors[:20] + 0.01
+
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        exact_distances, exact_rows = flat.search(queries, 5)
+
+        # Candidates in reverse order, padded with an empty slot and an unknown ID.
+        candidates = np.hstack([ids[exact_rows[:, ::-1]], np.full((20, 1), -1), np.full((20, 1), 99999)])
+        rescorer = ExactRescorer(ids, vectors, faiss.METRIC_L2, id_mapped=True)
+        distances, labels = rescorer.rescore(queries, candidates, 5)
+        np.testing.assert_array_equal(labels, ids[exact_rows])
+        np.testing.assert_allclose(distances, exact_distances, rtol=1e-4)
+
+        distances, labels = rescorer.rescore(queries, candidates, 7)
+        self.assertEqual(labels[0, 5:].tolist(), [-1, -1])
+
+    def test_inner_product_prefers_larger_scores(self):
+        vectors = np.eye(4, dtype=np.float32)
+        rescorer = ExactRescorer(np.arange(4), vectors, faiss.METRIC_INNER_PRODUCT)
+        _, labels = rescorer.rescore(np.array([[0, 0, 1, 0.5]], dtype=np.float32), np.array([[0, 3, 2]]), 2)
+        self.assertEqual(labels.tolist(), [[2, 3]])
+
+    def test_compressed_indexes_are_smaller_and_rescore_restores_recall(self):
+        vectors = clustered_vectors()
+        flat, _, _ = build_index(vectors, "flat")
+        sq8, factory, _ = build_index(vectors, "sq8")
+        fp16, _, _ = build_index(vectors, "sqfp16")
+        self.assertEqual(factory, "SQ8")
+        self.assertLess(index_size_bytes(sq8) * 3, index_size_bytes(flat))
+        self.assertLess(index_size_bytes(fp16) * 1.5, index_size_bytes(flat))
+
+        results = run_benchmark(vectors, ["sq8"], k=10, num_queries=50, rescore=50)
+        plain = next(r for r in results if "rescore" not in r["params"])
+        rescored = next(r for r in results if r["params"].get("rescore") == 50)
+        self.assertGreater(plain["compression"], 3.0)
+        self.assertGreaterEqual(rescored["recall"], plain["recall"])
+        self.assertGreater(rescored["recall"], 0.99)
+
+    def test_engine_rescores_single_index(self):
+        vectors = clustered_vectors()
+        ids = np.arange(len(vectors), dtype=np.int64) + 100
+        engine = RetrievalEngine(shard_dir=None, versions_dir=None, rescore=40)
+        engine.index, _, _ = build_index(vectors, "sq8", ids=ids)
+        engine.ids, engine.id_mapped = ids, True
+        engine.rescorer = ExactRescorer(ids, vectors, engine.index.metric_type, id_mapped=True)
+
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        queries = vectors[:30] + 0.05
+        _, exact_rows = flat.search(queries, 10)
+        np.testing.assert_array_equal(engine.search_vectors(queries, 10), ids[exact_rows])
+
+    def test_sharded_search_rescores_each_shard(self):
+        vectors = clustered_vectors(400)
+        ids = np.arange(400, dtype=np.int64) + 1
+        with tempfile.TemporaryDirectory() as shard_dir:
+            for name, rows in (("TV", slice(0, 200)), ("MOVIE", slice(200, 400))):
+                index, factory, _ = build_index(vectors[rows], "sq8", ids=ids[rows])
+                path = f"{shard_dir}/{name}"
+                write_artifacts(path, ids[rows], vectors[rows], "m", extra={"index": {"factory": factory, "id_mapped": True}})
+                faiss.write_index(index, f"{path}/index.faiss")
+
+            sharded = load_sharded_index(shard_dir, rescore=20)
+            try:
+                distances, labels = sharded.search(vectors[[5, 305]], 1)
+            finally:
+                sharded.close()
+            self.assertEqual(labels[:, 0].tolist(), [6, 306])
+            np.testing.assert_allclose(distances[:, 0], [0.0, 0.0], atol=1e-5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import faiss
+from utils.shards import merge_topk, Shard, ShardedIndex
+
+def make_shard(name, vectors, ids):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors.astype(np.float32))
+    return Shard(name, index, np.asarray(ids, dtype=np.int64), {"model": "m"})
+
+class TestMergeTopK(unittest.TestCase):
+
+    def test_merges_by_distance_and_skips_empty_slots(self):
+        distances = [np.array([[0.1, 0.5, 9.0]]), np.array([[0.2, 0.3, 0.0]])]
+        labels = [np.array([[1, 2, 3]]), np.array([[10, 20, -1]])]
+        merged_d, merged_l = merge_topk(distances, labels, 4)
+        self.assertEqual(merged_l.tolist(), [[1, 10, 20, 2]])
+        np.testing.assert_allclose(merged_d, [[0.1, 0.2, 0.3, 0.5]])
+
+    def test_inner_product_prefers_higher_scores(self):
+        distances = [np.array([[0.9, 0.1]]), np.array([[0.5, 0.4]])]
+        labels = [np.array([[1, 2]]), np.array([[3, 4]])]
+        _, merged_l = merge_topk(distances, labels, 3, higher_is_better=True)
+        self.assertEqual(merged_l.tolist(), [[1, 3, 4]])
+
+    def test_pads_when_shards_are_small(self):
+        _, merged_l = merge_topk([np.array([[0.1]])], [np.array([[7]])], 3)
+        self.assertEqual(merged_l.tolist(), [[7, -1, -1]])
+
+class TestShardedIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(60, 8)).astype(np.float32)
+        self.ids = np.arange(1000, 1060)
+        self.sharded = ShardedIndex({
+            "ANIME": make_shard("ANIME", self.vectors[:40], self.ids[:40]),
+            "MANGA": make_shard("MANGA", self.vectors[40:], self.ids[40:]),
+        })
+
+    def tearDown(self):
+        self.sharded.close()
+
+    def test_matches_a_single_exact_index(self):
+        exact = faiss.IndexFlatL2(8)
+        exact.add(self.vectors)
+        queries = self.vectors[[3, 45, 59]] + 0.01
+        _, rows = exact.search(queries, 10)
+        _, labels = self.sharded.search(queries, 10)
+        self.assertEqual(labels.tolist(), self.ids[rows].tolist())
+
+    def test_restricts_to_selected_shards(self):
+        _, labels = self.sharded.search(self.vectors[:2], 5, ["MANGA"])
+        self.assertTrue(np.all(labels >= 1040))
+
+    def test_unknown_shard(self):
+        with self.assertRaises(KeyError):
+            self.sharded.search(self.vectors[:1], 5, ["NOVEL"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from core.recommender.baseline_recommender import get_user_planned_media_ids, get_user_preferences, get_user_watched_media_ids
+import db.user_profile as user_profile
+from db.user_profile import get_user_profile, install_profile, load_profile
+
+def make_db(path):
+    # Schema of ingest/anilist.py's init_db.
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE media (id INTEGER PRIMARY KEY, title_romaji TEXT, title_english TEXT, title_native TEXT, "
+        "episodes INTEGER, description TEXT, genres TEXT, tags TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE media_list_entries (id INTEGER PRIMARY KEY AUTOINCREMENT, media_id INTEGER, list_name TEXT, "
+        "status TEXT, score REAL, progress INTEGER, repeat INTEGER)"
+    )
+    return conn
+
+class TestUserProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "anilist_data.db")
+        self.conn = make_db(self.db_path)
+        self.rng = random.Random(0)
+        for media_id in range(1, 40):
+            self.add_media(media_id)
+        for media_id in range(1, 25):
+            self.add_entry(media_id)
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def add_media(self, media_id, genres=None, tags=None):
+        genres = genres if genres is not None else json.dumps(self.rng.sample(["Action", "Drama", "Comedy", "Horror"], 2))
+        tags = tags if tags is not None else json.dumps(self.rng.sample(["Vampire", "Action", "School", {"name": "Gore", "rank": 50}], 2))
+        self.conn.execute("INSERT INTO media (id, genres, tags) VALUES (?, ?, ?)", (media_id, genres, tags))
+
+    def add_entry(self, media_id, status=None, score=None):
+        status = status or self.rng.choice(["COMPLETED", "COMPLETED", "PLANNING", "DROPPED", None])
+        score = score if score is not None else self.rng.choice([None, 5, 7, 8.5, 10])
+        self.conn.execute(
+            "INSERT INTO media_list_entries (media_id, list_name, status, score) VALUES (?, 'list', ?, ?)",
+            (media_id, status, score),
+        )
+
+    def assert_matches_full_read(self):
+        profile = load_profile(self.db_path)
+        expected = {feature: weight for feature, weight in get_user_preferences(self.db_path).items() if weight}
+        self.assertEqual(profile.preference, expected)
+        self.assertEqual(profile.planned_ids, get_user_planned_media_ids(self.db_path))
+        self.assertEqual(profile.watched_ids, get_user_watched_media_ids(self.db_path))
+
+    def test_install_builds_the_profile(self):
+        self.assertTrue(install_profile(self.conn))
+        self.assertFalse(install_profile(self.conn))
+        self.assert_matches_full_read()
+
+    def test_triggers_apply_list_changes(self):
+        install_profile(self.conn)
+        for media_id in range(25, 35):
+            self.add_entry(media_id)
+        self.add_entry(3, "COMPLETED", 9)  # the same media twice
+        self.conn.execute("UPDATE media_list_entries SET score = 9 WHERE id IN (1, 2, 3)")
+        self.conn.execute("UPDATE media_list_entries SET status = 'COMPLETED', score = 8 WHERE id IN (4, 5)")
+        self.conn.execute("UPDATE media_list_entries SET status = 'PLANNING' WHERE id = 8")
+        self.conn.execute("DELETE FROM media_list_entries WHERE id IN (6, 7)")
+        self.conn.execute("UPDATE media SET genres = '[\"Sports\"]' WHERE id = 1")
+        # An entry stored before its media row, and a media row with unparsable tags.
+        self.add_entry(99, "COMPLETED", 10)
+        self.add_media(99, genres='["Mecha"]', tags="not json")
+        self.conn.commit()
+        self.assert_matches_full_read()
+        self.assertIn("Mecha", load_profile(self.db_path).preference)
+
+    def test_get_user_profile_rereads_only_after_a_change(self):
+        profile = get_user_profile(self.db_path)
+        self.assertIs(get_user_profile(self.db_path), profile)
+        self.add_entry(39, "PLANNING")
+        self.conn.commit()
+        self.assertIn(39, get_user_profile(self.db_path).planned_ids)
+
+    def test_profile_cache_is_bounded(self):
+        paths = []
+        for name in ("a", "b", "c"):
+            path = os.path.join(self.tmp.name, f"{name}.db")
+            make_db(path).close()
+            paths.append(path)
+        first = get_user_profile(paths[0], max_entries=2)
+        get_user_profile(paths[1], max_entries=2)
+        self.assertIs(get_user_profile(paths[0], max_entries=2), first)  # now most recently used
+        get_user_profile(paths[2], max_entries=2)
+        self.assertEqual(list(user_profile._profiles)[-2:], [paths[0], paths[2]])
+        self.assertNotIn(paths[1], user_profile._profiles)
+        self.assertLessEqual(len(user_profile._profiles), 2)
+
+    def test_write_during_a_read_is_not_cached_as_current(self):
+        def load_then_write(db_path):
+            profile = load_profile(db_path)
+            self.add_entry(39, "PLANNING")  # commits after the read, before the cache stores it
+            self.conn.commit()
+            return profile
+
+        with mock.patch.object(user_profile, "load_profile", load_then_write):
+            self.assertNotIn(39, get_user_profile(self.db_path).planned_ids)
+        self.assertIn(39, get_user_profile(self.db_path).planned_ids)
+
+    def test_a_slow_database_does_not_block_other_users(self):
+        other = os.path.join(self.tmp.name, "other.db")
+        make_db(other).close()
+        reading, release = threading.Event(), threading.Event()
+
+        def slow_load(db_path):
+            if db_path == self.db_path:
+                reading.set()
+                release.wait(5)
+            return load_profile(db_path)
+
+        with mock.patch.object(user_profile, "load_profile", slow_load):
+            slow = threading.Thread(target=get_user_profile, args=(self.db_path,))
+            slow.start()
+            try:
+                self.assertTrue(reading.wait(5))
+                done = threading.Event()
+
+                def read_other():
+                    get_user_profile(other)
+                    done.set()
+
+                threading.Thread(target=read_other, daemon=True).start()
+                self.assertTrue(done.wait(2))  # served while the first read is still in progress
+            finally:
+                release.set()
+                slow.join()
+        self.assertIn(self.db_path, user_profile._profiles)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# utils/artifacts.py
+"""
+On-disk format for embedding artifacts.
+
+An artifact directory holds:
+  - vectors.npy    float32 matrix, one row per anime (rows x dim)
+  - ids.npy        int64 array of anime IDs aligned with the vector rows
+  - hashes.npy     (optional) uint64 content hash of each row's embedding text,
+                   used by incremental builds to re-embed only changed rows
+  - manifest.json  format version, model name, dim, row count and source DB checksum
+
+Both arrays are plain .npy files so readers can memory-map them instead of
+unpickling, which keeps startup near-instant and lets several workers share
+the OS page cache.
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 1
+ARTIFACT_DIR = "embeddings"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+HASHES_FILE = "hashes.npy"
+MANIFEST_FILE = "manifest.json"
+
+def file_checksum(path, chunk_size=1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of a file, or an empty string if it does not exist.
+    """
+    if not path or not os.path.exists(path):
+        return ""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_hash(text: str) -> int:
+    """
+    Returns a stable 64-bit hash of an embedding text.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def write_artifacts(artifact_dir, ids, embeddings, model_name, source_db=None, extra=None, hashes=None) -> dict:
+    """
+    Writes ids, vectors and a manifest into artifact_dir and returns the manifest.
+    Files are written under temporary names and renamed into place so readers
+    never observe a half-written array. Keys in extra (e.g. index build settings)
+    are recorded in the manifest as-is. hashes, if given, are the per-row content hashes.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or embeddings.shape[0] != ids.shape[0]:
+        raise ValueError(f"Expected a (rows x dim) matrix for {ids.shape[0]} ids, got shape {embeddings.shape}")
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model": model_name,
+        "dim": int(embeddings.shape[1]),
+        "rows": int(embeddings.shape[0]),
+        "dtype": "float32",
+        "source_db": os.path.basename(source_db) if source_db else "",
+        "source_db_sha256": file_checksum(source_db),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    if extra:
+        manifest.update(extra)
+
+    arrays = [(VECTORS_FILE, embeddings), (IDS_FILE, ids)]
+    if hashes is not None:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if hashes.shape != ids.shape:
+            raise ValueError(f"Expected {ids.shape[0]} content hashes, got {hashes.shape[0]}")
+        arrays.append((HASHES_FILE, hashes))
+        manifest["has_hashes"] = True
+    elif os.path.exists(os.path.join(artifact_dir, HASHES_FILE)):
+        # Stale hashes from an earlier build would no longer line up with the new rows.
+        os.remove(os.path.join(artifact_dir, HASHES_FILE))
+
+    for name, array in arrays:
+        tmp_path = os.path.join(artifact_dir, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(artifact_dir, name))
+
+    tmp_manifest = os.path.join(artifact_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(artifact_dir, MANIFEST_FILE))
+    return manifest
+
+def has_artifacts(artifact_dir=ARTIFACT_DIR) -> bool:
+    return os.path.exists(os.path.join(artifact_dir, MANIFEST_FILE))
+
+def load_manifest(artifact_dir=ARTIFACT_DIR) -> dict:
+    with open(os.path.join(artifact_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    version = manifest.get("format_version")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding artifact format version {version} in {artifact_dir}")
+    return manifest
+
+def load_ids(artifact_dir=ARTIFACT_DIR) -> np.ndarray:
+    """
+    Memory-maps only the id array; the vectors are never touched.
+    """
+    return np.load(os.path.join(artifact_dir, IDS_FILE), mmap_mode="r")
+
+def load_vectors(artifact_dir=ARTIFACT_DIR) -> np.ndarray:
+    return np.load(os.path.join(artifact_dir, VECTORS_FILE), mmap_mode="r")
+
+def load_hashes(artifact_dir=ARTIFACT_DIR):
+    """
+    Returns the per-row content hashes, or None for artifacts written without them.
+    """
+    path = os.path.join(artifact_dir, HASHES_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+def load_artifacts(artifact_dir=ARTIFACT_DIR):
+    """
+    Returns (ids, vectors, manifest) with both arrays memory-mapped read-only.
+    """
+    manifest = load_manifest(artifact_dir)
+    ids = load_ids(artifact_dir)
+    vectors = load_vectors(artifact_dir)
+    if ids.shape[0] != manifest["rows"] or vectors.shape != (manifest["rows"], manifest["dim"]):
+        raise ValueError(
+            f"Artifact arrays in {artifact_dir} do not match the manifest "
+            f"(ids {ids.shape}, vectors {vectors.shape}, manifest rows={manifest['rows']} dim={manifest['dim']})"
+        )
+    return ids, vectors, manifest
+
+def convert_pickle(pickle_file, artifact_dir=ARTIFACT_DIR, model_name="all-mpnet-base-v2", source_db=None) -> dict:
+    """
+    Converts a legacy embeddings pickle into the artifact format.
+
+    Accepts both layouts found in this repo: {"ids": [...], "embeddings": array}
+    written by build_faiss_index.py, and {anime_id: vector} written by
+    older versions of generate_embeddings.py.
+    """
+    with open(pickle_file, "rb") as f:
+        data = pickle.load(f)
+
+    if isinstance(data, dict) and "ids" in data and "embeddings" in data:
+        ids, embeddings = data["ids"], data["embeddings"]
+    elif isinstance(data, dict):
+        ids = list(data.keys())
+        embeddings = np.stack([np.asarray(data[anime_id]) for anime_id in ids]) if ids else np.zeros((0, 0))
+    else:
+        raise ValueError(f"Unrecognized embeddings pickle layout in {pickle_file}")
+
+    return write_artifacts(artifact_dir, ids, embeddings, model_name, source_db=source_db)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a legacy embeddings pickle into the mmap-able artifact format.")
+    parser.add_argument("pickle_file", nargs="?", default="embeddings_cache.pkl")
+    parser.add_argument("artifact_dir", nargs="?", default=ARTIFACT_DIR)
+    parser.add_argument("--model", default="all-mpnet-base-v2", help="Model the pickle was encoded with")
+    parser.add_argument("--db", default="anilist_global.db", help="Source database to checksum into the manifest")
+    args = parser.parse_args()
+
+    manifest = convert_pickle(args.pickle_file, args.artifact_dir, model_name=args.model, source_db=args.db)
+    print(f"Wrote {manifest['rows']} x {manifest['dim']} vectors to {args.artifact_dir}")
+
+if __name__ == "__main__":
+    main()
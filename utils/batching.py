@@ -0,0 +1,127 @@
+# utils/batching.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class QueryBatcher:
+    """
+    Collects concurrent query searches into micro-batches.
+
+    Callers submit (query, k, shards) and wait on a Future. A single worker thread takes
+    the first pending request, keeps collecting until either max_batch requests
+    are queued or max_wait_ms has passed, then runs one batched encode and one
+    batched index search for the whole group and fans the results back out.
+    Requests restricted to different shard selections are searched as separate groups.
+
+    get_engine is called once per batch, so a swapped-in engine is picked up
+    without restarting the batcher.
+    """
+
+    def __init__(self, get_engine, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.get_engine = get_engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)  # Wake the worker if it is blocked on an empty queue.
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, query: str, k: int, shards=None) -> Future:
+        future = Future()
+        if self._thread is None:
+            future.set_exception(RuntimeError("QueryBatcher has not been started"))
+            return future
+        self._queue.put((query, k, tuple(shards) if shards else None, future))
+        return future
+
+    def search(self, query: str, k: int, timeout: float = None, shards=None) -> list:
+        return self.submit(query, k, shards).result(timeout=timeout)
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[2], []).append(item)
+
+            try:
+                engine = self.get_engine()
+            except Exception as e:
+                for item in batch:
+                    item[3].set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for shards, group in groups.items():
+                self._run_group(engine, shards, group)
+
+        # Fail anything still queued so callers do not hang after shutdown.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[3].set_running_or_notify_cancel():
+                item[3].set_exception(RuntimeError("QueryBatcher stopped"))
+
+    def _run_group(self, engine, shards, group):
+        queries = [query for query, _, _, _ in group]
+        k = max(k for _, k, _, _ in group)
+        try:
+            results = engine.search_batch(queries, k, list(shards) if shards else None)
+        except Exception as e:
+            for _, _, _, future in group:
+                future.set_exception(e)
+            return
+        for (_, item_k, _, future), ids in zip(group, results):
+            future.set_result(ids[:item_k])
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
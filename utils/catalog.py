@@ -0,0 +1,195 @@
+# utils/catalog.py
+import os
+import time
+import sqlite3
+import threading
+
+from utils.db import load_global_anime_info
+
+CATALOG_DB_PATH = "anilist_global.db"
+
+# How often (seconds) the background refresher checks anilist_global.db for changes; 0 disables it.
+CATALOG_REFRESH_INTERVAL = float(os.environ.get("CATALOG_REFRESH_INTERVAL") or 30)
+
+def media_from_info(anime_info: dict) -> list:
+    """
+    The catalog as get_global_media() returns it: ID, titles, genres and tags per anime.
+    Average score and popularity are left out, as the baseline recommender has always scored without them.
+    Other media types (see CATALOG_MEDIA_TYPES) are left out too: personal lists hold anime only.
+    """
+    return [
+        {
+            "id": anime_id,
+            "title_romaji": info["title_romaji"],
+            "title_english": info["title_english"],
+            "title_native": info["title_native"],
+            "genres": info["genres"],
+            "tags": info["tags"],
+        }
+        for anime_id, info in anime_info.items()
+        if info.get("type", "ANIME") == "ANIME"
+    ]
+
+class Catalog:
+    """
+    One parsed snapshot of global_media, shared by every router.
+
+    - info: load_global_anime_info() output (with tags), keyed by anime ID.
+    - media: the anime entries as a list, in the shape the baseline recommender scores.
+    - version: fingerprint of the database the snapshot was read from.
+    - db_path: that database.
+
+    Structures built from the snapshot (quality table, recommender matrix, local reranker,
+    fuzzy-search titles) are memoized with
+    derived() and rebuilt by the refresher for the next snapshot before it is swapped in.
+    """
+
+    def __init__(self, info: dict, version: str = "", db_path: str = CATALOG_DB_PATH):
+        self.info = info
+        self.media = media_from_info(info)
+        self.version = version
+        self.db_path = db_path
+        self.loaded_at = time.time()
+        self._derived = {}  # name -> (build, value)
+        self._lock = threading.Lock()
+
+    def derived(self, name: str, build):
+        """
+        Returns build(self), computed once per snapshot.
+        """
+        with self._lock:
+            entry = self._derived.get(name)
+            if entry is None:
+                entry = (build, build(self))
+                self._derived[name] = entry
+            return entry[1]
+
+    def warm_like(self, other: "Catalog"):
+        """
+        Builds every derived structure other has, so requests never build them on this snapshot.
+        """
+        for name, (build, _) in list(other._derived.items()):
+            self.derived(name, build)
+
+class CatalogCache:
+    """
+    Loads the catalog once and swaps in a fresh snapshot when anilist_global.db changes.
+
+    Changes are detected with a fingerprint of PRAGMA data_version (bumped when another
+    connection commits) plus the inode, mtime and size of the database and its WAL file, which
+    also catches a replaced file. A background thread checks every interval_seconds and, on a
+    change, reads and parses the table and rebuilds the derived structures off the request path.
+    Requests keep the snapshot they started with.
+    """
+
+    def __init__(self, db_path: str = CATALOG_DB_PATH, interval_seconds: float = CATALOG_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval_seconds
+        self.refreshes = 0
+        self.last_error = None
+        self.last_check_at = None
+        self._catalog = None
+        self._conn = None
+        self._conn_inode = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def fingerprint(self) -> str:
+        parts = []
+        for name in (self.db_path, self.db_path + "-wal"):
+            if os.path.exists(name):
+                stat = os.stat(name)
+                parts.append(f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}")
+        inode = os.stat(self.db_path).st_ino
+        if self._conn is None or inode != self._conn_inode:
+            # A replaced file needs a new connection for its data_version to be meaningful.
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn_inode = inode
+        parts.append(str(self._conn.execute("PRAGMA data_version").fetchone()[0]))
+        return "|".join(parts)
+
+    def _load(self) -> Catalog:
+        version = self.fingerprint()  # taken first, so a write during the read is picked up next check
+        return Catalog(load_global_anime_info(self.db_path, with_tags=True), version, self.db_path)
+
+    def get(self) -> Catalog:
+        catalog = self._catalog
+        if catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = self._load()
+                catalog = self._catalog
+        return catalog
+
+    def check(self, force: bool = False) -> bool:
+        """
+        Loads a new snapshot if the database changed since the served one was read.
+        Returns True if the snapshot was replaced.
+        """
+        with self._lock:
+            self.last_check_at = time.time()
+            current = self._catalog
+            if current is None:
+                return False
+            if not force and self.fingerprint() == current.version:
+                return False
+            catalog = self._load()
+            catalog.warm_like(current)
+            self._catalog = catalog
+            self.refreshes += 1
+            self.last_error = None
+        print(f"DEBUG: Catalog refreshed ({len(catalog.info)} entries).")
+        return True
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"DEBUG: Catalog refresh check failed: {e}")
+
+    def stats(self) -> dict:
+        catalog = self._catalog
+        return {
+            "db_path": self.db_path,
+            "entries": len(catalog.info) if catalog is not None else None,
+            "loaded_at": catalog.loaded_at if catalog is not None else None,
+            "interval_seconds": self.interval,
+            "refreshes": self.refreshes,
+            "last_check_at": self.last_check_at,
+            "last_error": self.last_error,
+        }
+
+_catalog_cache = CatalogCache()
+
+def get_catalog() -> Catalog:
+    """
+    Returns the current catalog snapshot, loading it on first use.
+    """
+    return _catalog_cache.get()
+
+def get_catalog_cache() -> CatalogCache:
+    return _catalog_cache
+
+def start_catalog_refresher():
+    _catalog_cache.start()
+
+def stop_catalog_refresher():
+    _catalog_cache.stop()
@@ -1,13 +1,59 @@
 # utils/db.py
+import os
+import re
 import sqlite3
 import json
 
-def load_global_anime_info(db_path="anilist_global.db"):
+# Media types the catalog snapshot serves (titles, quality scores) from global_media, comma-separated.
+# Add MANGA to serve /query?shards=MANGA; personalized recommendations always use ANIME only.
+CATALOG_MEDIA_TYPES = tuple(
+    t.strip().upper() for t in (os.environ.get("CATALOG_MEDIA_TYPES") or "ANIME").split(",") if t.strip()
+)
+
+def global_media_columns(conn) -> set:
+    return {row[1] for row in conn.execute("PRAGMA table_info(global_media)")}
+
+def has_derived_columns(conn) -> bool:
+    """
+    True if db/migrate_db.py has materialized the derived columns into global_media.
+    """
+    columns = global_media_columns(conn)
+    return {"display_title", "best_tv_rank", "quality_score", "format_norm"} <= columns
+
+def media_type_filter(conn, media_types) -> str:
+    """
+    SQL WHERE clause restricting global_media to media_types (e.g. ("ANIME",)), or "" for every
+    type when media_types is None. Rows with no type, like every row of databases older than the
+    type column, predate manga ingest and count as ANIME.
+    """
+    if media_types is None:
+        return ""
+    types = [t.upper() for t in media_types]
+    for media_type in types:
+        if not re.fullmatch(r"[A-Z_]+", media_type):
+            raise ValueError(f"Invalid media type '{media_type}'")
+    if "type" not in global_media_columns(conn):
+        return "" if "ANIME" in types else "WHERE 0"
+    return f"WHERE COALESCE(type, 'ANIME') IN ({', '.join(repr(t) for t in types)})"
+
+def load_global_anime_info(db_path="anilist_global.db", with_tags=False, media_types=CATALOG_MEDIA_TYPES):
+    """
+    Returns {anime_id: info} for the rows of global_media of the given media types (all if None).
+    """
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    query = """
-    SELECT id, title_english, title_romaji, title_native, average_score, popularity, genres, rankings, format
+    # With the derived columns, titles, TV rank and quality come ready-made and the rankings
+    # JSON is not parsed; databases that were never migrated are read as before.
+    derived = has_derived_columns(conn)
+    where = media_type_filter(conn, media_types)
+    has_type = "type" in global_media_columns(conn)
+    query = f"""
+    SELECT id, title_english, title_romaji, title_native, average_score, popularity, genres,
+           {"display_title, best_tv_rank, quality_score" if derived else "rankings"},
+           {"tags, " if with_tags else ""}format,
+           {"COALESCE(type, 'ANIME')" if has_type else "'ANIME'"}
     FROM global_media
+    {where}
     """
     cursor.execute(query)
     results = cursor.fetchall()
@@ -19,23 +65,48 @@ def load_global_anime_info(db_path="anilist_global.db"):
             genres = json.loads(row[6]) if row[6] else []
         except Exception:
             genres = []
-        try:
-            rankings = json.loads(row[7]) if row[7] else []
-        except Exception:
-            rankings = []
-        anime_info[anime_id] = {
+        info = {
             "title_english": row[1],
             "title_romaji": row[2],
             "title_native": row[3],
             "average_score": row[4],
             "popularity": row[5],
             "genres": genres,
-            "rankings": rankings,
-            "format": row[8] if row[8] else ""
+            "format": row[-2] if row[-2] else "",
+            "type": row[-1]
         }
+        if derived:
+            info["display_title"], info["best_tv_rank"], info["quality_score"] = row[7], row[8], row[9]
+        else:
+            try:
+                info["rankings"] = json.loads(row[7]) if row[7] else []
+            except Exception:
+                info["rankings"] = []
+        if with_tags:
+            try:
+                info["tags"] = json.loads(row[-3]) if row[-3] else []
+            except Exception:
+                info["tags"] = []
+        anime_info[anime_id] = info
     return anime_info
 
-def load_embeddings_cache(embeddings_file="embeddings_cache.pkl"):
+def get_global_anime_info() -> dict:
+    """
+    Returns the global metadata of the current catalog snapshot (see utils.catalog), shared
+    by the routers instead of re-reading the table per request.
+    """
+    from utils.catalog import get_catalog
+    return get_catalog().info
+
+def load_embeddings_cache(embeddings_file="embeddings_cache.pkl", artifact_dir="embeddings"):
+    """
+    Returns {"ids", "embeddings"}, memory-mapped from the artifact directory when it exists
+    and unpickled from the legacy cache file otherwise.
+    """
+    from utils.artifacts import has_artifacts, load_artifacts
+    if has_artifacts(artifact_dir):
+        ids, embeddings, _ = load_artifacts(artifact_dir)
+        return {"ids": ids, "embeddings": embeddings}
     import pickle
     with open(embeddings_file, "rb") as f:
-        return pickle.load(f)
\ No newline at end of file
+        return pickle.load(f)
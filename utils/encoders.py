@@ -0,0 +1,103 @@
+# utils/encoders.py
+"""
+Registry of query/document encoders.
+
+The encoder is configured in one place, the ENCODER environment variable (or --encoder for
+the build scripts), and every build records it in the artifact manifest. At startup the
+retrieval engine checks the configured encoder against that record and refuses to serve
+an index built in a different embedding space.
+
+Encoders that share a model (e.g. "mpnet" and its int8-quantized variant "mpnet-int8")
+produce vectors in the same space, so an index built with one can be queried with the other.
+"""
+import os
+
+class EncoderSpec:
+    """
+    A named encoder: the sentence-transformers model it wraps and the runtime backend.
+
+    Backends:
+      torch  the model as published (float32 PyTorch)
+      int8   PyTorch with nn.Linear layers dynamically quantized to int8 (CPU only)
+      onnx   ONNX Runtime export via sentence-transformers (needs optimum[onnxruntime])
+    """
+
+    def __init__(self, name: str, model: str, backend: str = "torch"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown encoder backend '{backend}'; choose one of {', '.join(BACKENDS)}")
+        self.name = name
+        self.model = model
+        self.backend = backend
+
+    def to_manifest(self, dim: int) -> dict:
+        return {"name": self.name, "model": self.model, "backend": self.backend, "dim": dim}
+
+    def __repr__(self):
+        return f"EncoderSpec({self.name!r}, model={self.model!r}, backend={self.backend!r})"
+
+BACKENDS = ("torch", "int8", "onnx")
+
+ENCODERS = {
+    spec.name: spec for spec in (
+        EncoderSpec("mpnet", "all-mpnet-base-v2"),
+        EncoderSpec("mpnet-int8", "all-mpnet-base-v2", backend="int8"),
+        EncoderSpec("mpnet-onnx", "all-mpnet-base-v2", backend="onnx"),
+        EncoderSpec("minilm", "all-MiniLM-L6-v2"),
+        EncoderSpec("minilm-int8", "all-MiniLM-L6-v2", backend="int8"),
+    )
+}
+
+DEFAULT_ENCODER = "mpnet"
+ENCODER = os.environ.get("ENCODER") or DEFAULT_ENCODER
+
+def get_encoder_spec(name: str = None) -> EncoderSpec:
+    name = name or ENCODER
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder '{name}'. Available: {', '.join(ENCODERS)}")
+    return ENCODERS[name]
+
+def quantize_int8(model):
+    """
+    Returns a copy of a PyTorch model with every nn.Linear dynamically quantized to int8.
+    Weights are stored as int8 and activations quantized on the fly, which typically
+    speeds up CPU inference of transformer encoders by 1.5-3x at a small accuracy cost.
+    """
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_encoder(name: str = None):
+    """
+    Loads the named encoder (ENCODER by default). Every backend returns a SentenceTransformer,
+    so callers use encode() / get_sentence_embedding_dimension() regardless of the runtime.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    spec = get_encoder_spec(name)
+    if spec.backend == "onnx":
+        try:
+            return SentenceTransformer(spec.model, backend="onnx")
+        except ImportError as e:
+            raise ImportError(f"Encoder '{spec.name}' needs ONNX Runtime: pip install 'optimum[onnxruntime]' ({e})") from e
+
+    model = SentenceTransformer(spec.model, device="cpu" if spec.backend == "int8" else None)
+    if spec.backend == "int8":
+        model = quantize_int8(model)
+    return model
+
+def check_index_encoder(spec: EncoderSpec, dim: int, manifest: dict = None, index_dim: int = None):
+    """
+    Raises ValueError if an index was not built in this encoder's embedding space.
+
+    manifest is the artifact manifest of the index (None for legacy pickles, where only
+    the index dimension can be compared). Backends of the same model are compatible.
+    """
+    if manifest:
+        built = manifest.get("encoder") or {"name": manifest.get("model"), "model": manifest.get("model")}
+        if built.get("model") is not None and built.get("model") != spec.model:
+            raise ValueError(
+                f"Index was built with encoder '{built.get('name')}' (model {built.get('model')}) but ENCODER is "
+                f"'{spec.name}' (model {spec.model}). Rebuild the index or set ENCODER to a matching encoder."
+            )
+        index_dim = manifest.get("dim", index_dim)
+    if index_dim is not None and index_dim != dim:
+        raise ValueError(f"Index has {index_dim}-dim vectors but encoder '{spec.name}' produces {dim}-dim vectors")
@@ -0,0 +1,90 @@
+# utils/execution.py
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+# CPU-bound request stages (encoding, FAISS search, scoring) run on this dedicated pool
+# instead of FastAPI's shared default threadpool.
+QUERY_CPU_WORKERS = int(os.environ.get("QUERY_CPU_WORKERS") or os.cpu_count() or 4)
+
+# Admission control for /query: at most QUERY_MAX_CONCURRENCY requests are processed at once
+# and at most QUERY_MAX_QUEUE more may wait; anything beyond that is rejected with a 503.
+QUERY_MAX_CONCURRENCY = int(os.environ.get("QUERY_MAX_CONCURRENCY", "16"))
+QUERY_MAX_QUEUE = int(os.environ.get("QUERY_MAX_QUEUE", "64"))
+QUERY_RETRY_AFTER_SECONDS = int(os.environ.get("QUERY_RETRY_AFTER_SECONDS", "1"))
+
+_cpu_executor = None
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(max_workers=QUERY_CPU_WORKERS, thread_name_prefix="query-cpu")
+    return _cpu_executor
+
+def shutdown_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=True)
+        _cpu_executor = None
+
+async def run_cpu(fn, *args):
+    """
+    Runs a CPU-bound function on the dedicated executor and awaits its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), fn, *args)
+
+class AdmissionController:
+    """
+    Bounds how many requests are in flight and how many may queue behind them.
+
+    Use as `async with controller:` around a request. When the queue is already
+    full the request is rejected immediately with 503 and a Retry-After header,
+    so latency stays bounded instead of growing with an invisible backlog.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after_seconds: int = 1):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._semaphore = None
+
+    async def __aenter__(self):
+        # Created lazily so the semaphore binds to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly.",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
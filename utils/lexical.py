@@ -0,0 +1,150 @@
+# utils/lexical.py
+"""
+Keyword (BM25) retrieval over the SQLite FTS5 table built by core/search/build_lexical_index.py,
+and reciprocal-rank fusion of keyword and dense results.
+"""
+import re
+import sqlite3
+import threading
+
+from utils.db import global_media_columns
+
+FTS_TABLE = "global_media_fts"
+
+# Column weights for bm25(): a keyword in a title counts far more than one in a description.
+FTS_COLUMNS = ("title", "description", "genres", "tags")
+FTS_WEIGHTS = (10.0, 1.0, 3.0, 3.0)
+
+# Constant from Cormack et al. (2009); damps the influence of the very top ranks.
+RRF_K = 60
+
+# Words that carry no meaning for keyword matching in natural-language queries.
+STOPWORDS = frozenset("""
+a about an and any anime are as at be but by do for from give good has have i in is it
+like looking manga me more my of on or recommend recommendations series show shows similar
+so some something that the their there these this to want watch where which who with
+""".split())
+
+def query_words(query: str) -> list:
+    """
+    Returns the distinct lowercase words of a query that are worth matching, in order.
+    """
+    words = []
+    for word in re.findall(r"\w+", query.lower()):
+        if len(word) > 1 and word not in STOPWORDS and word not in words:
+            words.append(word)
+    return words
+
+def to_match_query(query: str):
+    """
+    Turns a natural-language query into an FTS5 MATCH expression: every remaining word,
+    quoted (so FTS5 operators in user input are inert) and OR-ed together. BM25 then
+    rewards rows that match more, and rarer, words. Returns None if no word is left.
+    """
+    words = query_words(query)
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in words)
+
+def reciprocal_rank_fusion(rankings, limit: int = None, k: int = RRF_K) -> list:
+    """
+    Merges several ranked ID lists: each ID scores sum(1 / (k + rank)) over the lists it
+    appears in (rank starting at 1). Only ranks are used, so BM25 and vector distances never
+    have to be calibrated against each other. Ties keep the order of first appearance.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+class LexicalIndex:
+    """
+    BM25 search over the FTS5 table in the global database.
+
+    Each thread keeps its own read connection. The table is rebuilt in a single transaction,
+    so searches see either the old or the new contents and never need a reload.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.is_available = None  # available() as of the last refresh(); None before the first
+        self._columns = None  # global_media columns, read on the first filtered search
+        self._local = threading.local()
+        self.searches = 0
+        self.empty_queries = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def available(self) -> bool:
+        """
+        True if the FTS table has been built.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+            ).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def refresh(self) -> bool:
+        """
+        Re-checks available() and caches the answer in is_available, so requests do not query
+        sqlite_master. Called when the retrieval engine is loaded or hot-swapped.
+        """
+        self.is_available = self.available()
+        self._columns = None  # re-read, as a migration may have added columns
+        return self.is_available
+
+    def _shard_expression(self, column: str) -> str:
+        """
+        SQL for the shard name of a global_media row m: format_norm (materialized by
+        db/migrate_db.py) for formats when the column exists, else the raw column.
+        """
+        if self._columns is None:
+            self._columns = global_media_columns(self._connection())
+        if column == "type":
+            # Rows with no type, like every row of databases older than the column, are anime.
+            return "COALESCE(m.type, 'ANIME')" if "type" in self._columns else "'ANIME'"
+        if "format_norm" in self._columns:
+            return "m.format_norm"
+        return "COALESCE(NULLIF(UPPER(TRIM(m.format)), ''), 'UNKNOWN')"
+
+    def search(self, query: str, k: int = 20, filter_column: str = None, filter_values=None) -> list:
+        """
+        Returns up to k global_media IDs, best BM25 match first. filter_column / filter_values
+        optionally restrict the results the way shards do (e.g. "type", ["MANGA"]).
+        """
+        self.searches += 1
+        match = to_match_query(query)
+        if match is None:
+            self.empty_queries += 1
+            return []
+        sql = f"SELECT f.rowid FROM {FTS_TABLE} f"
+        params = [match]
+        where = f"{FTS_TABLE} MATCH ?"
+        if filter_column is not None:
+            if filter_column not in ("type", "format"):
+                raise ValueError(f"Cannot filter keyword results by '{filter_column}'")
+            # Rows with no type/format are grouped the same way build_shards groups them.
+            values = list(filter_values)
+            sql += " JOIN global_media m ON m.id = f.rowid"
+            where += f" AND {self._shard_expression(filter_column)} IN ({', '.join('?' * len(values))})"
+            params.extend(values)
+        sql += f" WHERE {where} ORDER BY f.rank LIMIT ?"
+        params.append(k)
+        return [row[0] for row in self._connection().execute(sql, params)]
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available(),
+            "searches": self.searches,
+            "empty_queries": self.empty_queries,
+        }
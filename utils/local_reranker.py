@@ -0,0 +1,200 @@
+# utils/local_reranker.py
+"""
+In-process candidate reranker: a linear model over a handful of query-item features.
+
+It mirrors what the Gemini rerank prompt asks for (TV over shorts and OVAs, high scores,
+popular titles) plus how well each candidate matches the query. The weights start from a
+hand-set default and can be distilled from logged Gemini orderings with
+`python -m core.search.fit_reranker`.
+"""
+import os
+import json
+import math
+import sqlite3
+import numpy as np
+
+from utils.catalog import get_catalog
+from utils.lexical import query_words
+
+LOCAL_RERANKER_WEIGHTS = os.environ.get("LOCAL_RERANKER_WEIGHTS", "reranker_weights.json")
+
+FEATURES = (
+    "similarity",    # cosine between the query and the candidate's stored embedding
+    "score",         # average_score / 100
+    "popularity",    # log-scaled, 1.0 at 1,000,000 users
+    "ranking",       # best AniList rank as (100 - rank) / 100, 0 outside the top 100
+    "is_tv",
+    "is_movie",
+    "is_ova",        # OVA, ONA, SPECIAL
+    "is_short",      # TV_SHORT
+    "tag_overlap",   # share of query words found in the candidate's genres and important tags
+)
+
+# Starting point before any fit, following the preferences spelled out in the Gemini prompt.
+DEFAULT_WEIGHTS = {
+    "similarity": 2.0,
+    "score": 1.5,
+    "popularity": 1.0,
+    "ranking": 0.5,
+    "is_tv": 0.5,
+    "is_movie": 0.2,
+    "is_ova": -0.3,
+    "is_short": -1.0,
+    "tag_overlap": 1.0,
+}
+
+# Same importance cut-off as the embedding text.
+TAG_THRESHOLD = 60
+_POPULARITY_SCALE = math.log1p(1_000_000)
+
+def _fold(word: str) -> str:
+    # Crude plural folding so "vampires" in a query matches the "Vampire" tag.
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def item_words(genres: list, tags: list) -> frozenset:
+    names = list(genres or [])
+    names += [tag["name"] for tag in tags or [] if tag.get("importance", tag.get("rank", 0)) >= TAG_THRESHOLD]
+    return frozenset(_fold(word) for name in names for word in query_words(name))
+
+def static_features(info: dict) -> list:
+    """
+    The query-independent features of one catalog entry, in FEATURES order from "score" on.
+    """
+    fmt = (info.get("format") or "").upper()
+    ranks = [r.get("rank") for r in info.get("rankings") or [] if isinstance(r.get("rank"), int) and r.get("rank") > 0]
+    return [
+        (info.get("average_score") or 0) / 100.0,
+        min(1.0, math.log1p(info.get("popularity") or 0) / _POPULARITY_SCALE),
+        max(0.0, (100 - min(ranks)) / 100.0) if ranks else 0.0,
+        float(fmt == "TV"),
+        float(fmt == "MOVIE"),
+        float(fmt in ("OVA", "ONA", "SPECIAL")),
+        float(fmt == "TV_SHORT"),
+    ]
+
+def _parse_json(text, default):
+    try:
+        return json.loads(text) if text else default
+    except Exception:
+        return default
+
+def load_weights(path: str = LOCAL_RERANKER_WEIGHTS) -> np.ndarray:
+    """
+    Returns the weight vector in FEATURES order from a fitted weights file, or the defaults
+    if there is none. A file fitted with a different feature list is ignored.
+    """
+    weights = DEFAULT_WEIGHTS
+    if path and os.path.exists(path):
+        with open(path) as f:
+            fitted = json.load(f)
+        if tuple(fitted.get("features", ())) == FEATURES:
+            weights = dict(zip(FEATURES, fitted["weights"]))
+        else:
+            print(f"DEBUG: {path} was fitted with other features; using default reranker weights.")
+    return np.array([weights[name] for name in FEATURES], dtype=np.float32)
+
+class LocalReranker:
+    """
+    Scores candidates as features @ weights. Query-independent features are precomputed
+    per catalog entry, so a rerank is a few small NumPy operations over the candidates.
+    """
+
+    def __init__(self, catalog: dict, weights: np.ndarray = None):
+        """
+        catalog maps anime ID to a dict with average_score, popularity, rankings, format,
+        genres and tags (parsed lists), as read by load_catalog.
+        """
+        self.weights = load_weights() if weights is None else np.asarray(weights, dtype=np.float32)
+        self.row_of = {anime_id: row for row, anime_id in enumerate(catalog)}
+        self.static = np.array([static_features(info) for info in catalog.values()], dtype=np.float32).reshape(len(catalog), len(FEATURES) - 2)
+        self.words = [item_words(info.get("genres"), info.get("tags")) for info in catalog.values()]
+
+    def features(self, query: str, query_vector, candidate_ids: list, candidate_vectors=None) -> np.ndarray:
+        """
+        Returns the (len(candidate_ids) x len(FEATURES)) feature matrix. Without candidate
+        vectors (sharded or legacy indexes) similarity is 0 for every candidate. Unknown
+        IDs get zero catalog features.
+        """
+        n = len(candidate_ids)
+        out = np.zeros((n, len(FEATURES)), dtype=np.float32)
+        if n == 0:
+            return out
+        if candidate_vectors is not None and query_vector is not None:
+            vectors = np.asarray(candidate_vectors, dtype=np.float32)
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+            out[:, 0] = np.divide(vectors @ query_vector, norms, out=np.zeros(n, dtype=np.float32), where=norms > 0)
+        words = {_fold(word) for word in query_words(query)}
+        for i, anime_id in enumerate(candidate_ids):
+            row = self.row_of.get(anime_id)
+            if row is None:
+                continue
+            out[i, 1:-1] = self.static[row]
+            if words:
+                out[i, -1] = len(words & self.words[row]) / len(words)
+        return out
+
+    def rerank(self, query: str, query_vector, candidate_ids: list, candidate_vectors=None, limit: int = None) -> list:
+        """
+        Returns the candidate IDs, best first, cut to limit if given.
+        """
+        scores = self.features(query, query_vector, candidate_ids, candidate_vectors) @ self.weights
+        order = np.argsort(-scores, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [candidate_ids[i] for i in order]
+
+def load_catalog(db_path: str = "anilist_global.db") -> dict:
+    """
+    Reads the columns the local reranker needs from global_media, with JSON columns parsed.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT id, average_score, popularity, rankings, format, genres, tags FROM global_media"
+        ).fetchall()
+    finally:
+        conn.close()
+    return {
+        row[0]: {
+            "average_score": row[1],
+            "popularity": row[2],
+            "rankings": _parse_json(row[3], []),
+            "format": row[4] or "",
+            "genres": _parse_json(row[5], []),
+            "tags": _parse_json(row[6], []),
+        }
+        for row in rows
+    }
+
+def catalog_entries(catalog) -> dict:
+    """
+    load_catalog output built from a shared catalog snapshot (see utils.catalog). The rankings
+    column is read from the snapshot's database only if the snapshot was loaded without it
+    (load_global_anime_info keeps just the best TV rank of migrated databases).
+    """
+    rankings = None
+    if any("rankings" not in info for info in catalog.info.values()):
+        conn = sqlite3.connect(catalog.db_path)
+        try:
+            rankings = {row[0]: _parse_json(row[1], []) for row in conn.execute("SELECT id, rankings FROM global_media")}
+        finally:
+            conn.close()
+    return {
+        anime_id: {
+            "average_score": info.get("average_score"),
+            "popularity": info.get("popularity"),
+            "rankings": info["rankings"] if rankings is None else rankings.get(anime_id, []),
+            "format": info.get("format") or "",
+            "genres": info.get("genres") or [],
+            "tags": info.get("tags") or [],
+        }
+        for anime_id, info in catalog.info.items()
+    }
+
+def get_local_reranker() -> LocalReranker:
+    """
+    Returns the local reranker of the current catalog snapshot, built once per snapshot, so the
+    catalog refresher rebuilds it (and re-reads the weights) after a re-ingest.
+    """
+    return get_catalog().derived("local_reranker", lambda catalog: LocalReranker(catalog_entries(catalog)))
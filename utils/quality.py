@@ -1,4 +1,5 @@
 # utils/quality.py
+import numpy as np
 
 def compute_quality_score(info: dict) -> float:
     """
@@ -28,15 +29,9 @@ def compute_quality_score(info: dict) -> float:
     
     if fmt == "TV":
         quality_multiplier = 1.5  # TV shows get a boost.
-        bonus = 0.0
-        rankings = info.get("rankings")
-        if rankings and isinstance(rankings, list):
-            for r in rankings:
-                if r.get("type", "").upper() == "TV":
-                    rank_value = r.get("rank")
-                    if rank_value and isinstance(rank_value, int) and rank_value > 0:
-                        bonus = max(bonus, (100 - rank_value) / 100.0)
-        return base_quality * quality_multiplier + bonus
+        # best_tv_rank is materialized by db/migrate_db.py; older rows resolve it from rankings.
+        rank = info["best_tv_rank"] if "best_tv_rank" in info else best_tv_rank(info.get("rankings"))
+        return base_quality * quality_multiplier + tv_rank_bonus(rank)
 
     elif fmt == "MOVIE":
         quality_multiplier = 1.0  # Movies use baseline quality.
@@ -52,4 +47,129 @@ def compute_quality_score(info: dict) -> float:
 
     else:
         # If format is unknown, simply return the base quality.
-        return base_quality
\ No newline at end of file
+        return base_quality
+
+# Multipliers applied to the base quality by format, as in compute_quality_score. Formats not
+# listed (including unknown) keep the base quality.
+FORMAT_MULTIPLIERS = {
+    "TV": 1.5,
+    "MOVIE": 1.0,
+    "OVA": 0.5,
+    "ONA": 0.5,
+    "SPECIAL": 0.5,
+    "TV_SHORT": 0.1,
+}
+
+def normalize_format(fmt) -> str:
+    """
+    Upper-cased, trimmed media format; missing formats become "UNKNOWN" (as format shards name them).
+    """
+    return (fmt or "").strip().upper() or "UNKNOWN"
+
+def best_tv_rank(rankings):
+    """
+    Returns the best (lowest) positive TV rank from a parsed rankings list, or None.
+    """
+    best = None
+    if rankings and isinstance(rankings, list):
+        for r in rankings:
+            if r.get("type", "").upper() == "TV":
+                rank_value = r.get("rank")
+                if rank_value and isinstance(rank_value, int) and rank_value > 0:
+                    best = rank_value if best is None else min(best, rank_value)
+    return best
+
+def tv_rank_bonus(rank) -> float:
+    """
+    The TV ranking bonus of compute_quality_score: max(0, (100 - rank) / 100), 0 without a rank.
+    """
+    return max(0.0, (100 - rank) / 100.0) if rank else 0.0
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the positions of the k highest scores, best first. Equal scores keep their
+    input order, so the result matches a stable descending sort cut to k, but only the
+    k selected entries are sorted (argpartition instead of a full sort).
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        # Everything above the k-th best score is in; ties at that score are taken in input order.
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[: k - len(above)]
+        selected = np.concatenate([above, tied])
+    else:
+        selected = np.arange(n)
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+class QualityTable:
+    """
+    compute_quality_score precomputed for a whole catalog, as a float64 array aligned with
+    sorted anime IDs. The format multiplier and TV ranking bonus are resolved once when the
+    table is built, so scoring candidates is an ID lookup plus an array gather.
+    """
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray):
+        order = np.argsort(ids, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.scores = np.asarray(scores, dtype=np.float64)[order]
+
+    @classmethod
+    def from_info(cls, anime_info: dict) -> "QualityTable":
+        """
+        Builds the table from load_global_anime_info() output. Scores equal compute_quality_score;
+        when every row carries the quality_score materialized by db/migrate_db.py it is used as is.
+        """
+        ids = np.fromiter(anime_info.keys(), dtype=np.int64, count=len(anime_info))
+        infos = list(anime_info.values())
+        materialized = [info.get("quality_score") for info in infos]
+        if infos and all(score is not None for score in materialized):
+            return cls(ids, np.array(materialized, dtype=np.float64))
+        avg = np.array([info.get("average_score") or 0 for info in infos], dtype=np.float64)
+        pop = np.array([info.get("popularity") or 0 for info in infos], dtype=np.float64)
+        formats = [(info.get("format") or "").upper() for info in infos]
+        multiplier = np.array([FORMAT_MULTIPLIERS.get(fmt, 1.0) for fmt in formats], dtype=np.float64)
+        bonus = np.array(
+            [
+                tv_rank_bonus(info["best_tv_rank"] if "best_tv_rank" in info else best_tv_rank(info.get("rankings")))
+                if fmt == "TV" else 0.0
+                for info, fmt in zip(infos, formats)
+            ],
+            dtype=np.float64,
+        )
+        base = (avg / 100.0) * 4 + (pop / 1_000_000.0) * 3
+        return cls(ids, base * multiplier + bonus)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores_for(self, anime_ids) -> np.ndarray:
+        """
+        Gathers the quality scores of anime_ids; IDs missing from the catalog score 0.
+        """
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.zeros(anime_ids.shape, dtype=np.float64)
+        positions = np.clip(np.searchsorted(self.ids, anime_ids), 0, len(self.ids) - 1)
+        found = self.ids[positions] == anime_ids
+        return np.where(found, self.scores[positions], 0.0)
+
+    def rank(self, anime_ids, top_n: int):
+        """
+        Returns (ids, scores) of the top_n anime_ids by quality, best first. Ties keep the
+        input order (e.g. the reranker's).
+        """
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        scores = self.scores_for(anime_ids)
+        top = top_k_indices(scores, top_n)
+        return anime_ids[top].tolist(), scores[top]
+
+def get_quality_table() -> QualityTable:
+    """
+    Returns the quality table over the current catalog snapshot, built once per snapshot.
+    """
+    from utils.catalog import get_catalog
+    return get_catalog().derived("quality_table", lambda catalog: QualityTable.from_info(catalog.info))
@@ -0,0 +1,184 @@
+# utils/query_cache.py
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes query text so trivially different spellings share a cache entry:
+    Unicode NFKC folding, case folding, and collapsing runs of whitespace.
+    """
+    text = unicodedata.normalize("NFKC", query or "")
+    return " ".join(text.casefold().split())
+
+class QueryEmbeddingCache:
+    """
+    Memory-bounded LRU cache of query embeddings, keyed by normalized query text.
+
+    - max_bytes bounds the total size of the cached vectors; the least recently
+      used entries are evicted first.
+    - ttl_seconds (optional) expires entries that have not been refreshed in time.
+    - db_path (optional) persists entries to a local SQLite file so a restarted
+      process starts warm. Writes are committed every commit_every puts (and on
+      close); expired rows and rows beyond max_rows (oldest first) are pruned
+      when the cache opens and every 100 puts.
+
+    Entries are scoped to a model name so vectors from a different encoder are never served.
+    """
+
+    def __init__(self, model_name: str, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = None, db_path: str = None,
+                 max_rows: int = 100_000, commit_every: int = 32):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (vector, stored_at)
+        self._bytes = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT,
+                    query TEXT,
+                    vector BLOB,
+                    dim INTEGER,
+                    stored_at REAL,
+                    PRIMARY KEY (model, query)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_stored_at ON query_embeddings (stored_at)")
+            self._prune_locked(time.time())
+            self._conn.commit()
+            self._warm_from_db()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def _put_locked(self, key: str, vector: np.ndarray, stored_at: float):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[0].nbytes
+        if vector.nbytes > self.max_bytes:
+            return
+        self._entries[key] = (vector, stored_at)
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _prune_locked(self, now: float):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM query_embeddings WHERE stored_at < ?", (now - self.ttl_seconds,))
+        (rows,) = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        if rows > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN (SELECT rowid FROM query_embeddings ORDER BY stored_at ASC LIMIT ?)",
+                (rows - self.max_rows,)
+            )
+
+    def _warm_from_db(self):
+        # Stream the most recent entries first and stop once the memory budget is full,
+        # then insert them oldest first so the newest end up most recently used.
+        rows = self._conn.execute(
+            "SELECT query, vector, stored_at FROM query_embeddings WHERE model = ? ORDER BY stored_at DESC",
+            (self.model_name,)
+        )
+        warm, size = [], 0
+        for query, blob, stored_at in rows:
+            if self._expired(stored_at):
+                break  # every later row is older
+            if size + len(blob) > self.max_bytes:
+                break
+            warm.append((query, np.frombuffer(blob, dtype=np.float32), stored_at))
+            size += len(blob)
+        rows.close()
+        with self._lock:
+            for query, vector, stored_at in reversed(warm):
+                self._put_locked(query, vector, stored_at)
+
+    def _load_from_db(self, key: str):
+        row = self._conn.execute(
+            "SELECT vector, stored_at FROM query_embeddings WHERE model = ? AND query = ?",
+            (self.model_name, key)
+        ).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+
+    def get(self, query: str):
+        """
+        Returns the cached embedding for the query, or None on a miss.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                self._bytes -= self._entries.pop(key)[0].nbytes
+                entry = None
+            if entry is None and self._conn is not None:
+                entry = self._load_from_db(key)
+                if entry is not None:
+                    self._put_locked(key, *entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, vector: np.ndarray):
+        key = normalize_query(query)
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        stored_at = time.time()
+        with self._lock:
+            self._put_locked(key, vector, stored_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, vector, dim, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.model_name, key, vector.tobytes(), vector.shape[-1], stored_at)
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._prune_locked(stored_at)
+                if self._puts % self.commit_every == 0:
+                    self._conn.commit()
+
+    def get_or_compute(self, query: str, compute) -> np.ndarray:
+        vector = self.get(query)
+        if vector is None:
+            vector = np.asarray(compute(query), dtype=np.float32)
+            self.put(query, vector)
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "persistent": self._conn is not None,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,95 @@
+# utils/reloader.py
+import time
+import threading
+
+from utils.versions import current_version
+
+class IndexReloader:
+    """
+    Hot-swaps the retrieval engine when a new index version is published.
+
+    A background thread polls the versions directory every interval_seconds. When the
+    "current" link points at a version other than the one being served, load_engine
+    builds a new engine for it (off the request path) and set_engine swaps the
+    reference. Requests already running keep the engine they started with, so none
+    are dropped. A version that fails to load is not retried until it is republished
+    or a reload is forced.
+    """
+
+    def __init__(self, versions_dir: str, get_engine, set_engine, load_engine, interval_seconds: float = 10.0):
+        self.versions_dir = versions_dir
+        self.get_engine = get_engine
+        self.set_engine = set_engine
+        self.load_engine = load_engine
+        self.interval = interval_seconds
+        self.reloads = 0
+        self.failed_version = None
+        self.last_error = None
+        self.last_check_at = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="index-reloader", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"DEBUG: Index reload check failed: {e}")
+
+    def check(self, force: bool = False) -> bool:
+        """
+        Loads and swaps in the published version if it differs from the served one.
+        Returns True if the engine was replaced.
+        """
+        with self._lock:
+            self.last_check_at = time.time()
+            if force:
+                self.last_error = None
+            engine = self.get_engine()
+            version = current_version(self.versions_dir)
+            if version is None or not engine.reloadable or version == engine.version:
+                return False
+            if version == self.failed_version and not force:
+                return False
+
+            print(f"DEBUG: Loading index version {version} (serving {engine.version})...")
+            try:
+                new_engine = self.load_engine(version, engine)
+            except Exception as e:
+                self.failed_version = version
+                self.last_error = f"{version}: {e}"
+                print(f"DEBUG: Failed to load index version {version}: {e}")
+                return False
+
+            self.set_engine(new_engine)
+            self.reloads += 1
+            self.failed_version = None
+            self.last_error = None
+            print(f"DEBUG: Now serving index version {version}.")
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "versions_dir": self.versions_dir,
+            "published_version": current_version(self.versions_dir),
+            "interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "last_check_at": self.last_check_at,
+            "failed_version": self.failed_version,
+            "last_error": self.last_error,
+        }
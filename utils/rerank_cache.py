@@ -0,0 +1,210 @@
+# utils/rerank_cache.py
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from utils.query_cache import normalize_query
+
+def candidate_set_hash(candidate_ids: list) -> str:
+    """
+    Hashes the ordered candidate IDs; the same query over a different FAISS result gets a different key.
+    """
+    return hashlib.sha1(",".join(str(int(cid)) for cid in candidate_ids).encode("utf-8")).hexdigest()
+
+def _join_ids(ids) -> str:
+    return ",".join(str(int(cid)) for cid in ids)
+
+def _split_ids(text: str) -> list:
+    return [int(cid) for cid in text.split(",") if cid]
+
+class RerankCache:
+    """
+    Persistent cache of Gemini rerank results, stored in a local SQLite table.
+
+    Entries are keyed by (normalized query, hash of the ordered candidate IDs, prompt version)
+    and hold the returned candidate_ids. Entries expire after ttl_seconds, and the table is
+    trimmed to max_rows by evicting the least recently used entries. Rows written under any
+    other prompt version are dropped when the cache is opened, so editing the rerank prompt
+    invalidates everything cached with the old one.
+
+    Hits do not write: their last_used times are collected in memory and written in one
+    transaction every touch_flush_every hits, on the next put, eviction or close.
+
+    Each row also keeps the candidate IDs Gemini was shown, so the cache doubles as the log
+    of Gemini orderings the local reranker is distilled from (see core/search/fit_reranker.py).
+    """
+
+    def __init__(self, db_path: str, prompt_version: str, ttl_seconds: float = 7 * 24 * 3600, max_rows: int = 50_000,
+                 touch_flush_every: int = 256):
+        self.db_path = db_path
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.touch_flush_every = touch_flush_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._touched = {}  # key -> last_used not yet written
+        self._unflushed_hits = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rerank_cache (
+                query TEXT,
+                candidates_hash TEXT,
+                prompt_version TEXT,
+                candidate_ids TEXT,
+                candidates TEXT,
+                stored_at REAL,
+                last_used REAL,
+                PRIMARY KEY (query, candidates_hash, prompt_version)
+            )
+        """)
+        # Caches created before candidates were logged gain the column in place.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(rerank_cache)")}
+        if "candidates" not in columns:
+            self._conn.execute("ALTER TABLE rerank_cache ADD COLUMN candidates TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rerank_cache_last_used ON rerank_cache (last_used)")
+        self._conn.execute("DELETE FROM rerank_cache WHERE prompt_version != ?", (prompt_version,))
+        self._conn.commit()
+
+    def _key(self, query: str, candidate_ids: list):
+        return (normalize_query(query), candidate_set_hash(candidate_ids), self.prompt_version)
+
+    def get(self, query: str, candidate_ids: list):
+        """
+        Returns the cached reranked IDs, or None on a miss or expired entry.
+        """
+        key = self._key(query, candidate_ids)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT candidate_ids, stored_at FROM rerank_cache WHERE query = ? AND candidates_hash = ? AND prompt_version = ?",
+                key
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self._unflushed_hits += 1
+            if self._unflushed_hits >= self.touch_flush_every:
+                self._flush_touches_locked()
+                self._conn.commit()
+            self.hits += 1
+        return _split_ids(row[0])
+
+    def _flush_touches_locked(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE rerank_cache SET last_used = ? WHERE query = ? AND candidates_hash = ? AND prompt_version = ?",
+                [(last_used,) + key for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._unflushed_hits = 0
+
+    def put(self, query: str, candidate_ids: list, reranked_ids: list):
+        key = self._key(query, candidate_ids)
+        now = time.time()
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush_touches_locked()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rerank_cache (query, candidates_hash, prompt_version, candidate_ids, candidates, stored_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (_join_ids(reranked_ids), _join_ids(candidate_ids), now, now)
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict_locked(now)
+            self._conn.commit()
+
+    def _evict_locked(self, now: float):
+        self._flush_touches_locked()
+        self._conn.execute("DELETE FROM rerank_cache WHERE stored_at < ?", (now - self.ttl_seconds,))
+        (rows,) = self._conn.execute("SELECT COUNT(*) FROM rerank_cache").fetchone()
+        if rows > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM rerank_cache WHERE rowid IN (SELECT rowid FROM rerank_cache ORDER BY last_used ASC LIMIT ?)",
+                (rows - self.max_rows,)
+            )
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked(time.time())
+            self._conn.commit()
+
+    def clear(self):
+        """
+        Drops every cached rerank result regardless of prompt version.
+        """
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM rerank_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (rows,) = self._conn.execute("SELECT COUNT(*) FROM rerank_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "rows": rows,
+            "max_rows": self.max_rows,
+            "prompt_version": self.prompt_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touches_locked()
+            self._conn.commit()
+        self._conn.close()
+
+def load_orderings(db_path: str, prompt_version: str = None) -> list:
+    """
+    Returns (query, candidate_ids, reranked_ids) for every cached Gemini ordering, optionally
+    only those of one prompt version. candidate_ids is None for rows cached before candidates
+    were logged. Reads the table directly, so no rows are expired or dropped.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(rerank_cache)")}
+        if not columns:
+            return []
+        candidates = "candidates" if "candidates" in columns else "NULL"
+        sql = f"SELECT query, {candidates}, candidate_ids FROM rerank_cache"
+        params = ()
+        if prompt_version is not None:
+            sql += " WHERE prompt_version = ?"
+            params = (prompt_version,)
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    return [(query, _split_ids(shown) if shown else None, _split_ids(reranked)) for query, shown, reranked in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the Gemini rerank result cache.")
+    parser.add_argument("--db", default="rerank_cache.db")
+    parser.add_argument("--clear", action="store_true", help="Drop every cached rerank result")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.clear:
+        conn.execute("DROP TABLE IF EXISTS rerank_cache")
+        conn.commit()
+        print(f"Cleared rerank cache in {args.db}")
+    else:
+        try:
+            rows = conn.execute(
+                "SELECT prompt_version, COUNT(*) FROM rerank_cache GROUP BY prompt_version"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        for version, count in rows:
+            print(f"prompt_version={version}: {count} entries")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
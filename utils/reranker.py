@@ -1,9 +1,13 @@
 # utils/reranker.py
 import google.generativeai as genai
+import asyncio
+import hashlib
 import json
 import os
 from dotenv import load_dotenv
 
+from utils.rerank_cache import RerankCache
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -13,6 +17,84 @@ if gemini_key is None:
     raise ValueError("GEMINI_API_KEY environment variable not set")
 genai.configure(api_key=gemini_key)
 
+RERANK_MODEL_NAME = "gemini-1.5-flash-8b"
+
+RERANK_PROMPT_TEMPLATE = (
+    "You are an expert anime recommender. Given the following candidate anime details and the user query, "
+    "please re-rank the candidates so that high-quality TV series (with high average scores and popularity) "
+    "are prioritized, while penalizing formats like TV_SHORT, OVA, ONA, or SPECIAL.\n\n"
+    "User Query: {query}\n\n"
+    "Candidates:\n"
+    "{candidates}\n\n"
+    "Return your answer as valid JSON with a single key 'candidate_ids' mapping to an array of anime IDs in the desired order."
+)
+RERANK_CANDIDATE_TEMPLATE = "ID: {id}, Title: {title}, Format: {format}, Score: {average_score}, Popularity: {popularity}"
+
+# Derived from the prompt text and model, so any edit to either invalidates cached rerank results.
+RERANK_PROMPT_VERSION = hashlib.sha256(
+    (RERANK_MODEL_NAME + RERANK_PROMPT_TEMPLATE + RERANK_CANDIDATE_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
+
+# Persistent rerank result cache. Set RERANK_CACHE_DB to an empty string to disable it.
+RERANK_CACHE_DB = os.environ.get("RERANK_CACHE_DB", "rerank_cache.db")
+RERANK_CACHE_TTL = float(os.environ.get("RERANK_CACHE_TTL", str(7 * 24 * 3600)))
+RERANK_CACHE_MAX_ROWS = int(os.environ.get("RERANK_CACHE_MAX_ROWS", "50000"))
+
+# Which path each rerank request took, so the rerank hit rate can be tracked against the latency SLO.
+RERANK_PATH_CACHE = "cache"
+RERANK_PATH_GEMINI = "gemini"
+RERANK_PATH_HEDGED = "gemini_hedged"
+RERANK_PATH_TIMEOUT = "fallback_timeout"
+RERANK_PATH_ERROR = "fallback_error"
+RERANK_PATH_LOCAL = "local"
+RERANK_PATH_NONE = "none"
+rerank_path_counts = {
+    RERANK_PATH_CACHE: 0,
+    RERANK_PATH_GEMINI: 0,
+    RERANK_PATH_HEDGED: 0,
+    RERANK_PATH_TIMEOUT: 0,
+    RERANK_PATH_ERROR: 0,
+    RERANK_PATH_LOCAL: 0,
+    RERANK_PATH_NONE: 0,
+}
+
+def record_rerank_path(path: str):
+    """
+    Counts a rerank that did not go through rerank_candidates_with_deadline (local or skipped).
+    """
+    rerank_path_counts[path] += 1
+
+_rerank_cache = None
+
+def get_rerank_cache():
+    """
+    Returns the process-wide rerank cache, opening it on first use (None when disabled).
+    """
+    global _rerank_cache
+    if _rerank_cache is None and RERANK_CACHE_DB:
+        _rerank_cache = RerankCache(
+            RERANK_CACHE_DB,
+            RERANK_PROMPT_VERSION,
+            ttl_seconds=RERANK_CACHE_TTL,
+            max_rows=RERANK_CACHE_MAX_ROWS,
+        )
+    return _rerank_cache
+
+def build_rerank_prompt(query: str, candidates: list) -> str:
+    candidates_text = "\n".join(RERANK_CANDIDATE_TEMPLATE.format(**candidate) for candidate in candidates)
+    return RERANK_PROMPT_TEMPLATE.format(query=query, candidates=candidates_text)
+
+def parse_rerank_response(text: str):
+    """
+    Returns the candidate IDs from a Gemini response, or None if the response is unusable.
+    """
+    try:
+        parsed = json.loads(text)
+        return [int(cid) for cid in parsed.get("candidate_ids", [])]
+    except Exception as e:
+        print("DEBUG: Error parsing Gemini re-ranking response:", e)
+        return None
+
 def rerank_candidates_with_gemini(query: str, candidates: list) -> list:
     """
     Given the user query and a list of candidate dictionaries (each containing details such as:
@@ -20,37 +102,101 @@ def rerank_candidates_with_gemini(query: str, candidates: list) -> list:
     use Gemini to re-rank the candidates.
     Returns a list of candidate IDs (as integers) in the new ranked order.
     """
-    candidate_lines = []
-    for candidate in candidates:
-        candidate_lines.append(
-            f"ID: {candidate['id']}, Title: {candidate['title']}, Format: {candidate['format']}, "
-            f"Score: {candidate['average_score']}, Popularity: {candidate['popularity']}"
-        )
-    candidates_text = "\n".join(candidate_lines)
-    
-    prompt = (
-        "You are an expert anime recommender. Given the following candidate anime details and the user query, "
-        "please re-rank the candidates so that high-quality TV series (with high average scores and popularity) "
-        "are prioritized, while penalizing formats like TV_SHORT, OVA, ONA, or SPECIAL.\n\n"
-        f"User Query: {query}\n\n"
-        "Candidates:\n"
-        f"{candidates_text}\n\n"
-        "Return your answer as valid JSON with a single key 'candidate_ids' mapping to an array of anime IDs in the desired order."
-    )
+    prompt = build_rerank_prompt(query, candidates)
 
-    model = genai.GenerativeModel(model_name="gemini-1.5-flash-8b")
+    model = genai.GenerativeModel(model_name=RERANK_MODEL_NAME)
     response = model.generate_content(
         contents=prompt
     )
-    
+
     # Debug: print raw response.
     print("DEBUG: Gemini re-ranking response text:", response.text)
-    
-    try:
-        parsed = json.loads(response.text)
-        candidate_ids = parsed.get("candidate_ids", [])
-        return [int(cid) for cid in candidate_ids]
-    except Exception as e:
-        print("DEBUG: Error parsing Gemini re-ranking response:", e)
+
+    candidate_ids = parse_rerank_response(response.text)
+    if candidate_ids is None:
         # Fallback: return candidate IDs in original order.
-        return [c["id"] for c in candidates]
\ No newline at end of file
+        return [c["id"] for c in candidates]
+    return candidate_ids
+
+async def _gemini_rerank_async(prompt: str):
+    model = genai.GenerativeModel(model_name=RERANK_MODEL_NAME)
+    response = await model.generate_content_async(contents=prompt)
+    return parse_rerank_response(response.text)
+
+async def rerank_candidates_with_deadline(query: str, candidates: list, deadline_seconds: float, hedge_after_seconds: float = None, cache=None):
+    """
+    Async Gemini re-ranking bounded by a per-request deadline.
+
+    If hedge_after_seconds is set and the first request has not answered by then,
+    a second identical request is sent and whichever answers first wins.
+    When a RerankCache is given, a cached result for the same query and candidate
+    list is returned without calling Gemini, and fresh Gemini results are stored. Cache
+    reads and writes are SQLite calls, so they run in a worker thread, off the event loop.
+
+    Returns (candidate_ids, path). candidate_ids is None when the deadline passed
+    or Gemini failed; the caller should then fall back to its local ordering.
+    """
+    candidate_ids = [c["id"] for c in candidates]
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, query, candidate_ids)
+        if cached is not None:
+            rerank_path_counts[RERANK_PATH_CACHE] += 1
+            return cached, RERANK_PATH_CACHE
+
+    prompt = build_rerank_prompt(query, candidates)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_seconds
+
+    tasks = [asyncio.ensure_future(_gemini_rerank_async(prompt))]
+    hedge = None
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                rerank_path_counts[RERANK_PATH_TIMEOUT] += 1
+                return None, RERANK_PATH_TIMEOUT
+
+            hedge_pending = hedge_after_seconds is not None and hedge is None
+            wait_for = min(remaining, hedge_after_seconds) if hedge_pending else remaining
+            done, _ = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if hedge_pending:
+                    hedge = asyncio.ensure_future(_gemini_rerank_async(prompt))
+                    tasks.append(hedge)
+                continue
+
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None and task.result():
+                    # Hedged only if the second request is the one that answered.
+                    path = RERANK_PATH_HEDGED if task is hedge else RERANK_PATH_GEMINI
+                    rerank_path_counts[path] += 1
+                    if cache is not None:
+                        await asyncio.to_thread(cache.put, query, candidate_ids, task.result())
+                    return task.result(), path
+                if task.exception() is not None:
+                    print("DEBUG: Gemini re-ranking request failed:", task.exception())
+
+            if not tasks:
+                rerank_path_counts[RERANK_PATH_ERROR] += 1
+                return None, RERANK_PATH_ERROR
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def rerank_stats() -> dict:
+    total = sum(rerank_path_counts.values())
+    reranked = (
+        rerank_path_counts[RERANK_PATH_CACHE]
+        + rerank_path_counts[RERANK_PATH_GEMINI]
+        + rerank_path_counts[RERANK_PATH_HEDGED]
+        + rerank_path_counts[RERANK_PATH_LOCAL]
+    )
+    cache = get_rerank_cache()
+    return {
+        "paths": dict(rerank_path_counts),
+        "rerank_hit_rate": round(reranked / total, 4) if total else 0.0,
+        "prompt_version": RERANK_PROMPT_VERSION,
+        "cache": cache.stats() if cache is not None else None,
+    }
@@ -0,0 +1,57 @@
+# utils/rescore.py
+import faiss
+import numpy as np
+
+class ExactRescorer:
+    """
+    Re-ranks candidates from a compressed index (SQ8, SQfp16, PQ) with exact float32 distances.
+
+    The float32 vectors are the memory-mapped embedding artifacts, so only the pages of
+    the candidates actually re-scored are read; the full-precision matrix never has to be
+    resident next to the compressed index.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, metric_type=faiss.METRIC_L2, id_mapped: bool = False):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors
+        self.higher_is_better = metric_type == faiss.METRIC_INNER_PRODUCT
+        self.id_mapped = id_mapped
+        if id_mapped:
+            self._order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._order]
+
+    def rows_for(self, labels: np.ndarray) -> np.ndarray:
+        """
+        Maps index labels to vector rows, with -1 for empty slots and unknown IDs.
+        """
+        if not self.id_mapped:
+            return np.where((labels >= 0) & (labels < len(self.ids)), labels, -1)
+        positions = np.clip(np.searchsorted(self._sorted_ids, labels), 0, max(len(self.ids) - 1, 0))
+        found = (labels >= 0) & (self._sorted_ids[positions] == labels) if len(self.ids) else np.zeros(labels.shape, bool)
+        return np.where(found, self._order[positions], -1)
+
+    def rescore(self, queries: np.ndarray, labels: np.ndarray, k: int):
+        """
+        Recomputes exact distances for each query's candidate labels and keeps the best k.
+        Returns (distances, labels), each (nq x k), in the same label space as the input.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        rows = self.rows_for(labels)
+        worst = -np.inf if self.higher_is_better else np.inf
+        distances = np.full(labels.shape, worst, dtype=np.float32)
+        for i in range(labels.shape[0]):
+            valid = np.flatnonzero(rows[i] >= 0)
+            if valid.size == 0:
+                continue
+            candidates = np.asarray(self.vectors[rows[i, valid]], dtype=np.float32)
+            if self.higher_is_better:
+                distances[i, valid] = candidates @ queries[i]
+            else:
+                diff = candidates - queries[i]
+                distances[i, valid] = np.einsum("ij,ij->i", diff, diff)
+
+        keys = -distances if self.higher_is_better else distances
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        top_distances = np.take_along_axis(distances, order, axis=1)
+        top_labels = np.take_along_axis(np.where(rows >= 0, labels, -1), order, axis=1)
+        return top_distances, top_labels
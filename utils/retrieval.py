@@ -1,36 +1,461 @@
 # utils/retrieval.py
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
+import os
+import time
 import pickle
+import resource
+import threading
 import faiss
 import numpy as np
 
+from utils.artifacts import ARTIFACT_DIR, has_artifacts, load_manifest, load_ids, load_vectors
+from utils.query_cache import QueryEmbeddingCache
+from utils.batching import QueryBatcher
+from utils.shards import SHARD_DIR, has_shards, is_id_mapped, labels_to_ids, load_sharded_index
+from utils.versions import INDEX_VERSIONS_DIR, INDEX_FILE, current_version, version_path
+from utils.reloader import IndexReloader
+from utils.rescore import ExactRescorer
+from utils.encoders import check_index_encoder, get_encoder_spec, load_encoder
+from utils.lexical import LexicalIndex, reciprocal_rank_fusion
+
+# Unversioned index and artifacts from older builds, used when INDEX_VERSIONS_DIR has no published version.
 VECTOR_DB_PATH = "anime_vectors.index"
 EMBEDDINGS_FILE = "embeddings_cache.pkl"
 
-def load_faiss_index():
-    return faiss.read_index(VECTOR_DB_PATH)
+# Query embedding cache settings. Leave QUERY_CACHE_DB empty to keep the cache in memory only.
+QUERY_CACHE_MAX_MB = float(os.environ.get("QUERY_CACHE_MAX_MB", "64"))
+QUERY_CACHE_TTL = float(os.environ["QUERY_CACHE_TTL"]) if os.environ.get("QUERY_CACHE_TTL") else None
+QUERY_CACHE_DB = os.environ.get("QUERY_CACHE_DB", "")
+QUERY_CACHE_MAX_ROWS = int(os.environ.get("QUERY_CACHE_MAX_ROWS") or 100_000)
+
+# Directory of per-shard indexes built by core/search/build_shards.py. When it contains
+# shards they are searched in parallel instead of the single VECTOR_DB_PATH index.
+FAISS_SHARD_DIR = os.environ.get("FAISS_SHARD_DIR", SHARD_DIR)
+
+# Search-time knobs for approximate indexes: IVF nprobe and HNSW efSearch. Ignored by flat indexes.
+FAISS_NPROBE = int(os.environ["FAISS_NPROBE"]) if os.environ.get("FAISS_NPROBE") else None
+FAISS_EF_SEARCH = int(os.environ["FAISS_EF_SEARCH"]) if os.environ.get("FAISS_EF_SEARCH") else None
+
+# Candidates re-ranked with exact float32 distances from the memory-mapped embedding
+# artifacts. Use with compressed indexes (sq8, sqfp16, ivf-pq) to recover their recall. 0 disables.
+FAISS_RESCORE = int(os.environ.get("FAISS_RESCORE") or 0)
+
+# How often (seconds) the API checks INDEX_VERSIONS_DIR for a newly published index. 0 disables hot reload.
+INDEX_RELOAD_INTERVAL = float(os.environ.get("INDEX_RELOAD_INTERVAL") or 10)
+
+# Micro-batching of concurrent query searches. Set QUERY_BATCH_MAX=1 to disable.
+QUERY_BATCH_MAX = int(os.environ.get("QUERY_BATCH_MAX", "32"))
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", "5"))
+
+# Hybrid retrieval: fuse FTS5 keyword results with the dense results when the keyword index
+# has been built (core/search/build_lexical_index.py). 0 searches the dense index only.
+HYBRID_SEARCH = int(os.environ.get("HYBRID_SEARCH") or 1)
+LEXICAL_DB_PATH = "anilist_global.db"
+
+def load_faiss_index(index_path=VECTOR_DB_PATH):
+    return faiss.read_index(index_path)
 
-def load_embeddings_and_ids():
-    with open(EMBEDDINGS_FILE, "rb") as f:
+def apply_search_params(index, nprobe=None, ef_search=None) -> dict:
+    """
+    Sets search-time parameters on an approximate index and returns the ones that applied.
+    nprobe only affects IVF indexes and ef_search only HNSW indexes; others are skipped.
+    """
+    applied = {}
+    space = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            space.set_index_parameter(index, name, value)
+            applied[name] = value
+        except RuntimeError:
+            pass
+    return applied
+
+def load_embeddings_and_ids(artifact_dir=ARTIFACT_DIR, embeddings_file=EMBEDDINGS_FILE):
+    """
+    Returns (ids, embeddings), memory-mapped from the artifact directory when present.
+    Falls back to the legacy pickle for trees that have not been converted yet.
+    """
+    if has_artifacts(artifact_dir):
+        return load_ids(artifact_dir), load_vectors(artifact_dir)
+    with open(embeddings_file, "rb") as f:
         data = pickle.load(f)
     return data["ids"], data["embeddings"]
 
-def retrieve_similar_anime(query: str, top_k: int = 20) -> list:
+def load_index_ids(artifact_dir=ARTIFACT_DIR, embeddings_file=EMBEDDINGS_FILE) -> np.ndarray:
+    """
+    Returns only the anime IDs aligned with the FAISS index rows.
+    """
+    if has_artifacts(artifact_dir):
+        return load_ids(artifact_dir)
+    ids, _ = load_embeddings_and_ids(artifact_dir, embeddings_file)
+    return np.asarray(ids, dtype=np.int64)
+
+def _rss_bytes() -> int:
+    """
+    Returns the current resident set size of this process in bytes.
+    Falls back to the peak RSS reported by getrusage when /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RetrievalEngine:
+    """
+    Owns everything needed to answer a semantic query: the sentence encoder,
+    the FAISS index and the mapping from index rows back to anime IDs.
+    If shard_dir holds per-shard indexes, those are loaded instead of the single index;
+    otherwise the published version under versions_dir is loaded, falling back to the
+    unversioned index_path / artifact_dir of older builds.
+
+    Loading is expensive (seconds and several hundred MB), so a single engine
+    is created at application startup and shared by every router.
+    """
+
+    def __init__(self, encoder=None, index_path=VECTOR_DB_PATH, artifact_dir=ARTIFACT_DIR, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH, shard_dir=FAISS_SHARD_DIR, versions_dir=INDEX_VERSIONS_DIR, version=None, rescore=FAISS_RESCORE):
+        self.encoder = get_encoder_spec(encoder)
+        self.model_name = self.encoder.model
+        self.index_path = index_path
+        self.artifact_dir = artifact_dir
+        self.shard_dir = shard_dir
+        self.versions_dir = versions_dir
+        self.version = version
+        self.sharded = None
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.search_params = {}
+        self.rescore = rescore
+        self.rescorer = None
+        self._vector_lookup = None
+        self.model = None
+        self.index = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.id_mapped = False
+        self.query_cache = None
+        self.load_seconds = 0.0
+        self.loaded_at = None
+        self.memory_bytes = 0
+
+    def load(self, model=None, query_cache=None):
+        """
+        Loads the encoder, index and id mapping. A model and query cache from a previous
+        engine with the same encoder can be passed in to skip reloading them on a hot swap.
+
+        Raises ValueError if the index was built with an encoder from a different embedding
+        space (see utils.encoders.check_index_encoder).
+        """
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+
+        self.model = model if model is not None else load_encoder(self.encoder.name)
+        dim = self.model.get_sentence_embedding_dimension()
+        if self.shard_dir and has_shards(self.shard_dir):
+            self.sharded = load_sharded_index(
+                self.shard_dir,
+                prepare_index=lambda index: self.search_params.update(
+                    apply_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+                ),
+                rescore=self.rescore,
+            )
+            shard = next(iter(self.sharded.shards.values()))
+            check_index_encoder(self.encoder, dim, shard.manifest, shard.index.d)
+        else:
+            if self.version is None and self.versions_dir:
+                self.version = current_version(self.versions_dir)
+            if self.version is not None:
+                # Resolve through the version name, not the "current" link, so a publish
+                # during load cannot mix files from two versions.
+                self.artifact_dir = version_path(self.version, self.versions_dir)
+                self.index_path = os.path.join(self.artifact_dir, INDEX_FILE)
+            self.index = load_faiss_index(self.index_path)
+            self.search_params = apply_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+            self.ids = load_index_ids(self.artifact_dir)
+            manifest = load_manifest(self.artifact_dir) if has_artifacts(self.artifact_dir) else None
+            check_index_encoder(self.encoder, dim, manifest, self.index.d)
+            self.id_mapped = is_id_mapped(manifest)
+            if self.index.ntotal != len(self.ids):
+                raise ValueError(
+                    f"FAISS index has {self.index.ntotal} vectors but the id mapping has {len(self.ids)} entries"
+                )
+            if self.rescore > 0:
+                if has_artifacts(self.artifact_dir):
+                    self.rescorer = ExactRescorer(self.ids, load_vectors(self.artifact_dir), self.index.metric_type, self.id_mapped)
+                else:
+                    print("DEBUG: FAISS_RESCORE needs embedding artifacts; searching without re-scoring.")
+        # Keyed by encoder name: backends of one model produce slightly different vectors.
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache(
+            self.encoder.name,
+            max_bytes=int(QUERY_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=QUERY_CACHE_TTL,
+            db_path=QUERY_CACHE_DB or None,
+            max_rows=QUERY_CACHE_MAX_ROWS,
+        )
+
+        # Whether hybrid retrieval is possible is resolved here, once per (re)load, not per request.
+        get_lexical_index().refresh()
+
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        self.memory_bytes = max(0, _rss_bytes() - rss_before)
+        return self
+
+    def _encode_uncached(self, query: str) -> np.ndarray:
+        return self.model.encode(query, convert_to_numpy=True).astype("float32")
+
+    def encode(self, query: str) -> np.ndarray:
+        if self.query_cache is None:
+            return self._encode_uncached(query)
+        return self.query_cache.get_or_compute(query, self._encode_uncached)
+
+    def encode_batch(self, queries: list) -> np.ndarray:
+        """
+        Encodes several queries with a single forward pass over the cache misses.
+        Returns a (len(queries) x dim) float32 matrix in input order.
+        """
+        vectors = [None] * len(queries)
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                vectors[i] = self.query_cache.get(query)
+
+        missing = sorted({queries[i] for i, vector in enumerate(vectors) if vector is None})
+        if missing:
+            encoded = self.model.encode(missing, batch_size=len(missing), convert_to_numpy=True).astype("float32")
+            by_query = dict(zip(missing, encoded))
+            for i, vector in enumerate(vectors):
+                if vector is None:
+                    vectors[i] = by_query[queries[i]]
+            if self.query_cache is not None:
+                for query, vector in by_query.items():
+                    self.query_cache.put(query, vector)
+
+        return np.stack(vectors).astype("float32", copy=False)
+
+    def item_vectors(self, anime_ids: list):
+        """
+        Returns the stored float32 embeddings of anime_ids (zero rows for unknown IDs), read from
+        the memory-mapped artifacts, or None if this engine has none (sharded or legacy builds).
+        """
+        if self._vector_lookup is None:
+            if self.sharded is not None or not has_artifacts(self.artifact_dir):
+                return None
+            # An ExactRescorer keyed by anime ID doubles as the ID -> artifact row lookup.
+            self._vector_lookup = self.rescorer if self.rescorer is not None and self.id_mapped else ExactRescorer(
+                self.ids, load_vectors(self.artifact_dir), id_mapped=True
+            )
+        rows = self._vector_lookup.rows_for(np.asarray(anime_ids, dtype=np.int64))
+        vectors = np.zeros((len(rows), self._vector_lookup.vectors.shape[1]), dtype=np.float32)
+        found = rows >= 0
+        vectors[found] = self._vector_lookup.vectors[rows[found]]
+        return vectors
+
+    @property
+    def reloadable(self) -> bool:
+        """
+        True if this engine serves a published index version that a newer one can replace.
+        Sharded engines are rebuilt by core/search/build_shards.py and need a restart.
+        """
+        return self.sharded is None and bool(self.versions_dir)
+
+    @property
+    def shard_names(self) -> list:
+        return self.sharded.names if self.sharded is not None else []
+
+    @property
+    def shard_key(self):
+        """
+        The global_media column the shards were split by ("type" or "format"), if recorded.
+        """
+        if self.sharded is None:
+            return None
+        shard = next(iter(self.sharded.shards.values()))
+        return shard.manifest.get("shard", {}).get("key")
+
+    def search_vectors(self, vectors: np.ndarray, k: int, shards=None) -> np.ndarray:
+        """
+        Searches the index (or the selected shards) and returns an (nq x k) array
+        of anime IDs, nearest first, with -1 for empty slots.
+        """
+        if self.sharded is not None:
+            _, labels = self.sharded.search(vectors, k, shards)
+            return labels
+        if shards:
+            raise KeyError("Shard selection requires a sharded index; this engine has a single index")
+        if self.rescorer is None:
+            _, labels = self.index.search(vectors, k)
+        else:
+            _, candidates = self.index.search(vectors, max(k, self.rescore))
+            _, labels = self.rescorer.rescore(vectors, candidates, k)
+        return labels_to_ids(labels, self.ids, self.id_mapped)
+
+    def search_batch(self, queries: list, k: int = 20, shards=None) -> list:
+        """
+        Runs one batched encode and one batched index search for all queries.
+        Returns one list of up to k anime IDs per query, nearest first.
+        shards optionally restricts the search to the named shards.
+        """
+        if not queries:
+            return []
+        labels = self.search_vectors(self.encode_batch(queries), k, shards)
+        return [[int(anime_id) for anime_id in row if anime_id >= 0] for row in labels]
+
+    def search(self, query: str, k: int = 20, shards=None) -> list:
+        """
+        Encodes the query and returns up to k anime IDs, nearest first.
+        """
+        return self.search_batch([query], k, shards)[0]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "encoder": self.encoder.name,
+            "backend": self.encoder.backend,
+            "index_path": self.index_path,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "vectors": self.sharded.ntotal if self.sharded is not None else (self.index.ntotal if self.index is not None else 0),
+            "shards": {name: shard.index.ntotal for name, shard in self.sharded.shards.items()} if self.sharded is not None else None,
+            "search_params": self.search_params,
+            "rescore": self.rescore if self.rescorer is not None or self.sharded is not None else 0,
+            "load_seconds": round(self.load_seconds, 3),
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 1),
+            "query_cache": self.query_cache.stats() if self.query_cache is not None else None,
+        }
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> RetrievalEngine:
+    """
+    Returns the process-wide engine, loading it on first use if the
+    application lifespan hook has not already done so.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine().load()
+    return _engine
+
+def set_engine(engine: RetrievalEngine):
+    """
+    Swaps the process-wide engine. Requests already holding the previous engine finish on it;
+    it is released once the last of them completes.
+    """
+    global _engine
+    _engine = engine
+
+def load_engine_version(version: str, previous: RetrievalEngine = None) -> RetrievalEngine:
+    """
+    Loads a new engine for a published index version, reusing the encoder and query cache
+    of the previous engine when it uses the same encoder.
+    """
+    engine = RetrievalEngine(shard_dir=None, version=version)
+    if previous is not None and previous.encoder.name == engine.encoder.name:
+        return engine.load(model=previous.model, query_cache=previous.query_cache)
+    return engine.load()
+
+_reloader = None
+
+def start_reloader(interval_seconds=INDEX_RELOAD_INTERVAL, versions_dir=INDEX_VERSIONS_DIR):
+    """
+    Starts the background thread that hot-swaps the engine when a new index version is published.
+    """
+    global _reloader
+    if _reloader is None and interval_seconds > 0:
+        _reloader = IndexReloader(
+            versions_dir, get_engine, set_engine, load_engine_version, interval_seconds=interval_seconds
+        ).start()
+    return _reloader
+
+def stop_reloader():
+    global _reloader
+    if _reloader is not None:
+        _reloader.stop()
+        _reloader = None
+
+def get_reloader():
+    return _reloader
+
+_batcher = None
+
+def start_batcher(max_batch=QUERY_BATCH_MAX, max_wait_ms=QUERY_BATCH_WINDOW_MS):
+    """
+    Starts the process-wide query batcher. Concurrent calls to retrieve_similar_anime
+    are then grouped into batched encode + search passes.
+    """
+    global _batcher
+    if _batcher is None and max_batch > 1:
+        _batcher = QueryBatcher(get_engine, max_batch=max_batch, max_wait_ms=max_wait_ms).start()
+    return _batcher
+
+def stop_batcher():
+    global _batcher
+    if _batcher is not None:
+        _batcher.stop()
+        _batcher = None
+
+def get_batcher():
+    return _batcher
+
+def retrieve_similar_anime(query: str, top_k: int = 20, shards=None) -> list:
     """
     Converts the query into an embedding and returns the top_k anime IDs from the FAISS index.
+    shards optionally restricts a sharded index to the named shards (e.g. ["TV", "MOVIE"]).
+    """
+    if _batcher is not None:
+        return _batcher.search(query, top_k, shards=shards)
+    return get_engine().search(query, top_k, shards)
+
+_lexical = None
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical
+    if _lexical is None:
+        _lexical = LexicalIndex(LEXICAL_DB_PATH)
+    return _lexical
+
+def hybrid_enabled() -> bool:
+    """
+    True if /query candidates come from hybrid (keyword + dense) retrieval. Availability of
+    the keyword index is cached from the last engine load (LexicalIndex.refresh), so this
+    never touches SQLite on the request path after the first call.
+    """
+    if not HYBRID_SEARCH:
+        return False
+    lexical = get_lexical_index()
+    return lexical.refresh() if lexical.is_available is None else lexical.is_available
+
+def retrieve_candidates(query: str, top_k: int = 20, shards=None):
+    """
+    Returns (anime IDs, retrieval mode). With hybrid search on, the dense top_k and the
+    BM25 keyword top_k are merged by reciprocal-rank fusion, so exact hits on titles, tags
+    or description words that the embedding misses still make the candidate pool.
+    Mode is "hybrid" or "dense".
+    """
+    return fuse_candidates(query, retrieve_similar_anime(query, top_k, shards), top_k, shards)
+
+def fuse_candidates(query: str, dense: list, top_k: int = 20, shards=None, hybrid: bool = None):
+    """
+    The keyword half of retrieve_candidates, for dense results obtained separately (e.g. by
+    awaiting the batcher from the event loop). Returns (anime IDs, retrieval mode).
+    hybrid is the hybrid_enabled() answer the caller already sized the pool with, if any.
     """
-    # Use the same model as was used to build the index.
-    model = SentenceTransformer("all-mpnet-base-v2")
-    query_embedding = model.encode(query, convert_to_numpy=True).astype("float32")
-    
-    index = load_faiss_index()
-    distances, indices = index.search(np.array([query_embedding]), top_k)
-    
-    ids, _ = load_embeddings_and_ids()
-    candidate_ids = []
-    for idx in indices[0]:
-        if idx < len(ids):
-            candidate_ids.append(ids[idx])
-    return candidate_ids
\ No newline at end of file
+    if hybrid is None:
+        hybrid = hybrid_enabled()
+    if not hybrid:
+        return dense, "dense"
+    filter_column, filter_values = None, shards
+    if shards:
+        filter_column = get_engine().shard_key
+        if filter_column is None:
+            # Shards from older builds do not record their key, so keyword hits cannot be restricted.
+            return dense, "dense"
+    elif get_engine().sharded is None:
+        # The single index holds anime only (see build_faiss_index), so keyword hits do too.
+        filter_column, filter_values = "type", ["ANIME"]
+    keyword = get_lexical_index().search(query, top_k, filter_column, filter_values)
+    return reciprocal_rank_fusion([dense, keyword], limit=top_k), "hybrid"
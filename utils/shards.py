@@ -0,0 +1,160 @@
+# utils/shards.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+
+from utils.artifacts import has_artifacts, load_manifest, load_ids, load_vectors
+from utils.rescore import ExactRescorer
+
+SHARD_DIR = "shards"
+SHARD_INDEX_FILE = "index.faiss"
+
+def merge_topk(distances: list, labels: list, k: int, higher_is_better: bool = False):
+    """
+    Merges per-shard top-k results into a global top-k.
+
+    distances / labels are lists of (nq x k_shard) arrays, one per shard, where labels
+    are already anime IDs and -1 marks an empty slot. All shards must come from the
+    same encoder and metric so their distances are directly comparable.
+
+    Returns (distances, labels), each (nq x k), best first, padded with -1 labels.
+    """
+    all_distances = np.concatenate(distances, axis=1).astype(np.float32, copy=True)
+    all_labels = np.concatenate(labels, axis=1)
+    worst = -np.inf if higher_is_better else np.inf
+    all_distances[all_labels < 0] = worst
+
+    keys = -all_distances if higher_is_better else all_distances
+    order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+    merged_distances = np.take_along_axis(all_distances, order, axis=1)
+    merged_labels = np.take_along_axis(all_labels, order, axis=1)
+
+    if merged_labels.shape[1] < k:
+        pad = k - merged_labels.shape[1]
+        merged_distances = np.pad(merged_distances, ((0, 0), (0, pad)), constant_values=worst)
+        merged_labels = np.pad(merged_labels, ((0, 0), (0, pad)), constant_values=-1)
+    return merged_distances, merged_labels
+
+def labels_to_ids(labels: np.ndarray, ids: np.ndarray, id_mapped: bool = False) -> np.ndarray:
+    """
+    Converts FAISS result labels into anime IDs with -1 for empty slots.
+    Id-mapped indexes already return anime IDs; older indexes return row positions into ids.
+    """
+    if id_mapped:
+        return labels
+    return np.where((labels >= 0) & (labels < len(ids)), ids[np.clip(labels, 0, max(len(ids) - 1, 0))], -1)
+
+def is_id_mapped(manifest: dict) -> bool:
+    """
+    True if the artifacts' manifest records an index built with anime IDs as labels.
+    """
+    return bool((manifest or {}).get("index", {}).get("id_mapped"))
+
+class Shard:
+    """
+    One FAISS index plus the anime IDs of its rows. With a rescorer, the top rescore_k
+    candidates are re-ranked by exact float32 distance before the top k are returned.
+    """
+
+    def __init__(self, name: str, index, ids: np.ndarray, manifest: dict = None, rescorer=None, rescore_k: int = 0):
+        self.name = name
+        self.index = index
+        self.ids = ids
+        self.manifest = manifest or {}
+        self.id_mapped = is_id_mapped(self.manifest)
+        self.rescorer = rescorer
+        self.rescore_k = rescore_k
+
+    def search(self, vectors: np.ndarray, k: int):
+        """
+        Returns (distances, anime_ids) with -1 for empty slots.
+        """
+        k = min(k, self.index.ntotal)
+        if k <= 0:
+            empty = np.zeros((vectors.shape[0], 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        if self.rescorer is None:
+            distances, labels = self.index.search(vectors, k)
+        else:
+            _, candidates = self.index.search(vectors, min(max(k, self.rescore_k), self.index.ntotal))
+            distances, labels = self.rescorer.rescore(vectors, candidates, k)
+        return distances, labels_to_ids(labels, self.ids, self.id_mapped)
+
+class ShardedIndex:
+    """
+    A set of per-shard FAISS indexes (one per media type or format) searched in parallel.
+    Each shard's top-k is merged into a global top-k by distance.
+    """
+
+    def __init__(self, shards: dict, max_workers: int = None):
+        if not shards:
+            raise ValueError("ShardedIndex needs at least one shard")
+        metrics = {shard.index.metric_type for shard in shards.values()}
+        dims = {shard.index.d for shard in shards.values()}
+        models = {shard.manifest.get("model") for shard in shards.values()}
+        if len(metrics) > 1 or len(dims) > 1 or len(models) > 1:
+            raise ValueError(
+                f"Shards are not comparable (metrics={metrics}, dims={dims}, models={models}); rebuild them together"
+            )
+        self.shards = shards
+        self.higher_is_better = metrics.pop() == faiss.METRIC_INNER_PRODUCT
+        self.ntotal = sum(shard.index.ntotal for shard in shards.values())
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(shards), thread_name_prefix="shard-search")
+
+    @property
+    def names(self) -> list:
+        return sorted(self.shards)
+
+    def select(self, names=None) -> list:
+        if not names:
+            return list(self.shards.values())
+        unknown = [name for name in names if name not in self.shards]
+        if unknown:
+            raise KeyError(f"Unknown shard(s): {', '.join(unknown)}. Available: {', '.join(self.names)}")
+        return [self.shards[name] for name in names]
+
+    def search(self, vectors: np.ndarray, k: int, names=None):
+        """
+        Searches the selected shards (all by default) in parallel and returns the merged
+        (distances, anime_ids), each (nq x k).
+        """
+        selected = self.select(names)
+        if len(selected) == 1:
+            results = [selected[0].search(vectors, k)]
+        else:
+            results = list(self._executor.map(lambda shard: shard.search(vectors, k), selected))
+        return merge_topk([d for d, _ in results], [l for _, l in results], k, self.higher_is_better)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+def has_shards(shard_dir=SHARD_DIR) -> bool:
+    return os.path.isdir(shard_dir) and any(
+        os.path.exists(os.path.join(shard_dir, name, SHARD_INDEX_FILE)) for name in os.listdir(shard_dir)
+    )
+
+def load_sharded_index(shard_dir=SHARD_DIR, prepare_index=None, rescore: int = 0) -> ShardedIndex:
+    """
+    Loads every shard under shard_dir/<name>/ (index.faiss + embedding artifacts).
+    prepare_index, if given, is called on each loaded index (e.g. to set nprobe).
+    rescore > 0 re-ranks that many candidates per shard with exact float32 distances.
+    """
+    shards = {}
+    for name in sorted(os.listdir(shard_dir)):
+        path = os.path.join(shard_dir, name)
+        index_path = os.path.join(path, SHARD_INDEX_FILE)
+        if not os.path.exists(index_path) or not has_artifacts(path):
+            continue
+        index = faiss.read_index(index_path)
+        if prepare_index is not None:
+            prepare_index(index)
+        ids = load_ids(path)
+        if index.ntotal != len(ids):
+            raise ValueError(f"Shard '{name}' has {index.ntotal} vectors but {len(ids)} ids")
+        manifest = load_manifest(path)
+        rescorer = None
+        if rescore > 0:
+            rescorer = ExactRescorer(ids, load_vectors(path), index.metric_type, is_id_mapped(manifest))
+        shards[name] = Shard(name, index, ids, manifest, rescorer, rescore)
+    return ShardedIndex(shards)
@@ -1,11 +1,17 @@
 # utils/titles.py
 
+def preferred_title(title_english, title_romaji, title_native):
+    """
+    The display title: English, then romaji, then native, trimmed. None if there is no title.
+    """
+    for title in (title_english, title_romaji, title_native):
+        if title and title.strip():
+            return title.strip()
+    return None
+
 def get_english_title(info: dict) -> str:
-    if info.get("title_english") and info.get("title_english").strip():
-        return info.get("title_english").strip()
-    elif info.get("title_romaji") and info.get("title_romaji").strip():
-        return info.get("title_romaji").strip()
-    elif info.get("title_native") and info.get("title_native").strip():
-        return info.get("title_native").strip()
-    else:
-        return "Unknown Title"
\ No newline at end of file
+    # display_title is materialized by db/migrate_db.py; older rows fall back to the raw titles.
+    title = info.get("display_title") or preferred_title(
+        info.get("title_english"), info.get("title_romaji"), info.get("title_native")
+    )
+    return title or "Unknown Title"
@@ -0,0 +1,106 @@
+# utils/versions.py
+"""
+Versioned, atomically published search index builds.
+
+Each build is written into its own directory and only becomes visible once complete:
+
+  index_versions/
+    20260101-120000/     index.faiss + embedding artifacts (see utils.artifacts)
+    20260102-120000/
+    current -> 20260102-120000
+
+Builders assemble a version in "<version>.staging", rename it into place and then
+repoint the "current" symlink with a single os.replace, so readers always see either
+the old or the new version and never a half-written one. The API polls the link and
+hot-swaps its engine when it changes (see utils.reloader).
+"""
+import os
+import time
+import shutil
+
+INDEX_VERSIONS_DIR = os.environ.get("INDEX_VERSIONS_DIR", "index_versions")
+INDEX_FILE = "index.faiss"
+CURRENT_LINK = "current"
+STAGING_SUFFIX = ".staging"
+
+def current_version(versions_dir=INDEX_VERSIONS_DIR):
+    """
+    Returns the name of the published version, or None if nothing has been published.
+    """
+    link = os.path.join(versions_dir, CURRENT_LINK)
+    if not os.path.islink(link):
+        return None
+    version = os.path.basename(os.readlink(link))
+    return version if os.path.isdir(os.path.join(versions_dir, version)) else None
+
+def version_path(version: str, versions_dir=INDEX_VERSIONS_DIR) -> str:
+    return os.path.join(versions_dir, version)
+
+def current_path(versions_dir=INDEX_VERSIONS_DIR):
+    """
+    Returns the directory of the published version (resolved, not via the link), or None.
+    """
+    version = current_version(versions_dir)
+    return version_path(version, versions_dir) if version else None
+
+def list_versions(versions_dir=INDEX_VERSIONS_DIR) -> list:
+    """
+    Returns the published version names, oldest first.
+    """
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        if name != CURRENT_LINK and not name.endswith(STAGING_SUFFIX)
+        and os.path.isdir(os.path.join(versions_dir, name))
+    )
+
+def new_version(versions_dir=INDEX_VERSIONS_DIR) -> str:
+    """
+    Returns an unused, sortable version name based on the current UTC time.
+    """
+    base = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    version, suffix = base, 1
+    while os.path.exists(version_path(version, versions_dir)) or os.path.exists(version_path(version, versions_dir) + STAGING_SUFFIX):
+        version, suffix = f"{base}-{suffix}", suffix + 1
+    return version
+
+def create_staging(version: str, versions_dir=INDEX_VERSIONS_DIR) -> str:
+    """
+    Creates an empty staging directory for version and returns its path.
+    """
+    path = version_path(version, versions_dir) + STAGING_SUFFIX
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+def publish_version(version: str, versions_dir=INDEX_VERSIONS_DIR, keep: int = 3) -> str:
+    """
+    Moves a completed staging directory into place, atomically points "current" at it
+    and removes all but the newest keep versions. Returns the published directory.
+    """
+    staging = version_path(version, versions_dir) + STAGING_SUFFIX
+    final = version_path(version, versions_dir)
+    os.rename(staging, final)
+
+    tmp_link = os.path.join(versions_dir, CURRENT_LINK + ".tmp")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(version, tmp_link)
+    os.replace(tmp_link, os.path.join(versions_dir, CURRENT_LINK))
+
+    prune_versions(versions_dir, keep)
+    return final
+
+def prune_versions(versions_dir=INDEX_VERSIONS_DIR, keep: int = 3) -> list:
+    """
+    Deletes the oldest versions beyond keep, never the current one. Returns the removed names.
+    A running API that still serves a pruned version keeps working: its index is in memory
+    and its memory-mapped vectors stay readable until unmapped.
+    """
+    active = current_version(versions_dir)
+    old = [version for version in list_versions(versions_dir) if version != active]
+    removed = old[:max(0, len(old) - max(keep - 1, 0))]
+    for version in removed:
+        shutil.rmtree(version_path(version, versions_dir), ignore_errors=True)
+    return removed